@@ -2,6 +2,9 @@
 from asyncio import run
 from datetime import datetime
 from functools import wraps
+from pathlib import Path
+from statistics import median
+from time import perf_counter
 from uuid import UUID
 
 import typer
@@ -40,9 +43,22 @@ def async_command(app, *args, **kwargs):
 # the library project wide
 typer.Typer.async_command = async_command
 
+from sqlmodel import delete, select
+
 from auo_project import core, crud, db, models, schemas
-from auo_project.core.file import get_and_write
-from auo_project.db.session import AsyncSession, SessionLocal, engine
+from auo_project.core.azure import private_blob_service, spool_zip_file
+from auo_project.core.chart import get_analyze_raw_charts
+from auo_project.core.config import settings
+from auo_project.core.file import get_and_write, get_and_write_batch, read_file
+from auo_project.core.measure import (
+    create_merged_measures,
+    rebuild_measure_cn_means,
+    update_measure_cn_means_by_human,
+)
+from auo_project.core.reprocess import reprocess_dir, reprocess_files
+from auo_project.core.tile import get_analyze_raw_tiles
+from auo_project.core.waveform import WAVEFORM_BIN_FIELDS, encode_waveform
+from auo_project.db.session import AsyncSession, SessionLocal, get_engine
 
 cli = typer.Typer(name="project_name API")
 
@@ -81,6 +97,15 @@ async def create_user(
     return user
 
 
+@cli.async_command()
+async def revoke_user_tokens(username: str):
+    """Revoke every access and refresh token issued to a user until now"""
+    from auo_project.core.denylist import token_denylist
+
+    await token_denylist.revoke_user_tokens(username)
+    typer.echo(f"revoked the tokens of {username}")
+
+
 @cli.async_command()
 async def rewrite_file(
     file_id: UUID,
@@ -97,6 +122,7 @@ async def rewrite_file(
 async def rewrite_file_by_measure_time(
     measure_time: datetime,
     overwrite: bool = False,
+    batch_size: int = 1,
 ):
     """Rewrite file to Database measure time greater than input"""
     db_session = SessionLocal()
@@ -105,11 +131,185 @@ async def rewrite_file_by_measure_time(
         measure_time=datetime.strptime(measure_time, "%Y-%m-%d"),
     )
     file_ids = [measure.file_id for measure in measures]
+    if batch_size > 1:
+        failed_file_ids = await get_and_write_batch(
+            db_session=db_session,
+            file_ids=file_ids,
+            overwrite=overwrite,
+            batch_size=batch_size,
+        )
+        typer.echo(
+            f"rewrite {len(file_ids) - len(failed_file_ids)} files, "
+            f"failed file ids: {failed_file_ids}",
+        )
+        return
+
     for file_id in file_ids:
         await get_and_write(db_session=db_session, file_id=file_id, overwrite=overwrite)
         typer.echo(f"rewrite file id {file_id}")
 
 
+@cli.async_command()
+async def reprocess_measure_files(
+    measure_time: datetime = typer.Option(
+        None,
+        help="Reprocess files of measures measured at or after this time.",
+    ),
+    zip_dir: Path = typer.Option(
+        None,
+        help="Reprocess local zips in this folder instead of downloading blobs.",
+    ),
+    overwrite: bool = True,
+    workers: int = typer.Option(None, help="Parser processes, default cpu count."),
+    max_pending: int = typer.Option(None, help="Parsed zips waiting for db writes."),
+    batch_size: int = 20,
+    checkpoint: Path = typer.Option(
+        None,
+        help="File of committed file ids, reused to resume an interrupted run.",
+    ),
+):
+    """Reprocess measure files in parallel, e.g. after a formula change"""
+    db_session = SessionLocal()
+    options = dict(
+        db_session=db_session,
+        overwrite=overwrite,
+        workers=workers,
+        max_pending=max_pending,
+        batch_size=batch_size,
+        checkpoint_path=checkpoint,
+    )
+    if zip_dir:
+        stats = await reprocess_dir(zip_dir=zip_dir, **options)
+    else:
+        if measure_time is None:
+            raise typer.BadParameter("either --measure-time or --zip-dir is required")
+        measures = await crud.measure_info.get_all_by_measure_time(
+            db_session=db_session,
+            measure_time=measure_time,
+        )
+        files = await crud.file.get_by_ids(
+            db_session=db_session,
+            list_ids=list(set([measure.file_id for measure in measures])),
+        )
+        jobs = [(file.id, file.location) for file in files if file.location]
+        stats = await reprocess_files(jobs=jobs, **options)
+    await db_session.close()
+    typer.echo(
+        f"reprocessed {stats['done']} files ({stats['invalid']} invalid), "
+        f"failed {stats['failed']}, skipped {stats['skipped']} by checkpoint, "
+        f"{stats['done'] / stats['seconds'] if stats['seconds'] else 0:.2f} files/s",
+    )
+    if stats["failed_file_ids"]:
+        typer.echo(f"failed file ids: {stats['failed_file_ids']}")
+
+
+@cli.async_command()
+async def backfill_raw_waveforms(
+    batch_size: int = 100,
+    compress: bool = typer.Option(
+        None,
+        help="zlib compress the arrays, default MEASURE_RAW_COMPRESS.",
+    ),
+):
+    """Fill the binary waveform columns of measure raw data from the text columns"""
+    if compress is None:
+        compress = settings.MEASURE_RAW_COMPRESS
+    db_session = SessionLocal()
+    after_id = None
+    count = 0
+    while True:
+        measure_raws = await crud.measure_raw.get_multi_without_bin(
+            db_session=db_session,
+            after_id=after_id,
+            limit=batch_size,
+        )
+        if not measure_raws:
+            break
+        for measure_raw in measure_raws:
+            for field, bin_field in WAVEFORM_BIN_FIELDS.items():
+                if getattr(measure_raw, bin_field) is None:
+                    setattr(
+                        measure_raw,
+                        bin_field,
+                        encode_waveform(getattr(measure_raw, field), compress),
+                    )
+            db_session.add(measure_raw)
+        await db_session.commit()
+        after_id = measure_raws[-1].id
+        count += len(measure_raws)
+        typer.echo(f"backfill {count} measure raw data")
+    await db_session.close()
+
+
+@cli.async_command()
+async def backfill_raw_charts(
+    batch_size: int = 100,
+    overwrite: bool = typer.Option(
+        False,
+        help="Recompute the charts of all rows, e.g. after changing the regression.",
+    ),
+):
+    """Precompute the scatter charts of measure raw data for the summary page"""
+    db_session = SessionLocal()
+    after_id = None
+    count = 0
+    while True:
+        measure_raws = await crud.measure_raw.get_multi_without_chart(
+            db_session=db_session,
+            after_id=after_id,
+            overwrite=overwrite,
+            limit=batch_size,
+        )
+        if not measure_raws:
+            break
+        for measure_raw in measure_raws:
+            measure_raw.all_sec_analyze_chart = get_analyze_raw_charts(measure_raw)
+            db_session.add(measure_raw)
+        await db_session.commit()
+        after_id = measure_raws[-1].id
+        count += len(measure_raws)
+        typer.echo(f"backfill {count} measure raw charts")
+    await db_session.close()
+
+
+@cli.async_command()
+async def backfill_raw_tiles(
+    batch_size: int = 100,
+    overwrite: bool = typer.Option(
+        False,
+        help="Rebuild the tiles of all rows, e.g. after changing the levels.",
+    ),
+):
+    """Build the analyze raw tile pyramid of measure raw data"""
+    db_session = SessionLocal()
+    after_id = None
+    count = 0
+    while True:
+        measure_raws = await crud.measure_raw.get_multi_without_tiles(
+            db_session=db_session,
+            after_id=after_id,
+            overwrite=overwrite,
+            limit=batch_size,
+        )
+        if not measure_raws:
+            break
+        for measure_raw in measure_raws:
+            await crud.measure_raw_tile.replace_all(
+                db_session=db_session,
+                measure_id=measure_raw.measure_id,
+                tiles=get_analyze_raw_tiles(
+                    measure_raw,
+                    compress=settings.MEASURE_RAW_COMPRESS,
+                ),
+                autocommit=False,
+            )
+        await db_session.commit()
+        after_id = measure_raws[-1].id
+        count += len(measure_raws)
+        typer.echo(f"backfill {count} measure raw tiles")
+    await db_session.close()
+
+
 @cli.async_command()
 async def delete_measure_related_data(
     measure_id: UUID,
@@ -117,9 +317,215 @@ async def delete_measure_related_data(
     """Delete measure info and related data"""
     db_session = SessionLocal()
     await crud.measure_info.remove(db_session=db_session, id=measure_id)
+    await crud.measure_cn_mean_aggregate.sync(
+        db_session=db_session,
+        measure_ids=[measure_id],
+    )
     typer.echo(f"delete measure info id {measure_id}")
 
 
+@cli.async_command()
+async def refresh_merged_measures(
+    full: bool = typer.Option(False, help="Build the table again from scratch."),
+):
+    """Refresh measure.merged_measures with the measures changed since last time"""
+    report = await create_merged_measures(full=full)
+    typer.echo(f"merged_measures: {report or 'refreshed by another worker'}")
+
+
+@cli.async_command()
+async def rebuild_norms(batch_size: int = 1000):
+    """
+    Count every measure again in the running aggregates of the norms and
+    write measure.overall_means from them
+    """
+    count = await rebuild_measure_cn_means(batch_size=batch_size)
+    await update_measure_cn_means_by_human()
+    typer.echo(f"norms rebuilt from {count} measures")
+
+
+@cli.async_command()
+async def benchmark_statistics_ingest(
+    file_id: UUID,
+    repeat: int = 5,
+):
+    """
+    Compare row by row and bulk upsert of statistics.csv rows of a file.
+
+    The statistics rows of the measure are deleted and written again on every
+    round, run it against a development database.
+    """
+    db_session = SessionLocal()
+    file = await crud.file.get(db_session=db_session, id=file_id)
+    if not file:
+        raise Exception(f"Not found file id: {file_id}")
+    measure_info = await crud.measure_info.get_by_file_id(
+        db_session=db_session,
+        file_id=file.id,
+    )
+    if not measure_info:
+        raise Exception(f"Not found measure of file id: {file_id}")
+
+    with spool_zip_file(private_blob_service, file.location) as zip_file:
+        result_dict = read_file(zip_file, lazy=True)
+        records = result_dict.get("statistics.csv", [])
+        result_dict.close()
+
+    async def reset():
+        await db_session.execute(
+            delete(models.MeasureStatistic).where(
+                models.MeasureStatistic.measure_id == measure_info.id,
+            ),
+        )
+        await db_session.commit()
+
+    async def write_row_by_row():
+        for record in records:
+            statistic = await crud.measure_statistic.get_by_uniq_keys(
+                db_session=db_session,
+                measure_id=measure_info.id,
+                statistic=record.statistic,
+                hand=record.hand,
+                position=record.position,
+            )
+            if not statistic:
+                statistic_in = schemas.MeasureStatisticCreate(
+                    **record.dict(),
+                    measure_id=measure_info.id,
+                )
+                await crud.measure_statistic.create(
+                    db_session=db_session,
+                    obj_in=statistic_in,
+                )
+
+    async def write_bulk():
+        await crud.measure_statistic.upsert_many(
+            db_session=db_session,
+            measure_id=measure_info.id,
+            objs_in=records,
+        )
+
+    for name, write in (("row by row", write_row_by_row), ("bulk upsert", write_bulk)):
+        durations = []
+        for _ in range(repeat):
+            await reset()
+            start = perf_counter()
+            await write()
+            durations.append(perf_counter() - start)
+        typer.echo(
+            f"{name}: {len(records)} rows, "
+            f"median {median(durations) * 1000:.1f} ms, "
+            f"min {min(durations) * 1000:.1f} ms",
+        )
+    await db_session.close()
+
+
+@cli.async_command()
+async def process_tongue_images(
+    batch_size: int = settings.TONGUE_CORRECTION_BATCH_SIZE,
+    concurrency: int = settings.TONGUE_CORRECTION_CONCURRENCY,
+):
+    """Correct the color of every unprocessed tongue upload, safe to run in parallel"""
+    from auo_project.core.color_correction import process_tongue_raw_images
+
+    processed = await process_tongue_raw_images(
+        batch_size=batch_size,
+        concurrency=concurrency,
+    )
+    typer.echo(f"corrected {processed} tongue uploads")
+
+
+@cli.async_command()
+async def backfill_image_derivatives(batch_size: int = 100):
+    """Resize the tongue images uploaded before the derivatives were generated"""
+    from auo_project.core.derivative import try_generate_image_derivatives
+
+    db_session = SessionLocal()
+    after_id = None
+    count = 0
+    while True:
+        query = select(models.MeasureTongue).order_by(models.MeasureTongue.id)
+        if after_id is not None:
+            query = query.where(models.MeasureTongue.id > after_id)
+        response = await db_session.execute(query.limit(batch_size))
+        tongues = response.scalars().all()
+        if not tongues:
+            break
+        source_locs = [
+            loc
+            for tongue in tongues
+            for loc in (tongue.up_img_uri, tongue.down_img_uri)
+            if loc
+        ]
+        existing = await crud.measure_image_derivative.get_by_source_locs(
+            db_session=db_session,
+            source_locs=source_locs,
+        )
+        await try_generate_image_derivatives(
+            db_session=db_session,
+            sources=[(loc, None) for loc in source_locs if loc not in existing],
+        )
+        after_id = tongues[-1].id
+        count += len(tongues)
+        typer.echo(f"backfill image derivatives of {count} measure tongues")
+    await db_session.close()
+
+
+@cli.async_command()
+async def backfill_statistics_wide(batch_size: int = 1000):
+    """Write measure.statistics_wide of every measure from measure.statistics"""
+    db_session = SessionLocal()
+    after_id = None
+    count = 0
+    while True:
+        query = select(models.MeasureInfo.id).order_by(models.MeasureInfo.id)
+        if after_id is not None:
+            query = query.where(models.MeasureInfo.id > after_id)
+        response = await db_session.execute(query.limit(batch_size))
+        measure_ids = response.scalars().all()
+        if not measure_ids:
+            break
+        await crud.measure_statistic_wide.refresh(
+            db_session=db_session,
+            measure_ids=measure_ids,
+        )
+        after_id = measure_ids[-1]
+        count += len(measure_ids)
+        typer.echo(f"backfill statistics wide of {count} measures")
+    await db_session.close()
+
+
+@cli.command()
+def benchmark_color_correction(
+    width: int = 4000,
+    height: int = 3000,
+    repeat: int = 5,
+):
+    """
+    Time the histogram matching of a synthetic tongue image against random
+    color cards, i.e. the per image cost of `correct_image_color`.
+    """
+    import numpy as np
+
+    from auo_project.core.color_correction import match_histograms_mod
+
+    rng = np.random.default_rng(0)
+    input_card = rng.integers(20, 230, (200, 300, 3), dtype=np.uint8)
+    reference_card = rng.integers(0, 256, (200, 300, 3), dtype=np.uint8)
+    full_image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    durations = []
+    for _ in range(repeat):
+        start = perf_counter()
+        match_histograms_mod(input_card, reference_card, full_image)
+        durations.append(perf_counter() - start)
+    typer.echo(
+        f"match_histograms_mod: {width}x{height}, "
+        f"median {median(durations) * 1000:.1f} ms, "
+        f"min {min(durations) * 1000:.1f} ms",
+    )
+
+
 @cli.command()
 def shell():  # pragma: no cover
     """Opens an interactive shell with objects auto imported"""
@@ -131,7 +537,7 @@ def shell():  # pragma: no cover
         "models": models,
         "schemas": schemas,
         "settings": core.config.settings,
-        "engine": engine,
+        "get_engine": get_engine,
         "AsyncSession": AsyncSession,
         "SessionLocal": SessionLocal,
         "create_user": create_user,
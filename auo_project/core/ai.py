@@ -1,17 +1,15 @@
-import requests
-from datetime import datetime, timedelta
-from auo_project import schemas
-import time
-import requests
 from io import BytesIO
-import io
 
-def get_color_card_result(raw_image) -> BytesIO:
-    api_endpoint = "https://auoyourator-tongue-color-correction-a0haf3fbcdekhue4.southeastasia-01.azurewebsites.net/api/color_transformation"
+from auo_project import schemas
+from auo_project.core.config import settings
+from auo_project.core.http import color_card_service, tongue_ai_service
+
+
+async def get_color_card_result(raw_image) -> BytesIO:
     raw_image.seek(0)
     files = {"raw_image": raw_image}
-    response = requests.post(
-        api_endpoint, files=files, params={"method": "lab_v2"},
+    response = await color_card_service.post(
+        "/api/color_transformation", files=files, params={"method": "lab_v2"},
     )
     if response.status_code == 200:
         print(f"status_code: {response.status_code}")
@@ -23,30 +21,23 @@ def get_color_card_result(raw_image) -> BytesIO:
         return None
 
 
-def get_ai_tongue_result(masked_file) -> dict:
-    api_endpoint = "https://auoyourator-tongue-inspection.azurewebsites.net/api/v2.0"
+async def get_ai_tongue_result(masked_file) -> dict:
     masked_file.seek(0)
     files = {
         "input_image": masked_file,
     }
-    task_id = (
-        requests.post(f"{api_endpoint}/upload/", files=files, timeout=120)
-        .json()
-        .get("task_id")
-    )
+    response = await tongue_ai_service.post("/upload/", files=files)
+    task_id = response.json().get("task_id")
     print(f"task_id: {task_id}")
 
     synptom_result = None
-    wait_time = 30
     if task_id:
-        start_time = datetime.utcnow()
-        while datetime.utcnow() - start_time < timedelta(seconds=wait_time):
-            response = requests.get(f"{api_endpoint}/results/{task_id}", timeout=5)
-            print("response: ", response.json())
-            if response.status_code == 200:
-                synptom_result = process_tongue_symptoms(data=response.json())
-                break
-            time.sleep(5)
+        response = await tongue_ai_service.poll(
+            f"/results/{task_id}",
+            timeout=settings.TONGUE_AI_RESULT_TIMEOUT,
+        )
+        if response is not None:
+            synptom_result = process_tongue_symptoms(data=response.json())
 
     print("synptom_result", synptom_result)
     return synptom_result
@@ -1,13 +1,29 @@
-from azure.storage.blob import BlobServiceClient
+from datetime import datetime, timedelta
+from tempfile import SpooledTemporaryFile
+
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobSasPermissions, BlobServiceClient, generate_blob_sas
+from requests.adapters import HTTPAdapter
 
 from auo_project.core.config import settings
 
+
+def get_transport() -> RequestsTransport:
+    # keep a connection alive per core.blob thread instead of the default 10
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=settings.BLOB_MAX_WORKERS)
+    session.mount("https://", adapter)
+    return RequestsTransport(session=session, session_owner=False)
+
+
 private_blob_service = BlobServiceClient(
     account_url=f"https://{settings.AZURE_STORAGE_ACCOUNT}.blob.core.windows.net",
     credential={
         "account_name": settings.AZURE_STORAGE_ACCOUNT,
         "account_key": settings.AZURE_STORAGE_KEY,
     },
+    transport=get_transport(),
 )
 
 internet_blob_service = BlobServiceClient(
@@ -16,9 +32,24 @@ internet_blob_service = BlobServiceClient(
         "account_name": settings.AZURE_STORAGE_ACCOUNT_INTERNET,
         "account_key": settings.AZURE_STORAGE_KEY_INTERNET,
     },
+    transport=get_transport(),
 )
 
 
+def get_internet_image_url(file_path: str, minutes: int = 15) -> str:
+    """read only SAS url of a blob of the internet image container"""
+    container_name = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
+    sas_token = generate_blob_sas(
+        account_name=settings.AZURE_STORAGE_ACCOUNT_INTERNET,
+        container_name=container_name,
+        blob_name=file_path,
+        account_key=settings.AZURE_STORAGE_KEY_INTERNET,
+        permission=BlobSasPermissions(read=True),
+        expiry=datetime.utcnow() + timedelta(minutes=minutes),
+    )
+    return f"https://{settings.AZURE_STORAGE_ACCOUNT_INTERNET}.blob.core.windows.net/{container_name}/{file_path}?{sas_token}"
+
+
 def upload_blob_file(
     blob_service_client: BlobServiceClient,
     category,
@@ -42,6 +73,35 @@ def download_zip_file(blob_service_client, file_path):
     return blob_client.download_blob()
 
 
+class SeekableSpooledTemporaryFile(SpooledTemporaryFile):
+    # ZipFile reads need `seekable()`, which SpooledTemporaryFile only has since 3.11
+    def seekable(self):
+        return True
+
+
+def spool_zip_file(
+    blob_service_client: BlobServiceClient,
+    file_path,
+    max_size: int = settings.MEASURE_ZIP_SPOOL_MAX_SIZE,
+) -> SeekableSpooledTemporaryFile:
+    """
+    Stream a raw zip blob chunk by chunk into a spooled temp file.
+
+    At most `max_size` bytes are kept in memory, larger zips spill to disk.
+    The caller owns the returned file and should close it.
+    """
+    spooled_file = SeekableSpooledTemporaryFile(max_size=max_size)
+    try:
+        downloader = download_zip_file(blob_service_client, file_path)
+        for chunk in downloader.chunks():
+            spooled_file.write(chunk)
+        spooled_file.seek(0)
+    except Exception:
+        spooled_file.close()
+        raise
+    return spooled_file
+
+
 def download_file(
     blob_service_client: BlobServiceClient,
     category,
@@ -0,0 +1,274 @@
+"""
+Async facade over blob storage.
+
+`BlobStore` runs the blocking calls of a backend in a bounded thread pool,
+shared by the process, so a blob transfer no longer blocks the event loop.
+The azure backend reuses the `BlobServiceClient`s of `core.azure`, whose
+http session keeps up to BLOB_MAX_WORKERS connections alive.
+
+The local backend stores `<BLOB_LOCAL_ROOT>/<container>/<path>` files, set
+BLOB_BACKEND=local to run without azure, e.g. in tests or offline.
+
+Every call is timed in `BlobStore.metrics`.
+"""
+import asyncio
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from azure.storage.blob import BlobServiceClient
+
+from auo_project.core.azure import internet_blob_service, private_blob_service
+from auo_project.core.config import settings
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BLOB_MAX_WORKERS,
+            thread_name_prefix="blob",
+        )
+    return _executor
+
+
+def to_bytes(data: Any) -> bytes:
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    if isinstance(data, BytesIO):
+        return data.getvalue()
+    if hasattr(data, "read"):
+        return data.read()
+    return bytes(data)
+
+
+class BlobMetrics:
+    """count, seconds and bytes per operation, plus the last call"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats: Dict[str, Dict[str, float]] = {}
+            self.last: Dict[str, Any] = {}
+
+    def record(self, op: str, path: str, seconds: float, size: int = 0):
+        with self._lock:
+            stat = self.stats.setdefault(
+                op,
+                {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0},
+            )
+            stat["count"] += 1
+            stat["seconds"] += seconds
+            stat["max_seconds"] = max(stat["max_seconds"], seconds)
+            stat["bytes"] += size
+            self.last = {"op": op, "path": path, "seconds": seconds, "bytes": size}
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {op: dict(stat) for op, stat in self.stats.items()}
+
+
+class AzureBlobBackend:
+    def __init__(self, blob_service_client: BlobServiceClient):
+        self.blob_service_client = blob_service_client
+
+    def get_blob_client(self, container: str, path: str):
+        return self.blob_service_client.get_blob_client(
+            container=container,
+            blob=str(path),
+        )
+
+    def upload(self, container: str, path: str, data: Any, overwrite: bool = True):
+        self.get_blob_client(container, path).upload_blob(data, overwrite=overwrite)
+
+    def download(self, container: str, path: str) -> bytes:
+        return self.get_blob_client(container, path).download_blob().readall()
+
+    def exists(self, container: str, path: str) -> bool:
+        return self.get_blob_client(container, path).exists()
+
+    def delete(self, container: str, path: str):
+        self.get_blob_client(container, path).delete_blob()
+
+    def copy(
+        self,
+        source_container: str,
+        source_path: str,
+        container: str,
+        path: str,
+        timeout: float = 60,
+    ):
+        """server side copy, waits until the copy is done"""
+        source_url = self.get_blob_client(source_container, source_path).url
+        blob_client = self.get_blob_client(container, path)
+        copy = blob_client.start_copy_from_url(source_url)
+        status = copy["copy_status"]
+        deadline = time.monotonic() + timeout
+        while status == "pending":
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"copy {source_url} to {path} timeout")
+            time.sleep(0.2)
+            status = blob_client.get_blob_properties().copy.status
+        if status != "success":
+            raise Exception(f"copy {source_url} to {path} {status}")
+
+
+class LocalBlobBackend:
+    def __init__(self, root: str, account: str):
+        self.root = Path(root) / account
+
+    def get_path(self, container: str, path: str) -> Path:
+        file_path = (self.root / container / str(path)).resolve()
+        if self.root.resolve() not in file_path.parents:
+            raise ValueError(f"invalid blob path: {path}")
+        return file_path
+
+    def upload(self, container: str, path: str, data: Any, overwrite: bool = True):
+        file_path = self.get_path(container, path)
+        if file_path.exists() and not overwrite:
+            raise FileExistsError(f"blob exists: {container}/{path}")
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(to_bytes(data))
+
+    def download(self, container: str, path: str) -> bytes:
+        return self.get_path(container, path).read_bytes()
+
+    def exists(self, container: str, path: str) -> bool:
+        return self.get_path(container, path).exists()
+
+    def delete(self, container: str, path: str):
+        self.get_path(container, path).unlink()
+
+    def copy(
+        self,
+        source_container: str,
+        source_path: str,
+        container: str,
+        path: str,
+        timeout: float = 60,
+    ):
+        file_path = self.get_path(container, path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self.get_path(source_container, source_path), file_path)
+
+
+class BlobStore:
+    def __init__(self, backend, max_concurrency: int = settings.BLOB_MAX_WORKERS):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.metrics = BlobMetrics()
+
+    async def _run(self, op: str, path: str, call, size: int = 0):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        result = await loop.run_in_executor(get_executor(), call)
+        if isinstance(result, bytes):
+            size = len(result)
+        self.metrics.record(op, str(path), time.perf_counter() - start, size)
+        return result
+
+    async def upload(
+        self,
+        container: str,
+        path: str,
+        data: Any,
+        overwrite: bool = True,
+    ) -> str:
+        if isinstance(data, BytesIO):
+            data = data.getvalue()
+        await self._run(
+            "upload",
+            path,
+            partial(self.backend.upload, container, path, data, overwrite=overwrite),
+            size=len(data) if isinstance(data, bytes) else 0,
+        )
+        return path
+
+    async def download(self, container: str, path: str) -> bytes:
+        return await self._run(
+            "download",
+            path,
+            partial(self.backend.download, container, path),
+        )
+
+    async def exists(self, container: str, path: str) -> bool:
+        return await self._run(
+            "exists",
+            path,
+            partial(self.backend.exists, container, path),
+        )
+
+    async def delete(self, container: str, path: str):
+        await self._run("delete", path, partial(self.backend.delete, container, path))
+
+    async def copy(
+        self,
+        source_container: str,
+        source_path: str,
+        container: str,
+        path: str,
+    ):
+        await self._run(
+            "copy",
+            path,
+            partial(
+                self.backend.copy,
+                source_container,
+                source_path,
+                container,
+                path,
+            ),
+        )
+
+    async def _gather(self, coroutines: Iterable) -> List[Any]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*[bounded(coroutine) for coroutine in coroutines])
+
+    async def upload_many(
+        self,
+        items: Iterable[Tuple[str, str, Any]],
+        overwrite: bool = True,
+    ) -> List[str]:
+        """upload (container, path, data) items concurrently"""
+        return await self._gather(
+            self.upload(container, path, data, overwrite=overwrite)
+            for container, path, data in items
+        )
+
+    async def download_many(self, items: Iterable[Tuple[str, str]]) -> List[bytes]:
+        """download (container, path) items concurrently, in the same order"""
+        return await self._gather(
+            self.download(container, path) for container, path in items
+        )
+
+    async def delete_many(self, items: Iterable[Tuple[str, str]]):
+        await self._gather(self.delete(container, path) for container, path in items)
+
+
+def get_blob_store(blob_service_client: BlobServiceClient, account: str) -> BlobStore:
+    if settings.BLOB_BACKEND == "local":
+        return BlobStore(
+            LocalBlobBackend(root=settings.BLOB_LOCAL_ROOT, account=account),
+        )
+    return BlobStore(AzureBlobBackend(blob_service_client))
+
+
+private_blob_store = get_blob_store(private_blob_service, "private")
+internet_blob_store = get_blob_store(internet_blob_service, "internet")
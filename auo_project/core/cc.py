@@ -1,95 +1,62 @@
+import asyncio
 import hashlib
 from datetime import datetime
 from io import BytesIO
 from pathlib import Path
 from uuid import UUID
 
-import requests
-from PIL import Image
-
 from auo_project import crud, schemas
 from auo_project.core.ai import get_ai_tongue_result, get_color_card_result
-from auo_project.core.utils import convert_jpg_to_png
-from auo_project.core.azure import (
-    download_file,
-    internet_blob_service,
-    upload_blob_file,
-)
+from auo_project.core.blob import internet_blob_store
 from auo_project.core.config import settings
+from auo_project.core.http import tongue_cc_service
+from auo_project.core.image import load_image
 from auo_project.core.constants import TongueCCStatus
+from auo_project.core.derivative import try_generate_image_derivatives
 from auo_project.core.tongue import get_tongue_summary
 from auo_project.db.session import SessionLocal
 
 
-def get_wb(tongue_file):
-    url = "http://host.docker.internal:8881/api/convert_wb"
+async def post_tongue_file(name: str, url: str, tongue_file, data=None) -> BytesIO:
     files = {"tongue_file": tongue_file}
 
-    print("sending request...")
-    response = requests.post(url, files=files, timeout=120)
+    print(f"sending request to {url}, payload {data}")
+    response = await tongue_cc_service.post(url, data=data, files=files)
     print("get result")
     if response.status_code != 200:
-        raise Exception("get_wb error", response.text)
+        raise Exception(f"{name} error", response.text)
     print("content length", len(response.content))
     output_file = BytesIO(response.content)
     output_file.seek(0)
     return output_file
 
 
-def get_tune(contrast, brightness, gamma, tongue_file):
-    url = "http://host.docker.internal:8881/api/convert_tune"
+async def get_wb(tongue_file):
+    return await post_tongue_file("get_wb", "/api/convert_wb", tongue_file)
+
+
+async def get_tune(contrast, brightness, gamma, tongue_file):
     data = {
         "contrast": contrast,
         "brightness": brightness,
         "gamma": gamma,
     }
     tongue_file.seek(0)
-    files = {"tongue_file": tongue_file}
-
-    print(f"sending request, payload {data}")
-    response = requests.post(url, data=data, files=files, timeout=120)
-    print("get result")
-    if response.status_code != 200:
-        raise Exception("get_tune error", response.text)
-    print("content length", len(response.content))
-    output_file = BytesIO(response.content)
-    output_file.seek(0)
-    return output_file
+    return await post_tongue_file("get_tune", "/api/convert_tune", tongue_file, data)
 
 
-def get_crop(tongue_file):
-    url = "http://host.docker.internal:8881/api/convert_crop"
+async def get_crop(tongue_file):
     tongue_file.seek(0)
-    files = {"tongue_file": tongue_file}
+    return await post_tongue_file("get_crop", "/api/convert_crop", tongue_file)
 
-    print("sending request to /api/convert_crop")
-    response = requests.post(url, files=files, timeout=120)
-    if response.status_code != 200:
-        raise Exception("get_crop error", response.text)
-    print(f"content length: {len(response.content)}")
-    output_file = BytesIO(response.content)
-    output_file.seek(0)
-    return output_file
 
-
-def get_cc(contrast, brightness, gamma, tongue_file):
-    url = "http://host.docker.internal:8881/api/convert"
+async def get_cc(contrast, brightness, gamma, tongue_file):
     data = {
         "contrast": contrast,
         "brightness": brightness,
         "gamma": gamma,
     }
-    files = {"tongue_file": tongue_file}
-
-    print("sending request...")
-    response = requests.post(url, data=data, files=files, timeout=120)
-    print("get result")
-    if response.status_code != 200:
-        raise Exception("get_cc error", response.text)
-    print("content length", len(response.content))
-    output_file = BytesIO(response.content)
-    output_file.seek(0)
-    return output_file
+    return await post_tongue_file("get_cc", "/api/convert", tongue_file, data)
 
 
 async def generate_tongue_wb_image(front_or_back: str, config_id: UUID) -> str:
@@ -103,24 +70,15 @@ async def generate_tongue_wb_image(front_or_back: str, config_id: UUID) -> str:
     tongue_file_path = Path(getattr(cc_config, image_column_name))
 
     category = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-    image_downloader = download_file(
-        blob_service_client=internet_blob_service,
-        category=category,
-        file_path=str(tongue_file_path),
+    original_image = BytesIO(
+        await internet_blob_store.download(category, str(tongue_file_path)),
     )
-    original_image = BytesIO(image_downloader.readall())
-    wb_image = get_wb(original_image)
+    wb_image = await get_wb(original_image)
     wb_file_path = Path(
         f"tongue_config/{cc_config.org_id}/{cc_config.id}/{tongue_file_path.stem}_WB{tongue_file_path.suffix}",
     )
 
-    upload_blob_file(
-        blob_service_client=internet_blob_service,
-        category=category,
-        file_path=wb_file_path,
-        object=wb_image,
-        overwrite=True,
-    )
+    await internet_blob_store.upload(category, str(wb_file_path), wb_image)
     end_time = datetime.utcnow()
     print(f"generate_tongue_wb_image done in {end_time - start_time}")
     return "done"
@@ -162,12 +120,10 @@ async def generate_tongue_cc_image(front_or_back: str, config_id: UUID) -> str:
     )
 
     print(f"download original image: {image_column_name}")
-    original_image_downloader = download_file(
-        blob_service_client=internet_blob_service,
-        category=settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE,
-        file_path=str(tongue_file_path),
+    original_image = await internet_blob_store.download(
+        settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE,
+        str(tongue_file_path),
     )
-    original_image = BytesIO(original_image_downloader.readall())
 
     # generate md5 hash by config_id and input_payload
     color_hash = hashlib.md5(
@@ -176,15 +132,13 @@ async def generate_tongue_cc_image(front_or_back: str, config_id: UUID) -> str:
 
     category = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
     preview_cc_image_file_path = f"tongue_config/{cc_config.org_id}/{cc_config.id}/preview_cc_{color_hash}{tongue_file_path.suffix}"
-    preview_blob_client = internet_blob_service.get_blob_client(
-        container=category,
-        blob=preview_cc_image_file_path,
-    )
-    if preview_blob_client.exists():
-        cc_image = BytesIO(preview_blob_client.download_blob().readall())
+    if await internet_blob_store.exists(category, preview_cc_image_file_path):
+        cc_image = BytesIO(
+            await internet_blob_store.download(category, preview_cc_image_file_path),
+        )
     else:
-        png_image= convert_jpg_to_png(file=original_image)
-        cc_image = get_color_card_result(raw_image=png_image)
+        png_image = (await load_image(original_image)).png_file()
+        cc_image = await get_color_card_result(raw_image=png_image)
         # cc_image = get_tune(
         #     contrast=fake_payload.contrast,
         #     brightness=fake_payload.brightness,
@@ -195,12 +149,10 @@ async def generate_tongue_cc_image(front_or_back: str, config_id: UUID) -> str:
     # upload cc image to azure storage
     cc_image_file_path = f"tongue_config/{cc_config.org_id}/{cc_config.id}/{tongue_file_path.stem}_cc{tongue_file_path.suffix}"
 
-    upload_blob_file(
-        blob_service_client=internet_blob_service,
-        category=settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE,
-        file_path=cc_image_file_path,
-        object=cc_image,
-        overwrite=True,
+    await internet_blob_store.upload(
+        settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE,
+        cc_image_file_path,
+        cc_image,
     )
 
     obj_in = schemas.TongueCCConfigUpdate(
@@ -244,25 +196,25 @@ async def process_tongue_image(tongue_upload_id: UUID) -> str:
     tongue_back_original_loc = Path(tongue_upload.tongue_back_original_loc)
 
     category = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-    image_downloader = download_file(
-        blob_service_client=internet_blob_service,
-        category=category,
-        file_path=str(tongue_front_original_loc),
+    front_tongue_bytes, back_tongue_bytes = await internet_blob_store.download_many(
+        [
+            (category, str(tongue_front_original_loc)),
+            (category, str(tongue_back_original_loc)),
+        ],
     )
-    front_tongue_file = BytesIO(image_downloader.readall())
-
-    image_downloader = download_file(
-        blob_service_client=internet_blob_service,
-        category=category,
-        file_path=str(tongue_back_original_loc),
+    # decoded and PNG encoded once, the PNG is what the services receive
+    front_image, back_image = await asyncio.gather(
+        load_image(front_tongue_bytes),
+        load_image(back_tongue_bytes),
     )
-    back_tongue_file = BytesIO(image_downloader.readall())
-
-    png_front_image = convert_jpg_to_png(file=front_tongue_file)
-    png_back_image = convert_jpg_to_png(file=back_tongue_file)
+    print(f"tongue image format: {front_image.format}, {back_image.format}")
+    png_front_image = front_image.png_file()
+    png_back_image = back_image.png_file()
     print("get_color_card_result start")
-    color_transform_front_image = get_color_card_result(raw_image=png_front_image)
-    color_transform_back_image = get_color_card_result(raw_image=png_back_image)
+    color_transform_front_image, color_transform_back_image = await asyncio.gather(
+        get_color_card_result(raw_image=png_front_image),
+        get_color_card_result(raw_image=png_back_image),
+    )
     print("get_color_card_result end")
 
     cc_front_image = color_transform_front_image or png_front_image
@@ -271,24 +223,15 @@ async def process_tongue_image(tongue_upload_id: UUID) -> str:
     cc_front_file_path = f"{tongue_front_original_loc.parent}/{tongue_front_original_loc.stem}_cc.png" if color_transform_front_image else None
     cc_back_file_path = f"{tongue_back_original_loc.parent}/{tongue_back_original_loc.stem}_cc.png" if color_transform_back_image else None
 
+    uploads = []
     if color_transform_front_image:
-        upload_blob_file(
-            blob_service_client=internet_blob_service,
-            category=category,
-            file_path=cc_front_file_path,
-            object=color_transform_front_image,
-            overwrite=True,
-        )
-        print(f"saved cc_front_image {cc_front_file_path}")
+        uploads.append((cc_front_file_path, color_transform_front_image))
     if color_transform_back_image:
-        upload_blob_file(
-            blob_service_client=internet_blob_service,
-            category=category,
-            file_path=cc_back_file_path,
-            object=cc_back_image,
-            overwrite=True,
-        )
-        print(f"saved cc_back_image {cc_back_file_path}")
+        uploads.append((cc_back_file_path, cc_back_image))
+    for file_path in await internet_blob_store.upload_many(
+        [(category, path, image) for path, image in uploads],
+    ):
+        print(f"saved cc image {file_path}")
 
     obj_in = schemas.MeasureTongueUploadUpdate(
         tongue_front_corrected_loc=cc_front_file_path,
@@ -300,17 +243,23 @@ async def process_tongue_image(tongue_upload_id: UUID) -> str:
         obj_new=obj_in.dict(exclude_none=True),
     )
 
-    cc_front_image.seek(0)
+    await try_generate_image_derivatives(
+        db_session=db_session,
+        sources=[
+            (str(tongue_front_original_loc), front_tongue_bytes),
+            (str(tongue_back_original_loc), back_tongue_bytes),
+            *[(path, image.getvalue()) for path, image in uploads],
+        ],
+    )
 
-    print(f"cc_front_image format: {Image.open(cc_front_image, mode='r').format}")
     print(f"cc_front_image size: {cc_front_image.getbuffer().nbytes}")
     front_synptom = None
     try:
         cc_front_image.seek(0)
         # cc_front_image = convert_jpg_to_png(file=cc_front_image)
-        crop_front_file = get_crop(tongue_file=cc_front_image)
+        crop_front_file = await get_crop(tongue_file=cc_front_image)
         print(f"crop_front_file size: {crop_front_file.getbuffer().nbytes}")
-        front_synptom = get_ai_tongue_result(
+        front_synptom = await get_ai_tongue_result(
             masked_file=crop_front_file,
         )
 
@@ -374,24 +323,19 @@ async def process_tongue_image_old(measure_id: UUID) -> str:
     tongue_back_original_loc = Path(tongue.down_img_uri)
 
     category = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-    image_downloader = download_file(
-        blob_service_client=internet_blob_service,
-        category=category,
-        file_path=str(tongue_front_original_loc),
+    front_image = await load_image(
+        await internet_blob_store.download(category, str(tongue_front_original_loc)),
     )
-    front_tongue_file = BytesIO(image_downloader.readall())
-    png_front_image = convert_jpg_to_png(file=front_tongue_file)
-    color_transform_front_image = get_color_card_result(raw_image=png_front_image)
+    png_front_image = front_image.png_file()
+    color_transform_front_image = await get_color_card_result(raw_image=png_front_image)
     if color_transform_front_image is None:
         color_transform_front_image = png_front_image
     else:
         tongue_front_cc_loc = f"{tongue_front_original_loc.parent}/{tongue_front_original_loc.stem}_cc.png"
-        upload_blob_file(
-            blob_service_client=internet_blob_service,
-            category=category,
-            file_path=tongue_front_cc_loc,
-            object=color_transform_front_image,
-            overwrite=True,
+        await internet_blob_store.upload(
+            category,
+            tongue_front_cc_loc,
+            color_transform_front_image,
         )
         await crud.measure_tongue.update(
             db_session=db_session,
@@ -401,22 +345,17 @@ async def process_tongue_image_old(measure_id: UUID) -> str:
             ),
         )
 
-    image_downloader = download_file(
-        blob_service_client=internet_blob_service,
-        category=category,
-        file_path=str(tongue_back_original_loc),
+    back_image = await load_image(
+        await internet_blob_store.download(category, str(tongue_back_original_loc)),
     )
-    back_tongue_file = BytesIO(image_downloader.readall())
-    png_front_image = convert_jpg_to_png(file=back_tongue_file)
-    color_transform_back_image = get_color_card_result(raw_image=png_front_image)
+    png_front_image = back_image.png_file()
+    color_transform_back_image = await get_color_card_result(raw_image=png_front_image)
     if color_transform_back_image:
         tongue_back_cc_loc = f"{tongue_back_original_loc.parent}/{tongue_back_original_loc.stem}_cc.png"
-        upload_blob_file(
-            blob_service_client=internet_blob_service,
-            category=category,
-            file_path=tongue_back_cc_loc,
-            object=color_transform_back_image,
-            overwrite=True,
+        await internet_blob_store.upload(
+            category,
+            tongue_back_cc_loc,
+            color_transform_back_image,
         )
         await crud.measure_tongue.update(
             db_session=db_session,
@@ -429,9 +368,9 @@ async def process_tongue_image_old(measure_id: UUID) -> str:
     front_synptom = None
     try:
         color_transform_front_image.seek(0)
-        crop_front_file = get_crop(tongue_file=color_transform_front_image)
+        crop_front_file = await get_crop(tongue_file=color_transform_front_image)
         print(f"crop_front_file size: {crop_front_file.getbuffer().nbytes}")
-        front_synptom = get_ai_tongue_result(
+        front_synptom = await get_ai_tongue_result(
             masked_file=crop_front_file,
         )
 
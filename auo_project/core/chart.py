@@ -1,12 +1,26 @@
 from math import ceil, floor
 from random import randint, uniform
 from statistics import mean, quantiles, stdev
+from typing import Dict, Optional
 
 import numpy as np
 import pydash as py_
 from fastapi import HTTPException
+from numpy.polynomial.polynomial import Polynomial
 
 from auo_project.core.utils import is_disease_match, normalize_parameter_name
+from auo_project.core.waveform import get_waveform, parse_waveform_text
+
+# chart key -> measure.raw_data analyze raw column
+ANALYZE_RAW_CHART_FIELDS = {
+    "l_cu": "all_sec_analyze_raw_l_cu",
+    "l_qu": "all_sec_analyze_raw_l_qu",
+    "l_ch": "all_sec_analyze_raw_l_ch",
+    "r_cu": "all_sec_analyze_raw_r_cu",
+    "r_qu": "all_sec_analyze_raw_r_qu",
+    "r_ch": "all_sec_analyze_raw_r_ch",
+}
+ANALYZE_RAW_NAMES = ("amp", "depth", "slope", "static")
 
 
 def get_data_range():
@@ -374,3 +388,83 @@ def get_chart_type3_data(x_options, six_pulse, statistics, z, z_options, sdata):
         "data": {"labels": labels, "datasets": new_data},
         "data_range": data_range,
     }
+
+
+def get_poly_points(x, y, degree, step):
+    if x.shape[0] == 0 or y.shape[0] == 0:
+        return []
+    p = Polynomial.fit(x, y, deg=degree)
+    points = [
+        [round(i, 1), round(p(i), 1)]
+        for i in range(int(x[0]), int(x[-1]) + 1, step)
+        if round(i, 1) >= 0
+    ]
+    return points
+
+
+def get_scatter_chart(data: Optional[np.ndarray]):
+    """
+    static-amp and depth-amp scatter charts of an analyze raw channel, with
+    their degree 7 regression curves.
+
+    Returned as plain dicts of `ScatterChart` fields, so that they can be
+    stored in measure.raw_data.all_sec_analyze_chart.
+    """
+    static_amp = {"chart_type": "scatter", "x_field": "static", "y_field": "amp"}
+    depth_amp = {"chart_type": "scatter", "x_field": "depth", "y_field": "amp"}
+    if data is None or not len(data) or data.shape[1] < len(ANALYZE_RAW_NAMES):
+        return {
+            "static_amp": {**static_amp, "data": [], "regression_points": []},
+            "depth_amp": {**depth_amp, "data": [], "regression_points": []},
+        }
+
+    data = np.asarray(data[:, : len(ANALYZE_RAW_NAMES)], dtype=np.float64)
+    data = data[~np.isnan(data).any(axis=1)]
+    amp, depth, _, static = data.T
+    depth = depth / 0.2
+    amp_list = amp.tolist()
+
+    return {
+        "static_amp": {
+            **static_amp,
+            "data": [
+                {"static": x, "amp": y} for x, y in zip(static.tolist(), amp_list)
+            ],
+            "regression_points": get_poly_points(x=static, y=amp, degree=7, step=2),
+        },
+        "depth_amp": {
+            **depth_amp,
+            "data": [{"depth": x, "amp": y} for x, y in zip(depth.tolist(), amp_list)],
+            "regression_points": get_poly_points(x=depth, y=amp, degree=7, step=1),
+        },
+    }
+
+
+def get_chart_waveform(measure_raw, field: str) -> Optional[np.ndarray]:
+    """
+    An analyze raw channel of a MeasureRaw (or row) for the charts, parsed
+    from the text column while it is still written, the binary column only
+    keeps float32
+    """
+    content = getattr(measure_raw, field, None)
+    if content:
+        return parse_waveform_text(content, np.float64)
+    return get_waveform(measure_raw, field)
+
+
+def get_scatter_charts(waveforms: Dict[str, Optional[np.ndarray]]):
+    """scatter charts of the six analyze raw channels, by measure.raw_data column"""
+    return {
+        key: get_scatter_chart(waveforms.get(field))
+        for key, field in ANALYZE_RAW_CHART_FIELDS.items()
+    }
+
+
+def get_analyze_raw_charts(measure_raw):
+    """scatter charts of the six analyze raw channels of a MeasureRaw (or row)"""
+    return get_scatter_charts(
+        {
+            field: get_chart_waveform(measure_raw, field)
+            for field in ANALYZE_RAW_CHART_FIELDS.values()
+        },
+    )
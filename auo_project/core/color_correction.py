@@ -1,6 +1,13 @@
+import asyncio
+import multiprocessing
+import os
 import pickle
+import sys
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from io import BytesIO
-from typing import Union
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional, Tuple, Union
 from uuid import UUID
 
 import cv2
@@ -8,6 +15,8 @@ import numpy as np
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from auo_project import crud, models, schemas
+from auo_project.core.blob import get_executor, internet_blob_store
+from auo_project.core.config import settings
 from auo_project.web.api import deps
 
 
@@ -114,16 +123,12 @@ def find_color_card(image):
         return None
 
 
-def _match_cumulative_cdf_mod(source, template, full):
+def _get_cumulative_cdf_lut(source, template) -> np.ndarray:
     """
-    Return modified full image array so that the cumulative density function of
-    source array matches the cumulative density function of the template.
+    Return the 256 entry table mapping source values to template values, so
+    that the cumulative density function of source matches the one of template.
     """
-    src_values, src_unique_indices, src_counts = np.unique(
-        source.ravel(),
-        return_inverse=True,
-        return_counts=True,
-    )
+    src_values, src_counts = np.unique(source.ravel(), return_counts=True)
     tmpl_values, tmpl_counts = np.unique(template.ravel(), return_counts=True)
 
     # calculate normalized quantiles for each array
@@ -132,52 +137,44 @@ def _match_cumulative_cdf_mod(source, template, full):
 
     interp_a_values = np.interp(src_quantiles, tmpl_quantiles, tmpl_values)
 
-    # Here we compute values which the channel RGB value of full image will be modified to.
-    interpb = []
-    for i in range(0, 256):
-        interpb.append(-1)
-
-    # first compute which values in src image transform to and mark those values.
-
-    for i in range(0, len(interp_a_values)):
-        frm = src_values[i]
-        to = interp_a_values[i]
-        interpb[frm] = to
-
-    # some of the pixel values might not be there in interp_a_values, interpolate those values using their
-    # previous and next neighbours
-    prev_value = -1
-    prev_index = -1
-    for i in range(0, 256):
-        if interpb[i] == -1:
-            next_index = -1
-            next_value = -1
-            for j in range(i + 1, 256):
-                if interpb[j] >= 0:
-                    next_value = interpb[j]
-                    next_index = j
-            if prev_index < 0:
-                interpb[i] = (i + 1) * next_value / (next_index + 1)
-            elif next_index < 0:
-                interpb[i] = prev_value + (
-                    (255 - prev_value) * (i - prev_index) / (255 - prev_index)
-                )
-            else:
-                interpb[i] = prev_value + (i - prev_index) * (
-                    next_value - prev_value
-                ) / (next_index - prev_index)
-        else:
-            prev_value = interpb[i]
-            prev_index = i
+    # values which are in the source card map to their matched template value
+    lut = np.full(256, -1.0)
+    lut[src_values] = interp_a_values
+    known = np.zeros(256, dtype=bool)
+    known[src_values] = True
+
+    # the other values are interpolated between the previous source value and
+    # the last source value (not the next one), extrapolated linearly to 0
+    # before the first and to 255 after the last source value
+    index = np.arange(256)
+    prev_index = np.maximum.accumulate(np.where(known, index, -1))
+    prev_value = lut[np.maximum(prev_index, 0)]
+    last_index = src_values[-1]
+    last_value = lut[last_index]
+
+    before_first = ~known & (prev_index < 0)
+    lut[before_first] = (index[before_first] + 1) * last_value / (last_index + 1)
+
+    after_last = ~known & (index > last_index)
+    lut[after_last] = prev_value[after_last] + (
+        (255 - prev_value[after_last])
+        * (index[after_last] - prev_index[after_last])
+        / (255 - prev_index[after_last])
+    )
+
+    between = ~known & (prev_index >= 0) & (index < last_index)
+    lut[between] = prev_value[between] + (index[between] - prev_index[between]) * (
+        last_value - prev_value[between]
+    ) / (last_index - prev_index[between])
+    return lut
+
 
-    # finally transform pixel values in full image using interpb interpolation values.
-    wid = full.shape[1]
-    hei = full.shape[0]
-    ret2 = np.zeros((hei, wid))
-    for i in range(0, hei):
-        for j in range(0, wid):
-            ret2[i][j] = interpb[full[i][j]]
-    return ret2
+def _match_cumulative_cdf_mod(source, template, full):
+    """
+    Return modified full image array so that the cumulative density function of
+    source array matches the cumulative density function of the template.
+    """
+    return np.take(_get_cumulative_cdf_lut(source, template), full)
 
 
 def match_histograms_mod(inputCard, referenceCard, fullImage):
@@ -189,14 +186,21 @@ def match_histograms_mod(inputCard, referenceCard, fullImage):
         raise ValueError(
             "Image and reference must have the same number " "of channels.",
         )
+    channels = inputCard.shape[-1]
+    luts = [
+        _get_cumulative_cdf_lut(inputCard[..., channel], referenceCard[..., channel])
+        for channel in range(channels)
+    ]
+    if fullImage.dtype == np.uint8 and fullImage.ndim == 3:
+        if fullImage.shape[-1] == channels:
+            # one table lookup for all channels, the float table is truncated
+            # to uint8 like the per pixel assignment did
+            lut = np.stack(luts, axis=-1).astype(np.uint8).reshape(1, 256, channels)
+            return cv2.LUT(fullImage, lut)
+
     matched = np.empty(fullImage.shape, dtype=fullImage.dtype)
-    for channel in range(inputCard.shape[-1]):
-        matched_channel = _match_cumulative_cdf_mod(
-            inputCard[..., channel],
-            referenceCard[..., channel],
-            fullImage[..., channel],
-        )
-        matched[..., channel] = matched_channel
+    for channel, lut in enumerate(luts):
+        matched[..., channel] = np.take(lut, fullImage[..., channel])
     return matched
 
 
@@ -211,33 +215,65 @@ def load_color_correction(cc_pickle: bytes) -> ColorCorrectionData:
     return cc_instance
 
 
-async def do_action(
-    db_session: AsyncSession,
+def correct_tongue_images(
+    cc_instance: ColorCorrectionData,
+    tongue_front: bytes,
+    tongue_back: bytes,
+) -> Tuple[bytes, bytes]:
+    """corrected jpg of the front and back tongue images, runs in a worker"""
+    return (
+        convert_cv2_to_bytes(correct_image_color(cc_instance, tongue_front)),
+        convert_cv2_to_bytes(correct_image_color(cc_instance, tongue_back)),
+    )
+
+
+_correction_executor: Optional[Executor] = None
+
+
+def get_correction_executor() -> Executor:
+    """
+    Process pool for the correction, or a thread pool in a daemonic process
+    (e.g. a celery prefork child) which can not start processes, cv2 releases
+    the GIL for most of the work anyway.
+    """
+    global _correction_executor
+    if _correction_executor is None:
+        max_workers = settings.TONGUE_CORRECTION_PROCESSES or os.cpu_count()
+        if multiprocessing.current_process().daemon:
+            _correction_executor = ThreadPoolExecutor(max_workers=max_workers)
+        else:
+            # spawn, forking the threads of a running event loop may deadlock
+            _correction_executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _correction_executor
+
+
+async def correct_tongue_upload(
     record: models.MeasureTongueUpload,
     cc_instance: ColorCorrectionData,
-):
-    (
+) -> Tuple[str, str]:
+    """correct and upload the images of a record, returns their locations"""
+    container = crud.measure_tongue_upload.get_container_name()
+    tongue_front_original_bytes, tongue_back_original_bytes = await (
+        internet_blob_store.download_many(
+            [
+                (container, record.tongue_front_original_loc),
+                (container, record.tongue_back_original_loc),
+            ],
+        )
+    )
+
+    loop = asyncio.get_running_loop()
+    tongue_front_corrected, tongue_back_corrected = await loop.run_in_executor(
+        get_correction_executor(),
+        correct_tongue_images,
+        cc_instance,
         tongue_front_original_bytes,
         tongue_back_original_bytes,
-    ) = crud.measure_tongue_upload.get_original_images(upload=record)
-
-    # correct color
-    print("correct color...")
-    tongue_front_corrected = convert_cv2_to_bytes(
-        correct_image_color(
-            cc_instance=cc_instance,
-            input_tongue_image=tongue_front_original_bytes,
-        ),
-    )
-    tongue_back_corrected = convert_cv2_to_bytes(
-        correct_image_color(
-            cc_instance=cc_instance,
-            input_tongue_image=tongue_back_original_bytes,
-        ),
     )
 
-    # upload images
-    print("upload images...")
     blob_prefix = crud.measure_tongue_upload.get_blob_prefix()
     tongue_front_corrected_loc = (
         f"{blob_prefix}/{record.org_id}/{record.id}/T_up_corrected.jpg"
@@ -245,17 +281,22 @@ async def do_action(
     tongue_back_corrected_loc = (
         f"{blob_prefix}/{record.org_id}/{record.id}/T_down_corrected.jpg"
     )
-    crud.measure_tongue_upload.upload_image(
-        image_loc=tongue_front_corrected_loc,
-        image_content=tongue_front_corrected,
-    )
-    crud.measure_tongue_upload.upload_image(
-        image_loc=tongue_back_corrected_loc,
-        image_content=tongue_back_corrected,
+    await internet_blob_store.upload_many(
+        [
+            (container, tongue_front_corrected_loc, tongue_front_corrected),
+            (container, tongue_back_corrected_loc, tongue_back_corrected),
+        ],
     )
+    return tongue_front_corrected_loc, tongue_back_corrected_loc
 
-    # update record
-    print("update record...")
+
+async def update_corrected_locs(
+    db_session: AsyncSession,
+    record: models.MeasureTongueUpload,
+    locs: Tuple[str, str],
+    autocommit: bool = True,
+):
+    tongue_front_corrected_loc, tongue_back_corrected_loc = locs
     await crud.measure_tongue_upload.update(
         db_session=db_session,
         obj_current=record,
@@ -263,12 +304,143 @@ async def do_action(
             tongue_front_corrected_loc=tongue_front_corrected_loc,
             tongue_back_corrected_loc=tongue_back_corrected_loc,
         ),
+        autocommit=autocommit,
     )
-    await db_session.commit()
+
+
+async def do_action(
+    db_session: AsyncSession,
+    record: models.MeasureTongueUpload,
+    cc_instance: ColorCorrectionData,
+):
+    print("correct color...")
+    locs = await correct_tongue_upload(record=record, cc_instance=cc_instance)
+
+    print("update record...")
+    await update_corrected_locs(db_session=db_session, record=record, locs=locs)
     print("finished")
     return True
 
 
+def get_cc_instance_size(cc_instance: ColorCorrectionData) -> int:
+    """approximate bytes held by an unpickled ColorCorrectionData"""
+    size = sys.getsizeof(cc_instance)
+    for value in vars(cc_instance).values():
+        size += value.nbytes if isinstance(value, np.ndarray) else sys.getsizeof(value)
+    return size
+
+
+class ColorCorrectionCache:
+    """
+    Process wide LRU of unpickled ColorCorrectionData per (org_id, color_hash),
+    evicting the least recently used entries above `max_bytes`.
+
+    An entry also keeps the version (id and updated_at) of the tongue config
+    upload it was loaded from, a newer upload of the same color hash, even from
+    another process, is a miss and replaces it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[Any, ColorCorrectionData, int]]"
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = OrderedDict()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get(self, key: Hashable, version: Any) -> Optional[ColorCorrectionData]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: Any, cc_instance: ColorCorrectionData):
+        size = get_cc_instance_size(cc_instance)
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (version, cc_instance, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, org_id: UUID, color_hash: Optional[str] = None) -> None:
+        """drop the entry of a color hash, or every entry of the org"""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == org_id and color_hash in (None, key[1]):
+                    self._pop(key)
+
+    def _pop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+cc_cache = ColorCorrectionCache(max_bytes=settings.COLOR_CORRECTION_CACHE_MAX_BYTES)
+
+
+async def get_cc_instance(
+    db_session: AsyncSession,
+    org_id: UUID,
+    color_hash: str,
+) -> Optional[ColorCorrectionData]:
+    """
+    ColorCorrectionData of the latest tongue config upload of a color hash,
+    downloaded and unpickled only when it is not in `cc_cache`.
+    """
+    config_upload = await crud.measure_tongue_config_upload.get_by_color_hash(
+        db_session=db_session,
+        org_id=org_id,
+        color_hash=color_hash,
+    )
+    if config_upload is None:
+        return None
+
+    key = (org_id, color_hash)
+    version = (config_upload.id, config_upload.updated_at)
+    cc_instance = cc_cache.get(key, version)
+    if cc_instance is not None:
+        return cc_instance
+
+    cc_pickle = await crud.measure_tongue_config_upload.download_cc_pickle(
+        config_upload=config_upload,
+    )
+    if cc_pickle is None:
+        return None
+    loop = asyncio.get_running_loop()
+    cc_instance = await loop.run_in_executor(
+        get_executor(),
+        load_color_correction,
+        cc_pickle,
+    )
+    cc_cache.put(key, version, cc_instance)
+    return cc_instance
+
+
 async def process_tongue_image_by_id(upload_id: UUID) -> None:
     async with deps.get_db2() as db_session:
         record = await crud.measure_tongue_upload.get(
@@ -277,50 +449,82 @@ async def process_tongue_image_by_id(upload_id: UUID) -> None:
         )
         if record is None:
             raise ValueError("No record found for upload_id", upload_id)
-        cc_pickle = await crud.measure_tongue_config_upload.get_cc_pickle_content(
+        cc_instance = await get_cc_instance(
             db_session=db_session,
             org_id=record.org_id,
             color_hash=record.color_hash,
         )
-        if cc_pickle is None:
+        if cc_instance is None:
             raise ValueError(
                 "No color correction pickle found for color hash",
                 record.color_hash,
             )
-        # TODO: cache cc_instance
-        cc_instance = load_color_correction(cc_pickle=cc_pickle)
         await do_action(db_session=db_session, record=record, cc_instance=cc_instance)
 
 
-async def process_tongue_raw_images() -> None:
-    cc_instance_dict = {}
+async def process_tongue_raw_images(
+    batch_size: int = settings.TONGUE_CORRECTION_BATCH_SIZE,
+    concurrency: int = settings.TONGUE_CORRECTION_CONCURRENCY,
+) -> int:
+    """
+    Correct every unprocessed tongue upload, returns the number corrected.
+
+    Rows are claimed in batches with FOR UPDATE SKIP LOCKED and stay locked
+    until the batch is committed, so workers running this together split the
+    backlog. Within a batch at most `concurrency` records are downloaded,
+    corrected and uploaded at the same time.
+    """
+    processed = 0
+    failed_ids = []
     async with deps.get_db2() as db_session:
-        records = await crud.measure_tongue_upload.get_unprocessed_rows(
-            db_session=db_session,
-        )
-        for record in records:
-            print("record", record.id)
-            if record.color_hash not in cc_instance_dict:
-                cc_pickle = (
-                    await crud.measure_tongue_config_upload.get_cc_pickle_content(
-                        db_session=db_session,
-                        org_id=record.org_id,
-                        color_hash=record.color_hash,
-                    )
+        while True:
+            records = await crud.measure_tongue_upload.claim_unprocessed_rows(
+                db_session=db_session,
+                limit=batch_size,
+                exclude_ids=failed_ids,
+            )
+            if not records:
+                break
+
+            jobs = []
+            for record in records:
+                cc_instance = await get_cc_instance(
+                    db_session=db_session,
+                    org_id=record.org_id,
+                    color_hash=record.color_hash,
                 )
-                if cc_pickle is None:
+                if cc_instance is None:
                     print(
                         "No color correction pickle found for color hash",
                         record.color_hash,
                     )
+                    failed_ids.append(record.id)
                     continue
-                cc_instance = load_color_correction(cc_pickle=cc_pickle)
-                cc_instance_dict[record.color_hash] = cc_instance
-            else:
-                cc_instance = cc_instance_dict[record.color_hash]
+                jobs.append((record, cc_instance))
 
-            await do_action(
-                db_session=db_session,
-                record=record,
-                cc_instance=cc_instance,
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def run(record, cc_instance):
+                async with semaphore:
+                    return await correct_tongue_upload(record, cc_instance)
+
+            results = await asyncio.gather(
+                *[run(record, cc_instance) for record, cc_instance in jobs],
+                return_exceptions=True,
             )
+            for (record, _), result in zip(jobs, results):
+                if isinstance(result, Exception):
+                    print("record", record.id, "error:", repr(result))
+                    failed_ids.append(record.id)
+                    continue
+                await update_corrected_locs(
+                    db_session=db_session,
+                    record=record,
+                    locs=result,
+                    autocommit=False,
+                )
+                processed += 1
+            # releases the claimed rows
+            await db_session.commit()
+            print(f"corrected {processed} tongue uploads, {len(failed_ids)} failed")
+    return processed
@@ -78,8 +78,38 @@ class Settings(BaseSettings):
     STREAMLIT_PASSWORD: Optional[str] = None
 
     BCQ_MODEL_API_URL: str = "https://auoyourator-health-consultation.azurewebsites.net"
+    # external tongue services, see core.http
+    TONGUE_COLOR_CARD_API_URL: str = "https://auoyourator-tongue-color-correction-a0haf3fbcdekhue4.southeastasia-01.azurewebsites.net"
+    TONGUE_AI_API_URL: str = (
+        "https://auoyourator-tongue-inspection.azurewebsites.net/api/v2.0"
+    )
+    TONGUE_CC_API_URL: str = "http://host.docker.internal:8881"
+    # requests in flight (and kept alive connections) per service and event loop
+    SERVICE_MAX_CONCURRENCY: int = 8
+    TONGUE_AI_MAX_CONCURRENCY: int = 4
+    # seconds to wait for the tongue ai result of a task
+    TONGUE_AI_RESULT_TIMEOUT: int = 30
+    # zlib level (0-9) of the PNG sent to the tongue services, see core.image
+    TONGUE_PNG_COMPRESS_LEVEL: int = 1
+
+    # core.measure.create_merged_measures: seconds the incremental refresh
+    # looks back before the last one, measures replaced per statement
+    MERGED_MEASURES_OVERLAP: int = 300
+    MERGED_MEASURES_BATCH_SIZE: int = 1000
+    # core.measure: measure whose MEAN statistic overrides measure.overall_means
+    # and the norms, set it empty to opt out and serve the means of all the
+    # counted measures, days of changed measures the daily reconciliation
+    # counts again, pending measures synced per transaction by the fold
+    CN_MEANS_MEASURE_ID: Optional[str] = "86eacaf9-5109-47e8-be41-45fe823a1a29"
+    CN_MEANS_RECONCILE_DAYS: int = 2
+    CN_MEANS_FOLD_BATCH_SIZE: int = 500
 
     DB_POOL_SIZE = 83
+    # db.session: engine pool, one per process and event loop (None: pool size + 5)
+    DB_MAX_OVERFLOW: Optional[int] = None
+    DB_POOL_PRE_PING: bool = True
+    # seconds before a pooled connection is opened again
+    DB_POOL_RECYCLE: int = 1800
     POOL_SIZE = max(DB_POOL_SIZE // WORKERS_COUNT, 5)
     ASYNC_DATABASE_URI: Optional[str]
 
@@ -118,6 +148,35 @@ class Settings(BaseSettings):
             path=f"/{values.get('DATABASE_NAME') or ''}",
         )
 
+    # read replica of the analytics and report endpoints, see db.session
+    REPLICA_DATABASE_HOST: Optional[str] = None
+    REPLICA_DATABASE_PORT: Optional[Union[int, str]] = None
+    REPLICA_ASYNC_DATABASE_URI: Optional[str]
+
+    @validator("REPLICA_ASYNC_DATABASE_URI", pre=True)
+    def assemble_replica_db_connection(
+        cls,
+        v: Optional[str],
+        values: Dict[str, Any],
+    ) -> Any:
+        if isinstance(v, str) or not values.get("REPLICA_DATABASE_HOST"):
+            return v
+        return PostgresDsn.build(
+            scheme="postgresql+asyncpg",
+            user=values.get("DATABASE_USER"),
+            password=values.get("DATABASE_PASSWORD"),
+            host=values.get("REPLICA_DATABASE_HOST"),
+            port=str(
+                values.get("REPLICA_DATABASE_PORT") or values.get("DATABASE_PORT"),
+            ),
+            path=f"/{values.get('DATABASE_NAME') or ''}",
+        )
+
+    # seconds of replication lag above which the reads go to the primary
+    REPLICA_MAX_LAG: float = 30
+    # seconds between two checks of the replication lag
+    REPLICA_LAG_CHECK_INTERVAL: float = 10
+
     REDIS_DATABASE_URI: Optional[str]
 
     @validator("REDIS_DATABASE_URI", pre=True)
@@ -150,6 +209,46 @@ class Settings(BaseSettings):
     ROWS_PER_PAGE: int = 500
     MAX_ROWS_PER_PAGE: int = 500
     MAX_UPLOAD_CONCURRENCY: int = 20
+    # bytes of a downloaded measurement zip kept in memory before spilling to disk
+    MEASURE_ZIP_SPOOL_MAX_SIZE: int = 4 * 1024**2
+    MEASURE_ZIP_STREAMING: bool = True
+    # zlib compress the binary MeasureRaw waveforms, see core.waveform
+    MEASURE_RAW_COMPRESS: bool = False
+    # also write the text MeasureRaw waveforms, see core.waveform; turn it off
+    # once `backfill-raw-waveforms` has filled the binary columns
+    MEASURE_RAW_WRITE_TEXT: bool = True
+    # seconds a worker reuses the compiled custom formulas before checking
+    # measure.custom_formulas.updated_at again
+    CUSTOM_FORMULA_CACHE_TTL: int = 10
+    # bytes of unpickled color correction cards a worker keeps, see
+    # core.color_correction.cc_cache
+    COLOR_CORRECTION_CACHE_MAX_BYTES: int = 256 * 1024**2
+    # core.redis: share the caches between the workers in redis, else every
+    # worker only keeps its own; seconds a redis call may take
+    REDIS_CACHE_ENABLED: bool = False
+    REDIS_CACHE_TIMEOUT: float = 0.5
+    # core.principal: seconds a worker and redis keep the resolved user of a
+    # token, users a worker keeps
+    PRINCIPAL_CACHE_TTL: int = 60
+    PRINCIPAL_REDIS_TTL: int = 600
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+    # core.denylist: revoked tokens the Bloom filter of a worker is sized for,
+    # its false positive rate and seconds between rebuilding it from redis
+    TOKEN_DENYLIST_CAPACITY: int = 100000
+    TOKEN_DENYLIST_ERROR_RATE: float = 0.001
+    TOKEN_DENYLIST_REFRESH: int = 60
+    # core.password: threads hashing passwords (None: up to 4, one per cpu)
+    PASSWORD_HASH_WORKERS: Optional[int] = None
+    # core.color_correction.process_tongue_raw_images: rows claimed per batch,
+    # records in flight and correction processes (None: cpu count)
+    TONGUE_CORRECTION_BATCH_SIZE: int = 32
+    TONGUE_CORRECTION_CONCURRENCY: int = 8
+    TONGUE_CORRECTION_PROCESSES: Optional[int] = None
+    # core.blob: "azure" or "local" (files under BLOB_LOCAL_ROOT, for offline use)
+    BLOB_BACKEND: str = "azure"
+    BLOB_LOCAL_ROOT: str = "/tmp/auo_blob"
+    # threads running blob calls, also the kept alive connections per account
+    BLOB_MAX_WORKERS: int = 16
 
     AZURE_STORAGE_ACCOUNT: str
     AZURE_STORAGE_KEY: str
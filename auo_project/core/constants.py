@@ -198,3 +198,29 @@ class ProductCategoryType(str, Enum):
     inquiry = "問診"
     tongue = "舌診"
     pulse = "脈診"
+
+
+class DownsampleMode(str, Enum):
+    """
+    downsample_mode
+
+    minmax 每區間最小值與最大值，保留峰值
+    lttb Largest-Triangle-Three-Buckets，保留波形
+    stride 每 n 點取一點
+    """
+
+    minmax = "minmax"
+    lttb = "lttb"
+    stride = "stride"
+
+
+class ImageFormat(str, Enum):
+    """
+    image_format
+
+    webp 較小，現代瀏覽器皆支援
+    jpeg 相容舊版瀏覽器
+    """
+
+    webp = "webp"
+    jpeg = "jpeg"
@@ -0,0 +1,203 @@
+"""
+Denylist of revoked access and refresh tokens.
+
+An entry revokes one token, `jti:<jti>`, or every token of a user issued
+before a time, `sub:<username>` whose value is that timestamp. In redis an
+entry is
+
+- the key `jwt:denylist:<entry>`, expiring with the last token it can match
+- a member of the sorted set `jwt:denylist` scored by that expiry
+- a message on the channel `jwt:denylist`
+
+Every worker keeps a Bloom filter of the entries, rebuilt from the sorted set
+every TOKEN_DENYLIST_REFRESH seconds and updated from the channel in between,
+so the token of nearly every request, never revoked, is checked without a
+network hop. Only a hit of the filter asks redis, a redis error then counts
+as revoked.
+
+Without redis (REDIS_CACHE_ENABLED off) the entries are kept by the worker
+revoking them only.
+"""
+import asyncio
+import hashlib
+import math
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from auo_project.core.config import settings
+from auo_project.core.redis import get_redis
+
+DENYLIST_KEY = "jwt:denylist"
+DENYLIST_CHANNEL = "jwt:denylist"
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(
+            8,
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2),
+        )
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _indexes(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        for index in self._indexes(key):
+            self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(key)
+        )
+
+
+class TokenDenylist:
+    def __init__(self, capacity: int, error_rate: float, refresh_seconds: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.refreshed_at: Optional[float] = None
+        # entries received while the filter is rebuilt
+        self._received: Set[str] = set()
+        # entry: (expires at, value), without redis
+        self._local: Dict[str, Tuple[float, float]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self.checks = 0
+        self.lookups = 0
+
+    async def add(self, entry: str, value: float, expires_at: float):
+        redis = get_redis()
+        if redis is None:
+            self._local[entry] = (expires_at, value)
+            return
+        ttl = max(1, math.ceil(expires_at - time.time()))
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(f"{DENYLIST_KEY}:{entry}", value, ex=ttl)
+            pipe.zadd(DENYLIST_KEY, {entry: expires_at})
+            pipe.publish(DENYLIST_CHANNEL, entry)
+            await pipe.execute()
+        self._receive(entry)
+
+    def _receive(self, entry: str):
+        self.bloom.add(entry)
+        self._received.add(entry)
+
+    async def refresh(self, redis: Redis):
+        """rebuild the filter from the entries not expired yet"""
+        self._received = set()
+        now = time.time()
+        await redis.zremrangebyscore(DENYLIST_KEY, "-inf", now)
+        entries = await redis.zrangebyscore(DENYLIST_KEY, now, "+inf")
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for entry in entries:
+            bloom.add(entry.decode("utf-8"))
+        for entry in self._received:
+            bloom.add(entry)
+        self.bloom = bloom
+        self.refreshed_at = time.monotonic()
+
+    async def _get_values(self, entries) -> Dict[str, Optional[float]]:
+        redis = get_redis()
+        if redis is None:
+            now = time.time()
+            return {
+                entry: item[1]
+                for entry, item in (
+                    (entry, self._local.get(entry)) for entry in entries
+                )
+                if item is not None and item[0] > now
+            }
+
+        if (
+            self.refreshed_at is None
+            or time.monotonic() - self.refreshed_at > self.refresh_seconds
+        ):
+            try:
+                await self.refresh(redis)
+            except RedisError as e:
+                print(f"refresh token denylist error: {e!r}")
+        candidates = [entry for entry in entries if entry in self.bloom]
+        if not candidates:
+            return {}
+        self.lookups += 1
+        values = await redis.mget([f"{DENYLIST_KEY}:{entry}" for entry in candidates])
+        return {
+            entry: float(value)
+            for entry, value in zip(candidates, values)
+            if value is not None
+        }
+
+    async def is_revoked(self, raw_token: Dict[str, Any]) -> bool:
+        self.checks += 1
+        jti_entry = f"jti:{raw_token.get('jti')}"
+        sub_entry = f"sub:{raw_token.get('sub')}"
+        try:
+            values = await self._get_values([jti_entry, sub_entry])
+        except RedisError as e:
+            print(f"check token denylist error: {e!r}")
+            return True
+        if jti_entry in values:
+            return True
+        revoked_before = values.get(sub_entry)
+        return revoked_before is not None and raw_token.get("iat", 0) < revoked_before
+
+    async def revoke_token(self, raw_token: Dict[str, Any]):
+        """revoke a decoded token until it expires"""
+        await self.add(f"jti:{raw_token['jti']}", 1, raw_token["exp"])
+
+    async def revoke_user_tokens(self, username: str):
+        """revoke every token issued to a user until now"""
+        now = time.time()
+        await self.add(
+            f"sub:{username}",
+            math.floor(now),
+            now + settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60,
+        )
+
+    async def listen(self):
+        """add the entries published by the other workers, until cancelled"""
+        while True:
+            redis = get_redis()
+            try:
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(DENYLIST_CHANNEL)
+                    # nothing published since subscribing is missed
+                    await self.refresh(redis)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._receive(message["data"].decode("utf-8"))
+            except RedisError as e:
+                print(f"token denylist listener error: {e!r}")
+                await asyncio.sleep(1)
+
+    def start(self):
+        if get_redis() is not None and self._listener is None:
+            self._listener = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"checks": self.checks, "lookups": self.lookups}
+
+
+token_denylist = TokenDenylist(
+    capacity=settings.TOKEN_DENYLIST_CAPACITY,
+    error_rate=settings.TOKEN_DENYLIST_ERROR_RATE,
+    refresh_seconds=settings.TOKEN_DENYLIST_REFRESH,
+)
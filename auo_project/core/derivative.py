@@ -0,0 +1,193 @@
+"""
+Resized variants of the tongue images.
+
+Every source image gets a webp and a jpeg variant per size of
+DERIVATIVE_SIZES (longest side, never upscaled), stored under the sha256 of
+the source bytes:
+
+    derivatives/<sha256>/<size>.webp
+    derivatives/<sha256>/<size>.jpg
+
+so the same photo uploaded twice is resized once. measure.image_derivatives
+maps a source blob path to its variants, the endpoints pick the smallest
+variant at least as wide as the viewport with `get_variant_locs`.
+"""
+import asyncio
+import hashlib
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from auo_project import crud
+from auo_project.core.blob import get_executor, internet_blob_store
+from auo_project.core.config import settings
+from auo_project.core.constants import ImageFormat
+from auo_project.db.session import AsyncSession
+from auo_project.web.api import deps
+
+DERIVATIVE_SIZES = {"thumb": 256, "small": 640, "large": 1280}
+DERIVATIVE_FORMATS = {
+    ImageFormat.webp: ("WEBP", "webp", {"quality": 80, "method": 4}),
+    ImageFormat.jpeg: ("JPEG", "jpg", {"quality": 85, "optimize": True}),
+}
+
+
+def get_content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_derivative_loc(content_hash: str, name: str, image_format: str) -> str:
+    _, extension, _ = DERIVATIVE_FORMATS[ImageFormat(image_format)]
+    return f"derivatives/{content_hash}/{name}.{extension}"
+
+
+def make_variants(content: bytes, content_hash: str) -> List[Tuple[dict, bytes]]:
+    """(variant, encoded bytes) of every size and format, runs in a worker"""
+    image = ImageOps.exif_transpose(Image.open(BytesIO(content))).convert("RGB")
+    variants = []
+    for name, size in DERIVATIVE_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for image_format, (pil_format, _, options) in DERIVATIVE_FORMATS.items():
+            output = BytesIO()
+            resized.save(output, format=pil_format, **options)
+            variants.append(
+                (
+                    {
+                        "name": name,
+                        "format": image_format.value,
+                        "width": resized.width,
+                        "height": resized.height,
+                        "loc": get_derivative_loc(content_hash, name, image_format),
+                    },
+                    output.getvalue(),
+                ),
+            )
+    return variants
+
+
+async def generate_image_derivatives(
+    db_session: AsyncSession,
+    source_loc: str,
+    content: Optional[Union[bytes, BytesIO]] = None,
+    autocommit: bool = True,
+) -> List[dict]:
+    """
+    Resize and upload the variants of an image of the internet image
+    container, downloaded when `content` is not given. Returns the variants.
+    """
+    container = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
+    if content is None:
+        content = await internet_blob_store.download(container, source_loc)
+    if isinstance(content, BytesIO):
+        content = content.getvalue()
+    content_hash = get_content_hash(content)
+
+    existing = await crud.measure_image_derivative.get_by_content_hash(
+        db_session=db_session,
+        content_hash=content_hash,
+    )
+    if existing is not None:
+        variants = existing.variants
+    else:
+        loop = asyncio.get_running_loop()
+        encoded = await loop.run_in_executor(
+            get_executor(),
+            make_variants,
+            content,
+            content_hash,
+        )
+        await internet_blob_store.upload_many(
+            (container, variant["loc"], data) for variant, data in encoded
+        )
+        variants = [variant for variant, _ in encoded]
+
+    await crud.measure_image_derivative.upsert(
+        db_session=db_session,
+        source_loc=source_loc,
+        content_hash=content_hash,
+        variants=variants,
+        autocommit=autocommit,
+    )
+    return variants
+
+
+async def try_generate_image_derivatives(
+    db_session: AsyncSession,
+    sources: List[Tuple[str, Optional[Union[bytes, BytesIO]]]],
+    autocommit: bool = True,
+) -> None:
+    """
+    derivatives of (source_loc, content) pairs, errors are only logged. Without
+    autocommit each pair is written in a savepoint, so a failed statement
+    leaves the transaction of the caller usable.
+    """
+    for source_loc, content in sources:
+        try:
+            if autocommit:
+                await generate_image_derivatives(
+                    db_session=db_session,
+                    source_loc=source_loc,
+                    content=content,
+                )
+            else:
+                async with db_session.begin_nested():
+                    await generate_image_derivatives(
+                        db_session=db_session,
+                        source_loc=source_loc,
+                        content=content,
+                        autocommit=False,
+                    )
+        except Exception as e:
+            print(f"image derivatives of {source_loc} error: {e!r}")
+
+
+async def generate_image_derivatives_of_locs(source_locs: List[str]) -> None:
+    """derivatives of images of the internet image container, run by a worker"""
+    async with deps.get_db2() as db_session:
+        await try_generate_image_derivatives(
+            db_session=db_session,
+            sources=[(source_loc, None) for source_loc in source_locs],
+        )
+
+
+def select_variant(
+    variants: List[dict],
+    width: int,
+    image_format: str = ImageFormat.webp,
+) -> Optional[dict]:
+    """the smallest variant at least `width` wide, None if all are narrower"""
+    variants = sorted(
+        (v for v in variants if v["format"] == image_format),
+        key=lambda v: v["width"],
+    )
+    for variant in variants:
+        if variant["width"] >= width:
+            return variant
+    return None
+
+
+async def get_variant_locs(
+    db_session: AsyncSession,
+    source_locs: List[Optional[str]],
+    width: Optional[int],
+    image_format: str = ImageFormat.webp,
+) -> Dict[str, str]:
+    """
+    source_loc: blob path to serve for a viewport `width`, the source itself
+    when no width is given, it has no derivatives (yet) or none is wide enough
+    """
+    source_locs = [loc for loc in source_locs if loc]
+    locs = {loc: loc for loc in source_locs}
+    if width is None:
+        return locs
+    derivatives = await crud.measure_image_derivative.get_by_source_locs(
+        db_session=db_session,
+        source_locs=source_locs,
+    )
+    for source_loc, derivative in derivatives.items():
+        variant = select_variant(derivative.variants, width, image_format)
+        if variant is not None:
+            locs[source_loc] = variant["loc"]
+    return locs
@@ -1,3 +1,4 @@
+import asyncio
 from collections import Counter
 from datetime import datetime
 from io import BytesIO, StringIO
@@ -5,22 +6,23 @@ from os.path import abspath, dirname
 from os.path import join as joinpath
 from os.path import realpath
 from pathlib import Path
-from typing import BinaryIO, List, Union
+from types import SimpleNamespace
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Union
 from uuid import UUID
 from zipfile import ZipFile
 
+import numpy as np
 import pandas as pd
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.orm import sessionmaker
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from auo_project import crud, models, schemas
 from auo_project.core.azure import (
     download_zip_file,
-    internet_blob_service,
     private_blob_service,
-    upload_blob_file,
+    spool_zip_file,
 )
+from auo_project.core.blob import get_executor, internet_blob_store
+from auo_project.core.chart import ANALYZE_RAW_CHART_FIELDS, get_scatter_chart
 from auo_project.core.config import settings
 from auo_project.core.constants import (
     LOW_PASS_RATE_THRESHOLD,
@@ -29,6 +31,7 @@ from auo_project.core.constants import (
     UploadStatusType,
 )
 from auo_project.core.security import decrypt
+from auo_project.core.tile import get_analyze_raw_tiles
 from auo_project.core.utils import (
     get_age,
     get_max_amp_value,
@@ -38,29 +41,13 @@ from auo_project.core.utils import (
     safe_divide,
     safe_substract,
 )
-from auo_project.db.session import SessionLocal
-
-conn_args = {}
-if settings.DATABASE_SSL_REQURED:
-    conn_args["ssl"] = "require"
-
-engine = create_async_engine(
-    settings.ASYNC_DATABASE_URI,
-    echo=settings.DATABASE_ECHO,
-    future=True,
-    pool_size=settings.DB_POOL_SIZE,
-    max_overflow=settings.DB_POOL_SIZE + 5,
-    connect_args=conn_args,
+from auo_project.core.waveform import (
+    WAVEFORM_BIN_FIELDS,
+    encode_waveform,
+    to_waveform_array,
 )
-
-SessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-)
-
+from auo_project.db.session import SessionLocal
+from auo_project.services.celery import celery_app
 
 resolved = lambda x: realpath(abspath(x))
 
@@ -295,6 +282,25 @@ def cal_extra_measure_info(infos_analyze):
     return result
 
 
+MEASURE_RAW_FIELD_FILE_DICT = {
+    "six_sec_l_cu": "left/6s_cu.txt",
+    "six_sec_l_qu": "left/6s_qu.txt",
+    "six_sec_l_ch": "left/6s_ch.txt",
+    "six_sec_r_cu": "right/6s_cu.txt",
+    "six_sec_r_qu": "right/6s_qu.txt",
+    "six_sec_r_ch": "right/6s_ch.txt",
+    "all_sec_analyze_raw_l_cu": "left/analyze_raw_Cu.txt",
+    "all_sec_analyze_raw_l_qu": "left/analyze_raw_Qu.txt",
+    "all_sec_analyze_raw_l_ch": "left/analyze_raw_Ch.txt",
+    "all_sec_analyze_raw_r_cu": "right/analyze_raw_Cu.txt",
+    "all_sec_analyze_raw_r_qu": "right/analyze_raw_Qu.txt",
+    "all_sec_analyze_raw_r_ch": "right/analyze_raw_Ch.txt",
+}
+
+MEASURE_RAW_DATA_KEY = "measure_raw"
+MEASURE_RAW_TILES_KEY = "measure_raw_tiles"
+
+
 def serialize(df):
     if isinstance(df, pd.DataFrame):
         return df.to_csv(sep="\t", index=False, header=None)
@@ -359,7 +365,72 @@ def read_statistics_csv(content) -> List[schemas.FileStatistics]:
     return result
 
 
-def read_file(zip_file: Union[BytesIO, str]):
+def decrypt_txt(content: bytes) -> str:
+    return decrypt(
+        settings.TXT_FILE_AES_KEY,
+        settings.TXT_FILE_AES_IV,
+        content,
+    ).decode("utf8")
+
+
+def read_waveform(content: bytes) -> pd.DataFrame:
+    return pd.read_csv(StringIO(decrypt_txt(content)), header=None, sep="\t")
+
+
+def read_image(content: bytes) -> BytesIO:
+    return BytesIO(content)
+
+
+class LazyMember:
+    """
+    A zip member which is read, decrypted and parsed only when it is accessed.
+
+    The parsed value is not cached, so at most one large member is held in
+    memory at a time as long as callers don't keep the returned value around.
+    """
+
+    def __init__(self, measure_zip: ZipFile, filename: str, loader: Callable):
+        self.measure_zip = measure_zip
+        self.filename = filename
+        self.loader = loader
+
+    def load(self):
+        with self.measure_zip.open(self.filename, mode="r") as f:
+            content = f.read()
+        return self.loader(content)
+
+
+class LazyResultDict(dict):
+    """result dict of `read_file(lazy=True)`, resolves `LazyMember` on access"""
+
+    measure_zip: Optional[ZipFile] = None
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, LazyMember):
+            return value.load()
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def close(self):
+        if self.measure_zip is not None:
+            self.measure_zip.close()
+
+
+def read_file(zip_file: Union[BytesIO, str, BinaryIO], lazy: bool = False):
+    """
+    Read a measurement zip.
+
+    With `lazy=True`, the small metadata files (infos, report, BCQ, statistics,
+    ver.ini) are parsed up front so validation errors are reported before any
+    write, while the 6s/all_s waveform files and the tongue images are only
+    decrypted and parsed when accessed from the returned dict. The zip file
+    object must stay open while the result is in use.
+    """
     # TODO: detect //, \\, ..
     txt_filename_list_format_dict = {
         "infos.txt": schemas.FileInfos,
@@ -438,8 +509,9 @@ def read_file(zip_file: Union[BytesIO, str]):
     )
 
     checked_file_list = []
-    result_dict = {"error_msg": ""}
-    with ZipFile(zip_file, mode="r") as measure_zip:
+    result_dict = LazyResultDict(error_msg="") if lazy else {"error_msg": ""}
+    measure_zip = ZipFile(zip_file, mode="r")
+    try:
         infolist = measure_zip.infolist()
         for file_info in infolist:
             if not file_info.is_dir():
@@ -450,70 +522,134 @@ def read_file(zip_file: Union[BytesIO, str]):
             file_name_p = Path(file_info.filename)
             file_name = file_name_p.name
             print(file_name)
-            if file_name in allowd_filename_list:
-                with measure_zip.open(file_info.filename, mode="r") as f:
-                    content = f.read()
-
-                if file_name_p.suffix == ".txt":
-                    decrypted_data = decrypt(
-                        settings.TXT_FILE_AES_KEY,
-                        settings.TXT_FILE_AES_IV,
-                        content,
+            if file_name not in allowd_filename_list:
+                continue
+
+            if file_name in validates_6s or file_name in validates_all_s:
+                side = None
+                if "Left" in str(file_name_p):
+                    side = "left"
+                elif "Right" in str(file_name_p):
+                    side = "right"
+                else:
+                    result_dict["error_msg"] += f"invalid side: {file_name_p};"
+                if lazy:
+                    result_dict[f"{side}/{file_name}"] = LazyMember(
+                        measure_zip=measure_zip,
+                        filename=file_info.filename,
+                        loader=read_waveform,
                     )
-                    decoded_data = decrypted_data.decode("utf8")
-                    schema_in = txt_filename_list_format_dict.get(file_name)
-                    if schema_in:
-                        try:
-                            dict_obj = parse_content(decoded_data)
-                            # TODO: check provided columns
-                            result_dict[file_name] = schema_in(**dict_obj)
-                        except Exception as e:
-                            result_dict["error_msg"] += f"{file_name}:{e};"
-                    elif file_name in validates_6s or file_name in validates_all_s:
-                        df = pd.read_csv(StringIO(decoded_data), header=None, sep="\t")
-                        side = None
-                        if "Left" in str(file_name_p):
-                            side = "left"
-                        elif "Right" in str(file_name_p):
-                            side = "right"
-                        else:
-                            result_dict["error_msg"] += f"invalid side: {file_name_p};"
-                        result_dict[f"{side}/{file_name}"] = df
-
-                elif file_name == statistics_file:
+                else:
+                    with measure_zip.open(file_info.filename, mode="r") as f:
+                        result_dict[f"{side}/{file_name}"] = read_waveform(f.read())
+                continue
+
+            if file_name in image_file_list:
+                if lazy:
+                    result_dict[file_name] = LazyMember(
+                        measure_zip=measure_zip,
+                        filename=file_info.filename,
+                        loader=read_image,
+                    )
+                else:
+                    with measure_zip.open(file_info.filename, mode="r") as f:
+                        result_dict[file_name] = read_image(f.read())
+                continue
+
+            with measure_zip.open(file_info.filename, mode="r") as f:
+                content = f.read()
+
+            if file_name in txt_filename_list_format_dict:
+                schema_in = txt_filename_list_format_dict[file_name]
+                decoded_data = decrypt_txt(content)
+                try:
+                    dict_obj = parse_content(decoded_data)
+                    # TODO: check provided columns
+                    result_dict[file_name] = schema_in(**dict_obj)
+                except Exception as e:
+                    result_dict["error_msg"] += f"{file_name}:{e};"
+
+            elif file_name == statistics_file:
+                try:
+                    result_dict[file_name] = read_statistics_csv(
+                        content=content.decode("utf8"),
+                    )
+                except Exception as e:
+                    print("read plain statistics file error: ", e)
                     try:
                         result_dict[file_name] = read_statistics_csv(
-                            content=content.decode("utf8"),
+                            content=decrypt_txt(content),
                         )
                     except Exception as e:
-                        print("read plain statistics file error: ", e)
-                        try:
-                            result_dict[file_name] = read_statistics_csv(
-                                content=decrypt(
-                                    settings.TXT_FILE_AES_KEY,
-                                    settings.TXT_FILE_AES_IV,
-                                    content,
-                                ).decode("utf8"),
-                            )
-                        except Exception as e:
-                            print("read enctrypted statistics file error: ", e)
-                            raise Exception(
-                                f"read enctrypted statistics file error: {e}",
-                            )
-
-                elif file_name in image_file_list:
-                    result_dict[file_name] = BytesIO(content)
-
-                elif file_name == "ver.ini":
-                    decrypted_data = decrypt(
-                        settings.TXT_FILE_AES_KEY,
-                        settings.TXT_FILE_AES_IV,
-                        content,
-                    )
-                    decoded_data = decrypted_data.decode("utf8")
-                    result_dict[file_name] = decoded_data
+                        print("read enctrypted statistics file error: ", e)
+                        raise Exception(
+                            f"read enctrypted statistics file error: {e}",
+                        )
+
+            elif file_name == version_file:
+                result_dict[file_name] = decrypt_txt(content)
+    except Exception:
+        measure_zip.close()
+        raise
+
+    if lazy:
+        result_dict.measure_zip = measure_zip
+    else:
+        measure_zip.close()
+    return result_dict
+
 
-        return result_dict
+def get_measure_raw_data(result_dict) -> Dict[str, Any]:
+    """
+    MeasureRaw columns, both the text and the binary encoding of each channel
+    and the precomputed scatter charts
+    """
+    if MEASURE_RAW_DATA_KEY in result_dict:
+        # already computed by `core.reprocess.parse_measure_zip`
+        return result_dict[MEASURE_RAW_DATA_KEY]
+
+    # parse one channel at a time, so that with a lazy result only one
+    # waveform DataFrame is alive at once
+    chart_keys = {field: key for key, field in ANALYZE_RAW_CHART_FIELDS.items()}
+    raw_data = {}
+    charts = {}
+    for field, key in MEASURE_RAW_FIELD_FILE_DICT.items():
+        df = result_dict.get(key)
+        raw_data[field] = serialize(df)
+        data = to_waveform_array(df, np.float64)
+        raw_data[WAVEFORM_BIN_FIELDS[field]] = encode_waveform(
+            data,
+            compress=settings.MEASURE_RAW_COMPRESS,
+        )
+        if field in chart_keys:
+            # from the parsed values, the binary column only keeps float32
+            charts[chart_keys[field]] = get_scatter_chart(data)
+    # the summary page serves these charts as is
+    raw_data["all_sec_analyze_chart"] = charts
+    return raw_data
+
+
+def get_measure_raw_columns(raw_data) -> Dict[str, Any]:
+    """
+    MeasureRaw columns of `get_measure_raw_data` to write, without the text
+    waveforms unless MEASURE_RAW_WRITE_TEXT is set
+    """
+    if settings.MEASURE_RAW_WRITE_TEXT:
+        return raw_data
+    return {
+        key: value for key, value in raw_data.items() if key not in WAVEFORM_BIN_FIELDS
+    }
+
+
+def get_measure_raw_tiles(result_dict, raw_data) -> List[Dict[str, Any]]:
+    """MeasureRawTile rows of the analyze raw channels, see `core.tile`"""
+    if MEASURE_RAW_TILES_KEY in result_dict:
+        # already computed by `core.reprocess.parse_measure_zip`
+        return result_dict[MEASURE_RAW_TILES_KEY]
+    return get_analyze_raw_tiles(
+        SimpleNamespace(**raw_data),
+        compress=settings.MEASURE_RAW_COMPRESS,
+    )
 
 
 async def process_file(
@@ -521,16 +657,46 @@ async def process_file(
     zip_file: BinaryIO,
     overwrite: bool,
     db_session: AsyncSession = None,
+    lazy: bool = False,
+    autocommit: bool = True,
 ):
+    """
+    Read a measurement zip and write it as one unit of work.
+
+    All rows of the zip are committed together (or rolled back together) when
+    `autocommit` is set. Without it the zip is written inside a savepoint and
+    the caller commits, e.g. to commit several zips at once in a backfill.
+    """
     result_dict = {}
     try:
-        result_dict = read_file(zip_file)
+        result_dict = read_file(zip_file, lazy=lazy)
     except Exception as e:
         import traceback
 
         print("file error: ", e, traceback.format_exc())
         return {"error_msg": result_dict.get("error_msg", str(e))}
 
+    try:
+        return await write_result(
+            file=file,
+            result_dict=result_dict,
+            overwrite=overwrite,
+            db_session=db_session,
+            autocommit=autocommit,
+        )
+    finally:
+        if isinstance(result_dict, LazyResultDict):
+            result_dict.close()
+
+
+async def write_result(
+    file: models.File,
+    result_dict: dict,
+    overwrite: bool,
+    db_session: AsyncSession = None,
+    autocommit: bool = True,
+):
+    """write the result of `read_file`, see `process_file`"""
     if not result_dict:
         print("no result")
         return
@@ -539,6 +705,38 @@ async def process_file(
         print("file error: ", result_dict["error_msg"])
         return {"error_msg": result_dict["error_msg"]}
 
+    db_session = db_session or SessionLocal()
+    if not autocommit:
+        async with db_session.begin_nested():
+            return await write_measure(
+                file=file,
+                result_dict=result_dict,
+                overwrite=overwrite,
+                db_session=db_session,
+                autocommit=False,
+            )
+
+    try:
+        return await write_measure(
+            file=file,
+            result_dict=result_dict,
+            overwrite=overwrite,
+            db_session=db_session,
+        )
+    except Exception:
+        await db_session.rollback()
+        raise
+
+
+async def write_measure(
+    file: models.File,
+    result_dict: dict,
+    overwrite: bool,
+    db_session: AsyncSession = None,
+    autocommit: bool = True,
+):
+    # every row is staged with autocommit=False and flushed once before the
+    # statistics bulk upsert, so a crash never leaves a half-written measure
     checked = data_integrity_check(result_dict)
     if not checked:
         raise Exception("checked error")
@@ -568,7 +766,11 @@ async def process_file(
             number=infos.number,
             is_active=True,
         )
-        subject = await crud.subject.create(db_session=db_session, obj_in=subject_in)
+        subject = await crud.subject.create(
+            db_session=db_session,
+            obj_in=subject_in,
+            autocommit=False,
+        )
     else:
         # TODO: check survey data
         subject_in = schemas.SubjectUpdate(
@@ -583,6 +785,7 @@ async def process_file(
             db_session=db_session,
             obj_current=subject,
             obj_new=subject_in,
+            autocommit=False,
         )
 
     # unique key: check subject_id (org_id, sid) + measure_time
@@ -630,32 +833,34 @@ async def process_file(
     if overwrite and measure_info:
         print("start deleting...")
         await db_session.delete(measure_info)
-        await db_session.commit()
+        # flush the delete before inserting the new measure with the same keys
+        await db_session.flush()
         print("deleted")
 
+    raw_data = get_measure_raw_data(result_dict)
     max_amp_value_l_cu = get_max_amp_value(
         infos.select_static_l_cu,
-        serialize(result_dict.get("left/analyze_raw_Cu.txt")),
+        raw_data["all_sec_analyze_raw_l_cu"],
     )
     max_amp_value_l_qu = get_max_amp_value(
         infos.select_static_l_qu,
-        serialize(result_dict.get("left/analyze_raw_Qu.txt")),
+        raw_data["all_sec_analyze_raw_l_qu"],
     )
     max_amp_value_l_ch = get_max_amp_value(
         infos.select_static_l_ch,
-        serialize(result_dict.get("left/analyze_raw_Ch.txt")),
+        raw_data["all_sec_analyze_raw_l_ch"],
     )
     max_amp_value_r_cu = get_max_amp_value(
         infos.select_static_r_cu,
-        serialize(result_dict.get("right/analyze_raw_Cu.txt")),
+        raw_data["all_sec_analyze_raw_r_cu"],
     )
     max_amp_value_r_qu = get_max_amp_value(
         infos.select_static_r_qu,
-        serialize(result_dict.get("right/analyze_raw_Qu.txt")),
+        raw_data["all_sec_analyze_raw_r_qu"],
     )
     max_amp_value_r_ch = get_max_amp_value(
         infos.select_static_r_ch,
-        serialize(result_dict.get("right/analyze_raw_Ch.txt")),
+        raw_data["all_sec_analyze_raw_r_ch"],
     )
     width_value_l_cu = safe_divide(infos.range_length_l_cu, 0.2)
     width_value_l_qu = safe_divide(infos.range_length_l_qu, 0.2)
@@ -901,6 +1106,7 @@ async def process_file(
         measure_info = await crud.measure_info.create(
             db_session=db_session,
             obj_in=measure_info_in,
+            autocommit=False,
         )
     else:
         has_bcq = "BCQ.txt" in result_dict or measure_info.bcq is not None
@@ -1128,6 +1334,7 @@ async def process_file(
             db_session=db_session,
             obj_current=measure_info,
             obj_new=measure_info_in,
+            autocommit=False,
         )
 
     if "BCQ.txt" in result_dict:
@@ -1140,7 +1347,11 @@ async def process_file(
                 **bcq.dict(),
                 measure_id=measure_info.id,
             )
-            bcq = await crud.measure_bcq.create(db_session=db_session, obj_in=bcq_in)
+            bcq = await crud.measure_bcq.create(
+                db_session=db_session,
+                obj_in=bcq_in,
+                autocommit=False,
+            )
 
     # tongue
     if "report.txt" in result_dict:
@@ -1148,24 +1359,29 @@ async def process_file(
             db_session=db_session,
             measure_id=measure_info.id,
         )
-        up_img_uri = None
-        down_img_uri = None
-        if "T_up.jpg" in result_dict:
-            obj_path = f"{subject.id}/{measure_info.id}/T_up.jpg"
-            up_img_uri = upload_blob_file(
-                blob_service_client=internet_blob_service,
-                category=settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE,
-                file_path=obj_path,
-                object=result_dict["T_up.jpg"],
-            )
-        if "T_down.jpg" in result_dict:
-            obj_path = f"{subject.id}/{measure_info.id}/T_down.jpg"
-            down_img_uri = upload_blob_file(
-                blob_service_client=internet_blob_service,
-                category=settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE,
-                file_path=obj_path,
-                object=result_dict["T_down.jpg"],
+        image_uris = {}
+        for image_name in ("T_up.jpg", "T_down.jpg"):
+            if image_name in result_dict:
+                image_uris[image_name] = f"{subject.id}/{measure_info.id}/{image_name}"
+        # both images are uploaded concurrently
+        await internet_blob_store.upload_many(
+            [
+                (
+                    settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE,
+                    obj_path,
+                    result_dict[image_name],
+                )
+                for image_name, obj_path in image_uris.items()
+            ],
+        )
+        if image_uris:
+            # resized by a worker, not in the transaction of the measure
+            celery_app.send_task(
+                "auo_project.services.celery.tasks.task_generate_image_derivatives",
+                kwargs={"source_locs": list(image_uris.values())},
             )
+        up_img_uri = image_uris.get("T_up.jpg")
+        down_img_uri = image_uris.get("T_down.jpg")
         if tongue is None:
             tongue_in = schemas.MeasureTongueCreate(
                 **report.dict(),
@@ -1176,28 +1392,9 @@ async def process_file(
             tongue = await crud.measure_tongue.create(
                 db_session=db_session,
                 obj_in=tongue_in,
+                autocommit=False,
             )
 
-    if "statistics.csv" in result_dict:
-        records = result_dict["statistics.csv"]
-        for record in records:
-            statistic = await crud.measure_statistic.get_by_uniq_keys(
-                db_session=db_session,
-                measure_id=measure_info.id,
-                statistic=record.statistic,
-                hand=record.hand,
-                position=record.position,
-            )
-            if not statistic:
-                statistic_in = schemas.MeasureStatisticCreate(
-                    **record.dict(),
-                    measure_id=measure_info.id,
-                )
-                await crud.measure_statistic.create(
-                    db_session=db_session,
-                    obj_in=statistic_in,
-                )
-
     # 6s
     measure_raw = await crud.measure_raw.get_by_measure_id(
         db_session=db_session,
@@ -1207,37 +1404,44 @@ async def process_file(
     if not measure_raw:
         measure_raw_in = schemas.MeasureRawCreate(
             measure_id=measure_info.id,
-            six_sec_l_cu=serialize(result_dict.get("left/6s_cu.txt")),
-            six_sec_l_qu=serialize(result_dict.get("left/6s_qu.txt")),
-            six_sec_l_ch=serialize(result_dict.get("left/6s_ch.txt")),
-            six_sec_r_cu=serialize(result_dict.get("right/6s_cu.txt")),
-            six_sec_r_qu=serialize(result_dict.get("right/6s_qu.txt")),
-            six_sec_r_ch=serialize(result_dict.get("right/6s_ch.txt")),
-            all_sec_analyze_raw_l_cu=serialize(
-                result_dict.get("left/analyze_raw_Cu.txt"),
-            ),
-            all_sec_analyze_raw_l_qu=serialize(
-                result_dict.get("left/analyze_raw_Qu.txt"),
-            ),
-            all_sec_analyze_raw_l_ch=serialize(
-                result_dict.get("left/analyze_raw_Ch.txt"),
-            ),
-            all_sec_analyze_raw_r_cu=serialize(
-                result_dict.get("right/analyze_raw_Cu.txt"),
-            ),
-            all_sec_analyze_raw_r_qu=serialize(
-                result_dict.get("right/analyze_raw_Qu.txt"),
-            ),
-            all_sec_analyze_raw_r_ch=serialize(
-                result_dict.get("right/analyze_raw_Ch.txt"),
-            ),
+            **get_measure_raw_columns(raw_data),
         )
         measure_raw = await crud.measure_raw.create(
             db_session=db_session,
             obj_in=measure_raw_in,
+            autocommit=False,
+        )
+        await crud.measure_raw_tile.replace_all(
+            db_session=db_session,
+            measure_id=measure_info.id,
+            tiles=get_measure_raw_tiles(result_dict, raw_data),
+            autocommit=False,
         )
 
-    await db_session.close()
+    await db_session.flush()
+
+    if "statistics.csv" in result_dict:
+        await crud.measure_statistic.upsert_many(
+            db_session=db_session,
+            measure_id=measure_info.id,
+            objs_in=result_dict["statistics.csv"],
+            autocommit=False,
+        )
+        await crud.measure_statistic_wide.refresh(
+            db_session=db_session,
+            measure_ids=[measure_info.id],
+            autocommit=False,
+        )
+        # counted in the norms by the next fold, outside of this transaction
+        await crud.measure_cn_mean_aggregate.enqueue(
+            db_session=db_session,
+            measure_ids=[measure_info.id],
+            autocommit=False,
+        )
+
+    if autocommit:
+        await db_session.commit()
+        await db_session.close()
 
     return True
 
@@ -1246,56 +1450,176 @@ async def get_and_write(
     db_session: AsyncSession,
     file_id: UUID,
     overwrite: bool = True,
+    streaming: bool = settings.MEASURE_ZIP_STREAMING,
 ):
+    """
+    Download a measurement zip and write it to the database.
+
+    In streaming mode the blob is written chunk by chunk into a spooled temp
+    file and the waveform/image members are parsed lazily one at a time. Peak
+    memory per zip is then roughly bounded by:
+
+    - `MEASURE_ZIP_SPOOL_MAX_SIZE` for the zip itself (the rest spills to disk)
+    - one member (at most 20 MB, see `is_valid_file`) plus its decrypted text
+      and parsed DataFrame
+    - the serialized MeasureRaw channels, which are written in a single row
+
+    instead of the whole zip plus every parsed member at once.
+    """
     file = await crud.file.get(db_session=db_session, id=file_id)
     if not file:
         raise Exception(f"not found file id: {file_id}")
 
-    # download blob
-    downloader = download_zip_file(private_blob_service, file.location)
-    zip_file = BytesIO(downloader.readall())
-    result = await process_file(file, zip_file, overwrite, db_session)
+    result = await download_and_process_file(
+        db_session=db_session,
+        file=file,
+        overwrite=overwrite,
+        streaming=streaming,
+    )
     # TODO: design error log table
     print("result:", result)
-    if result:
-        if isinstance(result, dict):
-            error_msg = result.get("error_msg", "")
-            if error_msg:
-                file_in = schemas.FileUpdate(
-                    file_status=FileStatusType.success.value,
-                    is_valid=False,
-                    memo=error_msg,
+    await update_file_status(db_session=db_session, file=file, result=result)
+
+
+async def get_and_write_batch(
+    db_session: AsyncSession,
+    file_ids: List[UUID],
+    overwrite: bool = True,
+    batch_size: int = 20,
+    streaming: bool = settings.MEASURE_ZIP_STREAMING,
+) -> List[UUID]:
+    """
+    Write several measurement zips, committing once every `batch_size` zips.
+
+    Each zip is written in its own savepoint, so a zip which fails only rolls
+    back itself. Returns the ids of the failed files.
+    """
+    failed_file_ids = []
+    for i in range(0, len(file_ids), batch_size):
+        for file_id in file_ids[i : i + batch_size]:
+            file = await crud.file.get(db_session=db_session, id=file_id)
+            if not file:
+                print(f"not found file id: {file_id}")
+                failed_file_ids.append(file_id)
+                continue
+            try:
+                result = await download_and_process_file(
+                    db_session=db_session,
+                    file=file,
+                    overwrite=overwrite,
+                    streaming=streaming,
+                    autocommit=False,
                 )
-        else:
+            except Exception as e:
+                import traceback
+
+                print("file error: ", file_id, e, traceback.format_exc())
+                failed_file_ids.append(file_id)
+                continue
+            await update_file_status(
+                db_session=db_session,
+                file=file,
+                result=result,
+                autocommit=False,
+            )
+        await db_session.commit()
+    return failed_file_ids
+
+
+async def download_and_process_file(
+    db_session: AsyncSession,
+    file: models.File,
+    overwrite: bool,
+    streaming: bool = settings.MEASURE_ZIP_STREAMING,
+    autocommit: bool = True,
+):
+    # download blob, the azure client blocks so it runs off the event loop
+    loop = asyncio.get_running_loop()
+    if streaming:
+        spooled_file = await loop.run_in_executor(
+            get_executor(),
+            spool_zip_file,
+            private_blob_service,
+            file.location,
+        )
+        with spooled_file as zip_file:
+            return await process_file(
+                file,
+                zip_file,
+                overwrite,
+                db_session,
+                lazy=True,
+                autocommit=autocommit,
+            )
+
+    def download():
+        return download_zip_file(private_blob_service, file.location).readall()
+
+    zip_file = BytesIO(await loop.run_in_executor(get_executor(), download))
+    return await process_file(
+        file,
+        zip_file,
+        overwrite,
+        db_session,
+        autocommit=autocommit,
+    )
+
+
+async def update_file_status(
+    db_session: AsyncSession,
+    file: models.File,
+    result,
+    autocommit: bool = True,
+):
+    if not result:
+        return
+
+    if isinstance(result, dict):
+        error_msg = result.get("error_msg", "")
+        if error_msg:
             file_in = schemas.FileUpdate(
                 file_status=FileStatusType.success.value,
-                is_valid=True,
-                memo="",
+                is_valid=False,
+                memo=error_msg,
             )
-        await crud.file.update(db_session=db_session, obj_current=file, obj_new=file_in)
-        is_all_files_success = await crud.upload.is_files_all_success(
+    else:
+        file_in = schemas.FileUpdate(
+            file_status=FileStatusType.success.value,
+            is_valid=True,
+            memo="",
+        )
+    await crud.file.update(
+        db_session=db_session,
+        obj_current=file,
+        obj_new=file_in,
+        autocommit=autocommit,
+    )
+    if not autocommit:
+        await db_session.flush()
+    is_all_files_success = await crud.upload.is_files_all_success(
+        db_session=db_session,
+        upload_id=file.upload_id,
+    )
+
+    if is_all_files_success:
+        display_file_number = await crud.upload.get_display_file_number(
             db_session=db_session,
             upload_id=file.upload_id,
         )
+        upload_in = schemas.UploadUpdate(
+            upload_status=UploadStatusType.success.value,
+            end_to=datetime.utcnow(),
+            display_file_number=display_file_number,
+        )
+        await crud.upload.update(
+            db_session=db_session,
+            obj_current=file.upload,
+            obj_new=upload_in,
+            autocommit=autocommit,
+        )
 
-        if is_all_files_success:
-            display_file_number = await crud.upload.get_display_file_number(
-                db_session=db_session,
-                upload_id=file.upload_id,
-            )
-            upload_in = schemas.UploadUpdate(
-                upload_status=UploadStatusType.success.value,
-                end_to=datetime.utcnow(),
-                display_file_number=display_file_number,
-            )
-            await crud.upload.update(
-                db_session=db_session,
-                obj_current=file.upload,
-                obj_new=upload_in,
-            )
 
+async def process_dir(dir: str, **kwargs):
+    from auo_project.core.reprocess import reprocess_dir
 
-async def process_dir(dir: str):
-    zip_folder = Path(dir)
-    for zip_file in zip_folder.glob("*.zip"):
-        await process_file(zip_file, overwrite=False)
+    return await reprocess_dir(zip_dir=Path(dir), **kwargs)
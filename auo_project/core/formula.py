@@ -0,0 +1,112 @@
+"""
+Registry of the custom formulas in measure.custom_formulas.
+
+Each formula code string is compiled and executed once per version of the
+row, i.e. its `updated_at`, instead of on every request. A worker checks the
+version at most every CUSTOM_FORMULA_CACHE_TTL seconds, so a formula saved
+from `streamlit/update_formula.py` (which bumps `updated_at`) is picked up by
+every worker within that time.
+"""
+from datetime import datetime
+from time import monotonic
+from typing import Callable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+
+from auo_project.core.config import settings
+from auo_project.core.constants import MAX_DEPTH_RATIO
+from auo_project.core.utils import get_hr_type, get_measure_strength, get_measure_width
+from auo_project.db.session import AsyncSession
+
+
+class FormulaSet(NamedTuple):
+    max_depth_ratio: Tuple[int, int, int]
+    get_strength: Callable
+    get_width: Callable
+    get_hr_type: Callable
+
+
+DEFAULT_FORMULAS = FormulaSet(
+    max_depth_ratio=MAX_DEPTH_RATIO,
+    get_strength=get_measure_strength,
+    get_width=get_measure_width,
+    get_hr_type=get_hr_type,
+)
+
+# per process cache: version (updated_at), formulas and last version check
+_cache = {"version": None, "formulas": None, "checked_at": 0.0}
+
+
+def compile_formula(code_string: str, name: str, default: Callable) -> Callable:
+    try:
+        code = compile(code_string, f"<custom_formulas.{name}>", "exec")
+        ns = {}
+        exec(code, {"__builtins__": {}}, ns)
+        return ns[f"get_custom_{name}"]
+    except Exception as e:
+        print(f"{name}_code_string error:", e)
+        return default
+
+
+def compile_formulas(row) -> FormulaSet:
+    """FormulaSet of a measure.custom_formulas row, defaults for invalid parts"""
+    max_depth_ratio = MAX_DEPTH_RATIO
+    try:
+        max_depth_ratio = tuple(map(int, row.max_depth_ratio.split(":")))
+        if len(max_depth_ratio) != 3:
+            raise Exception("max_depth_ratio length must be 3")
+        print("max_depth_ratio", max_depth_ratio)
+    except Exception as e:
+        print("max_depth_ratio error:", e)
+        max_depth_ratio = MAX_DEPTH_RATIO
+
+    return FormulaSet(
+        max_depth_ratio=max_depth_ratio,
+        get_strength=compile_formula(
+            row.strength_code,
+            "strength",
+            get_measure_strength,
+        ),
+        get_width=compile_formula(row.width_code, "width", get_measure_width),
+        get_hr_type=compile_formula(row.hr_type_code, "hr_type", get_hr_type),
+    )
+
+
+async def get_formula_version(db_session: AsyncSession) -> Optional[datetime]:
+    resp = await db_session.execute(
+        text("select max(updated_at) from measure.custom_formulas"),
+    )
+    return resp.scalar()
+
+
+async def get_custom_formulas(db_session: AsyncSession) -> FormulaSet:
+    now = monotonic()
+    formulas = _cache["formulas"]
+    if formulas and now - _cache["checked_at"] < settings.CUSTOM_FORMULA_CACHE_TTL:
+        return formulas
+
+    version = await get_formula_version(db_session)
+    _cache["checked_at"] = now
+    if formulas and version == _cache["version"]:
+        return formulas
+
+    resp = await db_session.execute(
+        text(
+            """
+        select
+            max_depth_ratio,
+            strength_code,
+            width_code,
+            hr_type_code
+        from measure.custom_formulas
+        """,
+        ),
+    )
+    row = resp.fetchone()
+    formulas = DEFAULT_FORMULAS if row is None else compile_formulas(row)
+    _cache.update(version=version, formulas=formulas)
+    return formulas
+
+
+def clear_formula_cache() -> None:
+    _cache.update(version=None, formulas=None, checked_at=0.0)
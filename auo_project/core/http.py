@@ -0,0 +1,181 @@
+"""
+Shared async http clients of the external tongue services.
+
+A `ServiceClient` keeps one `httpx.AsyncClient` with a keep alive connection
+pool per event loop (see `auo_project.services.celery.loop` for the loop of
+the celery tasks) and limits the requests in flight to `max_concurrency`.
+Every request is timed in the latency histogram of `ServiceClient.metrics`.
+
+`poll` waits for an asynchronous result with jittered exponential backoff
+using `asyncio.sleep`, so a slow result no longer blocks the worker.
+
+Tests point a service at the stub of `auo_project.tests.stub_services` with
+`set_transport(httpx.ASGITransport(app=...))`.
+"""
+import asyncio
+import random
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+import httpx
+
+from auo_project.core.config import settings
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class LatencyMetrics:
+    """latency histogram, status codes and errors of the requests of a service"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # the last count is for latencies above the last bucket
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.seconds = 0.0
+            self.statuses: Dict[int, int] = {}
+            self.errors = 0
+
+    def record(self, seconds: float, status_code: Optional[int] = None):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.seconds += seconds
+            if status_code is None:
+                self.errors += 1
+            else:
+                self.statuses[status_code] = self.statuses.get(status_code, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            count = sum(self.counts)
+            return {
+                "count": count,
+                "seconds": self.seconds,
+                "mean_seconds": self.seconds / count if count else 0.0,
+                "buckets": {
+                    **{str(le): n for le, n in zip(self.buckets, self.counts)},
+                    "inf": self.counts[-1],
+                },
+                "statuses": dict(self.statuses),
+                "errors": self.errors,
+            }
+
+
+class ServiceClient:
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        max_concurrency: int = settings.SERVICE_MAX_CONCURRENCY,
+        timeout: float = 120,
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.transport: Optional[httpx.AsyncBaseTransport] = None
+        self.metrics = LatencyMetrics()
+        # event loop: (client, semaphore)
+        self._clients = WeakKeyDictionary()
+
+    def set_transport(self, transport: Optional[httpx.AsyncBaseTransport]):
+        """send the requests through another transport, e.g. a stub app"""
+        self.transport = transport
+        self._clients = WeakKeyDictionary()
+
+    def _get_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client[0].is_closed:
+            client = (
+                httpx.AsyncClient(
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency,
+                    ),
+                    transport=self.transport,
+                ),
+                asyncio.Semaphore(self.max_concurrency),
+            )
+            self._clients[loop] = client
+        return client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        client, semaphore = self._get_client()
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except Exception:
+                self.metrics.record(time.perf_counter() - start)
+                raise
+            self.metrics.record(time.perf_counter() - start, response.status_code)
+            return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def poll(
+        self,
+        url: str,
+        timeout: float,
+        is_done: Callable[[httpx.Response], bool] = lambda r: r.status_code == 200,
+        interval: float = 0.5,
+        max_interval: float = 5,
+        request_timeout: float = 5,
+    ) -> Optional[httpx.Response]:
+        """
+        GET `url` until `is_done(response)` or `timeout` seconds passed, sleeping
+        a jittered, doubling interval in between. Returns None on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            try:
+                response = await self.get(url, timeout=request_timeout)
+                if is_done(response):
+                    return response
+            except httpx.TransportError as e:
+                print(f"{self.name} poll {url} error: {e!r}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            delay = min(max_interval, interval * 2**attempt)
+            await asyncio.sleep(min(remaining, random.uniform(delay / 2, delay)))
+            attempt += 1
+
+    async def aclose(self):
+        """close the client of the running event loop"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client[0].aclose()
+
+
+color_card_service = ServiceClient(
+    "color_card",
+    settings.TONGUE_COLOR_CARD_API_URL,
+)
+tongue_ai_service = ServiceClient(
+    "tongue_ai",
+    settings.TONGUE_AI_API_URL,
+    max_concurrency=settings.TONGUE_AI_MAX_CONCURRENCY,
+)
+tongue_cc_service = ServiceClient("tongue_cc", settings.TONGUE_CC_API_URL)
+
+services = (color_card_service, tongue_ai_service, tongue_cc_service)
+
+
+def get_services_metrics() -> Dict[str, Dict[str, Any]]:
+    return {service.name: service.metrics.snapshot() for service in services}
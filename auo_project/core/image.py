@@ -0,0 +1,64 @@
+"""
+Decode a tongue image once and encode it only at the service boundary.
+
+`NormalizedImage` keeps the uploaded bytes, the decoded PIL image and, on
+demand, its numpy array and PNG encoding, so a step of the tongue pipeline
+that needs the pixels, the format or a file for a service reuses the same
+decode instead of calling `Image.open` again. A PNG upload is passed on as
+is, any other format is encoded once with TONGUE_PNG_COMPRESS_LEVEL.
+"""
+import asyncio
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from auo_project.core.blob import get_executor
+from auo_project.core.config import settings
+
+
+class NormalizedImage:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.image = Image.open(BytesIO(content))
+        self.format = self.image.format
+        self._array: Optional[np.ndarray] = None
+        self._png: Optional[bytes] = None
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def array(self) -> np.ndarray:
+        if self._array is None:
+            self._array = np.asarray(self.image)
+        return self._array
+
+    def to_png(self, compress_level: Optional[int] = None) -> bytes:
+        if self.format == "PNG":
+            return self.content
+        if self._png is None:
+            if compress_level is None:
+                compress_level = settings.TONGUE_PNG_COMPRESS_LEVEL
+            output = BytesIO()
+            self.image.save(output, "PNG", compress_level=compress_level)
+            self._png = output.getvalue()
+        return self._png
+
+    def png_file(self) -> BytesIO:
+        """a new file of the PNG encoding, e.g. for a multipart upload"""
+        return BytesIO(self.to_png())
+
+
+def normalize_image(content: bytes) -> NormalizedImage:
+    """decode and PNG encode, runs in a worker"""
+    image = NormalizedImage(content)
+    image.to_png()
+    return image
+
+
+async def load_image(content: bytes) -> NormalizedImage:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), normalize_image, content)
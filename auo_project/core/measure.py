@@ -1,88 +1,118 @@
+import hashlib
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from auo_project import crud
+from auo_project.core.config import settings
 from auo_project.web.api import deps
 
 
+async def fold_measure_cn_means() -> int:
+    """
+    Count the measures written since the last fold in the running aggregates,
+    CN_MEANS_FOLD_BATCH_SIZE per transaction so the aggregate rows are only
+    locked briefly. Returns how many were counted.
+    """
+    count = 0
+    async with deps.get_db2() as db_session:
+        while True:
+            folded = await crud.measure_cn_mean_aggregate.fold(
+                db_session=db_session,
+                limit=settings.CN_MEANS_FOLD_BATCH_SIZE,
+            )
+            count += folded
+            if folded < settings.CN_MEANS_FOLD_BATCH_SIZE:
+                break
+    return count
+
+
 async def update_measure_cn_means():
+    """
+    Write measure.overall_means from the running aggregates of the MEAN
+    statistic, kept by `crud.measure_cn_mean_aggregate.sync` when a measure
+    is activated or deactivated and by `fold_measure_cn_means` after it is
+    written. The pending measures, then the measures whose info or subject
+    changed in the last CN_MEANS_RECONCILE_DAYS days, or deleted, are counted
+    again first for the changes made without a sync.
+    """
+    await fold_measure_cn_means()
     async with deps.get_db2() as db_session:
-        stat = """
-    with t as (
-        select
-            stat.hand,
-            stat.position,
-            sub.sex,
-            count(1) as cnt,
-            avg(stat.a0) as a0,
-            avg(stat.c1) as c1,
-            avg(stat.c2) as c2,
-            avg(stat.c3) as c3,
-            avg(stat.c4) as c4,
-            avg(stat.c5) as c5,
-            avg(stat.c6) as c6,
-            avg(stat.c7) as c7,
-            avg(stat.c8) as c8,
-            avg(stat.c9) as c9,
-            avg(stat.c10) as c10,
-            avg(stat.c11) as c11,
-            avg(stat.p1) as p1,
-            avg(stat.p2) as p2,
-            avg(stat.p3) as p3,
-            avg(stat.p4) as p4,
-            avg(stat.p5) as p5,
-            avg(stat.p6) as p6,
-            avg(stat.p7) as p7,
-            avg(stat.p8) as p8,
-            avg(stat.p9) as p9,
-            avg(stat.p10) as p10,
-            avg(stat.p11) as p11
-        from measure.statistics as stat
-        inner join measure.infos as info on info.id = stat.measure_id
-        inner join measure.subjects as sub on sub.id = info.subject_id
-        where sub.sex is not null
-        and stat.statistic = 'MEAN'
-        group by
-            stat.hand,
-            stat.position,
-            sub.sex
-    )
-    insert into measure.overall_means as m (hand, position, sex, cnt, a0, c1, c2, c3, c4, c5, c6, c7, c8, c9, c10, c11, p1, p2, p3, p4, p5, p6, p7, p8, p9, p10, p11)
-    select t.*
-    from t
-    on conflict (hand, position, sex)
-    do update set
-        cnt = excluded.cnt,
-        a0 = excluded.a0,
-        c1 = excluded.c1,
-        c2 = excluded.c2,
-        c3 = excluded.c3,
-        c4 = excluded.c4,
-        c5 = excluded.c5,
-        c6 = excluded.c6,
-        c7 = excluded.c7,
-        c8 = excluded.c8,
-        c9 = excluded.c9,
-        c10 = excluded.c10,
-        c11 = excluded.c11,
-        p1 = excluded.p1,
-        p2 = excluded.p2,
-        p3 = excluded.p3,
-        p4 = excluded.p4,
-        p5 = excluded.p5,
-        p6 = excluded.p6,
-        p7 = excluded.p7,
-        p8 = excluded.p8,
-        p9 = excluded.p9,
-        p10 = excluded.p10,
-        p11 = excluded.p11,
-        updated_at = current_timestamp(0)
-    ;
+        since = datetime.utcnow() - timedelta(days=settings.CN_MEANS_RECONCILE_DAYS)
+        count = await crud.measure_cn_mean_aggregate.reconcile(
+            db_session=db_session,
+            since=since,
+            autocommit=False,
+        )
+        await crud.measure_cn_mean_aggregate.refresh_means(db_session=db_session)
+        print(f"overall_means refreshed, {count} measures counted again")
+
+        return True
+
+
+async def get_cn_means_dict(db_session: AsyncSession, sex: Optional[int]):
     """
+    {hand_position: MEAN norm} of a sex, or of both when `sex` is None: from
+    measure.overall_means when CN_MEANS_MEASURE_ID overrides them, else from
+    the running aggregates, current as of the last fold
+    """
+    if settings.CN_MEANS_MEASURE_ID:
+        return await crud.measure_cn_mean.get_dict_by_sex(
+            db_session=db_session,
+            sex=sex,
+        )
+    return await crud.measure_cn_mean_aggregate.get_norm_dict_by_sex(
+        db_session=db_session,
+        sex=sex,
+    )
 
-        await db_session.execute(stat)
-        await db_session.commit()
 
-        return True
+async def rebuild_measure_cn_means(batch_size: int = 1000) -> int:
+    """count every measure again in the running aggregates"""
+    async with deps.get_db2() as db_session:
+        await db_session.execute(
+            text(
+                "truncate measure.overall_mean_aggregates, "
+                "measure.overall_mean_members, measure.overall_mean_pending",
+            ),
+        )
+        count = 0
+        after_id = None
+        while True:
+            query = "select id from measure.infos"
+            params = {"limit": batch_size}
+            if after_id is not None:
+                query += " where id > :after_id"
+                params["after_id"] = after_id
+            result = await db_session.execute(
+                text(f"{query} order by id limit :limit"),
+                params,
+            )
+            measure_ids = result.scalars().all()
+            if not measure_ids:
+                break
+            # the truncate holds both tables until the commit
+            await crud.measure_cn_mean_aggregate.sync(
+                db_session=db_session,
+                measure_ids=measure_ids,
+                lock_members=False,
+                autocommit=False,
+            )
+            after_id = measure_ids[-1]
+            count += len(measure_ids)
+        await crud.measure_cn_mean_aggregate.refresh_means(db_session=db_session)
+
+        return count
 
 
 async def update_measure_cn_means_by_human():
+    """overwrite measure.overall_means with the measure CN_MEANS_MEASURE_ID"""
+    if not settings.CN_MEANS_MEASURE_ID:
+        return
     async with deps.get_db2() as db_session:
         stat = """
 update
@@ -141,17 +171,24 @@ from
         from
             measure.statistics
         where
-            measure_id = '86eacaf9-5109-47e8-be41-45fe823a1a29'
+            measure_id = :measure_id
             and hand = 'Left'
             and position = 'Qu'
             and statistic = 'MEAN'
     ) as t1;
 """
-        await db_session.execute(stat)
+        await db_session.execute(
+            text(stat),
+            {"measure_id": UUID(settings.CN_MEANS_MEASURE_ID)},
+        )
         await db_session.commit()
 
 
-async def create_merged_measures():
+def get_merged_measures_query(incremental: bool = False) -> str:
+    """
+    select of the merged_measures rows, only of the measures in the
+    `measure_ids` parameter when `incremental`
+    """
     statistic_columns = (
         ["a0"]
         + [f"c{i}" for i in range(1, 12)]
@@ -169,29 +206,22 @@ async def create_merged_measures():
             "all_num",
         ]
     )
-    statistic_stmt_column_names = []
+    # one row per measure, see crud.measure_statistic_wide
+    integer_statistic_columns = {"hr", "pass_num", "all_num"}
     statistic_stmt_list = []
     for statistic_column in statistic_columns:
-        for statistic in ["MEAN", "STD", "CV"]:
-            for hand in ["Left", "Right"]:
-                for position in ["Cu", "Qu", "Ch"]:
+        column_type = (
+            "integer"
+            if statistic_column in integer_statistic_columns
+            else "double precision"
+        )
+        for statistic in ["mean", "std", "cv"]:
+            for hand in ["l", "r"]:
+                for position in ["cu", "qu", "ch"]:
                     statistic_stmt_list.append(
-                        f"max({statistic_column}) filter (where statistic = '{statistic}' and hand = '{hand}' and position = '{position}') as {statistic_column.lower()}_{statistic.lower()}_{hand[0].lower()}_{position.lower()}",
+                        f"(stat.{statistic}->'{hand}_{position}'->>'{statistic_column}')::{column_type} as {statistic_column.lower()}_{statistic}_{hand}_{position}",
                     )
-                    statistic_stmt_column_names.append(
-                        f"{statistic_column.lower()}_{statistic.lower()}_{hand[0].lower()}_{position.lower()}",
-                    )
-    statistic_stmt = f"""
-    select
-        measure_id,
-        {", ".join(statistic_stmt_list)}
-    from measure.statistics
-    group by measure_id
-"""
-
-    statistic_stmt_column_names_stmt = ", ".join(
-        [f"stat.{col_name}" for col_name in statistic_stmt_column_names],
-    )
+    statistic_stmt_column_names_stmt = ", ".join(statistic_stmt_list)
 
     info_columns = [
         "has_low_pass_rate",
@@ -430,8 +460,7 @@ async def create_merged_measures():
         "percentage_phlegm_gt",
     ]
     bcq_columns_stmt = ", ".join([f"bcq.{column}" for column in bcq_columns])
-    stmt = f"""
-    CREATE TABLE IF NOT EXISTS measure.merged_measures AS
+    return f"""
     select
     org.name as org_name,
     s.name as survey_name,
@@ -443,23 +472,35 @@ async def create_merged_measures():
     inner join app.auth_orgs as org on org.id = info.org_id
     inner join measure.survey_results as sr on sr.measure_id = info.id
     inner join measure.surveys as s on s.id = sr.survey_id
-    left join (
-        {statistic_stmt}
-    ) as stat on stat.measure_id = info.id
+    left join measure.statistics_wide as stat on stat.measure_id = info.id
     left join measure.bcqs as bcq on bcq.measure_id = info.id
+    {"where info.id = any(:measure_ids)" if incremental else ""}
     order by
         s.name,
         info.measure_time desc
-    ;
     """
 
-    print(stmt)
 
-    async with deps.get_db2() as db_session:
-        await db_session.execute("drop table if exists measure.merged_measures")
-        await db_session.execute(stmt)
-        await db_session.execute(
-            """
+# the measures with a row of merged_measures changed since :since
+CHANGED_MERGED_MEASURES_QUERY = """
+    select id from measure.infos where updated_at >= :since
+    union
+    select measure_id from measure.statistics_wide where updated_at >= :since
+    union
+    select measure_id from measure.bcqs where updated_at >= :since
+    union
+    select measure_id from measure.survey_results
+    where updated_at >= :since and measure_id is not null
+    union
+    select info.id from measure.infos as info
+    inner join measure.subjects as sub on sub.id = info.subject_id
+    where sub.updated_at >= :since
+"""
+
+
+async def grant_merged_measures(db_session: AsyncSession):
+    await db_session.execute(
+        """
 DO
 $do$
 BEGIN
@@ -473,8 +514,155 @@ BEGIN
    END IF;
 END
 $do$;""",
+    )
+    await db_session.execute("GRANT SELECT ON measure.merged_measures TO readaccess;")
+
+
+async def rebuild_merged_measures(db_session: AsyncSession, query: str) -> int:
+    """
+    build merged_measures again from every measure, in a new table swapped
+    in by the same transaction so the readers never miss the table
+    """
+    await db_session.execute("drop table if exists measure.merged_measures_new")
+    await db_session.execute(f"create table measure.merged_measures_new as {query}")
+    await db_session.execute("drop table if exists measure.merged_measures")
+    await db_session.execute(
+        "alter table measure.merged_measures_new rename to merged_measures",
+    )
+    await db_session.execute(
+        "create index merged_measures_measure_id_idx "
+        "on measure.merged_measures (measure_id)",
+    )
+    await grant_merged_measures(db_session)
+    result = await db_session.execute("select count(*) from measure.merged_measures")
+    return result.scalar_one()
+
+
+async def refresh_merged_measures(
+    db_session: AsyncSession,
+    since: datetime,
+) -> Dict[str, int]:
+    """replace the rows of the measures changed since `since`"""
+    result = await db_session.execute(
+        text(CHANGED_MERGED_MEASURES_QUERY),
+        {"since": since},
+    )
+    measure_ids = result.scalars().all()
+    insert_stmt = text(
+        "insert into measure.merged_measures "
+        + get_merged_measures_query(incremental=True),
+    )
+    deleted = inserted = 0
+    batch_size = settings.MERGED_MEASURES_BATCH_SIZE
+    for i in range(0, len(measure_ids), batch_size):
+        params = {"measure_ids": measure_ids[i : i + batch_size]}
+        result = await db_session.execute(
+            text(
+                "delete from measure.merged_measures "
+                "where measure_id = any(:measure_ids)",
+            ),
+            params,
         )
+        deleted += result.rowcount
+        result = await db_session.execute(insert_stmt, params)
+        inserted += result.rowcount
+
+    # rows of deleted measures or survey results
+    result = await db_session.execute(
+        """
+    delete from measure.merged_measures as m
+    where not exists (
+        select 1
+        from measure.survey_results as sr
+        inner join measure.surveys as s on s.id = sr.survey_id
+        where sr.measure_id = m.measure_id and s.name = m.survey_name
+    )
+    """,
+    )
+    deleted += result.rowcount
+    return {"measures": len(measure_ids), "deleted": deleted, "inserted": inserted}
+
+
+def get_merged_measures_since(
+    state: Optional[Tuple[str, datetime]],
+    query_hash: str,
+    exists: bool,
+    full: bool = False,
+) -> Optional[datetime]:
+    """
+    since when the rows of merged_measures are replaced, from the
+    (query_hash, refreshed_at) of the last refresh. None when the table is
+    built from scratch.
+    """
+    if full or state is None or state[0] != query_hash or not exists:
+        return None
+    return state[1] - timedelta(seconds=settings.MERGED_MEASURES_OVERLAP)
+
+
+async def create_merged_measures(full: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Refresh measure.merged_measures, the flat table of the BI readers.
+
+    Only the rows of the measures whose info, subject, statistics, bcq or
+    survey result changed since the last refresh, minus
+    MERGED_MEASURES_OVERLAP seconds for the transactions still running then,
+    are replaced. The table is built from scratch the first time, when
+    `full`, or when its columns changed. Returns what was done, or None when
+    another refresh is running.
+    """
+    started_at = time.monotonic()
+    query = get_merged_measures_query()
+    query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+    async with deps.get_db2() as db_session:
+        result = await db_session.execute(
+            "select pg_try_advisory_xact_lock(hashtext('measure.merged_measures'))",
+        )
+        if not result.scalar_one():
+            print("merged_measures is refreshed by another worker, skip")
+            return None
+
+        # updated_at is written by both python (utc) and the database
+        # (its time zone), take the earlier of the two
+        result = await db_session.execute(
+            "select least(localtimestamp, now() at time zone 'utc')",
+        )
+        refreshed_at = result.scalar_one()
+        result = await db_session.execute(
+            "select query_hash, refreshed_at from measure.merged_measures_state "
+            "where name = 'merged_measures'",
+        )
+        state = result.first()
+        exists = await db_session.execute(
+            "select to_regclass('measure.merged_measures') is not null",
+        )
+        since = get_merged_measures_since(
+            state,
+            query_hash,
+            exists.scalar_one(),
+            full,
+        )
+        if since is None:
+            rows = await rebuild_merged_measures(db_session, query)
+            report = {"mode": "full", "inserted": rows}
+        else:
+            report = {
+                "mode": "incremental",
+                **await refresh_merged_measures(db_session, since),
+            }
+
         await db_session.execute(
-            "GRANT SELECT ON measure.merged_measures TO readaccess;",
+            text(
+                """
+    insert into measure.merged_measures_state (name, query_hash, refreshed_at)
+    values ('merged_measures', :query_hash, :refreshed_at)
+    on conflict (name) do update
+    set query_hash = excluded.query_hash, refreshed_at = excluded.refreshed_at
+    """,
+            ),
+            {"query_hash": query_hash, "refreshed_at": refreshed_at},
         )
         await db_session.commit()
+
+    report["seconds"] = round(time.monotonic() - started_at, 3)
+    print("merged_measures", report)
+    return report
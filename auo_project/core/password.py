@@ -0,0 +1,98 @@
+"""
+Password hashing off the event loop.
+
+bcrypt takes a few hundred milliseconds of cpu on purpose, run on the event
+loop a burst of logins or a batch user import blocked every other request.
+The coroutines here run passlib in a pool of PASSWORD_HASH_WORKERS threads
+(the bcrypt backend releases the GIL), so at most that many hashes run at
+once and the others wait in its queue. `metrics` records the time spent
+waiting for a thread and hashing per operation.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, List, Optional
+
+from auo_project.core.config import settings
+from auo_project.core.security import get_password_hash, verify_password
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS or min(4, os.cpu_count() or 1),
+            thread_name_prefix="password",
+        )
+    return _executor
+
+
+class PasswordMetrics:
+    """count, seconds waiting for a thread and seconds hashing per operation"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, op: str, wait_seconds: float, seconds: float):
+        with self._lock:
+            stat = self.stats.setdefault(
+                op,
+                {
+                    "count": 0,
+                    "wait_seconds": 0.0,
+                    "max_wait_seconds": 0.0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                },
+            )
+            stat["count"] += 1
+            stat["wait_seconds"] += wait_seconds
+            stat["max_wait_seconds"] = max(stat["max_wait_seconds"], wait_seconds)
+            stat["seconds"] += seconds
+            stat["max_seconds"] = max(stat["max_seconds"], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {op: dict(stat) for op, stat in self.stats.items()}
+
+
+metrics = PasswordMetrics()
+
+
+async def _run(op: str, func, *args):
+    submitted_at = time.perf_counter()
+
+    def timed():
+        started_at = time.perf_counter()
+        result = func(*args)
+        metrics.record(
+            op,
+            started_at - submitted_at,
+            time.perf_counter() - started_at,
+        )
+        return result
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), timed)
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", get_password_hash, password)
+
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """hashes of `passwords` in the same order, computed by the whole pool"""
+    return await asyncio.gather(*[hash_password(password) for password in passwords])
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run("verify", verify_password, plain_password, hashed_password)
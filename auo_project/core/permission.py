@@ -0,0 +1,85 @@
+"""
+Permission bitsets of the users.
+
+A user meets a requirement when one of the required groups, roles or actions
+is in its effective ones: its groups, its roles plus the roles of its groups,
+its actions plus the actions of all those roles. Every (kind, name) gets a
+bit the first time the process sees it, so `crud.user.has_requires` is an
+`&` of the bitset of the user and the (cached) bitset of the requirement.
+"""
+from functools import lru_cache
+from itertools import chain
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+PERMISSION_KINDS = ("group", "role", "action")
+
+
+class PermissionBits:
+    def __init__(self):
+        self._bits: Dict[Tuple[str, str], int] = {}
+        self._lock = Lock()
+
+    def get_bit(self, kind: str, name: str) -> int:
+        bit = self._bits.get((kind, name))
+        if bit is None:
+            with self._lock:
+                bit = self._bits.setdefault((kind, name), 1 << len(self._bits))
+        return bit
+
+    def get_mask(self, names: Dict[str, Iterable[str]]) -> int:
+        """names: {kind: names}"""
+        mask = 0
+        for kind, kind_names in names.items():
+            for name in kind_names:
+                mask |= self.get_bit(kind, name)
+        return mask
+
+
+permission_bits = PermissionBits()
+
+
+def get_permission_names(user) -> Dict[str, List[str]]:
+    """the effective group, role and action names of a user loaded by the ORM"""
+    own_roles = list(
+        chain(user.roles, chain.from_iterable(group.roles for group in user.groups)),
+    )
+    own_actions = chain(
+        user.actions,
+        chain.from_iterable(role.actions for role in own_roles),
+    )
+    return {
+        "group": sorted({group.name for group in user.groups}),
+        "role": sorted({role.name for role in own_roles}),
+        "action": sorted({action.name for action in own_actions}),
+    }
+
+
+def get_user_permission_mask(user) -> int:
+    """the cached bitset of a principal, else computed from the ORM collections"""
+    if user.permission_mask is not None:
+        return user.permission_mask
+    return permission_bits.get_mask(get_permission_names(user))
+
+
+@lru_cache(maxsize=1024)
+def _get_required_mask(
+    groups: Tuple[str, ...],
+    roles: Tuple[str, ...],
+    actions: Tuple[str, ...],
+) -> int:
+    return permission_bits.get_mask(
+        {"group": groups, "role": roles, "action": actions},
+    )
+
+
+def get_required_mask(
+    groups: Optional[Sequence[str]] = None,
+    roles: Optional[Sequence[str]] = None,
+    actions: Optional[Sequence[str]] = None,
+) -> int:
+    return _get_required_mask(
+        tuple(groups or ()),
+        tuple(roles or ()),
+        tuple(actions or ()),
+    )
@@ -0,0 +1,173 @@
+"""
+Cache of the user resolved from an access token.
+
+`deps.get_current_user` used to load the user with its org, branches,
+groups, roles and actions (and, through the selectin relationships, their
+roles, actions and users) on every request. The resolved principal, the
+columns of the user, org, groups, roles and branches plus the effective
+permission names, is now kept
+
+- in the worker for PRINCIPAL_CACHE_TTL seconds
+- in redis for PRINCIPAL_REDIS_TTL seconds when REDIS_CACHE_ENABLED
+
+keyed by username and permission version. `invalidate_principals` bumps the
+version, so every principal is loaded again; the console endpoints changing
+users, roles or actions call it. Without redis the other workers see the
+change after at most PRINCIPAL_CACHE_TTL seconds.
+
+`get_principal_user` builds a new `User` per request which is not attached
+to a session and carries the permission bitset: read it, but get the user
+with `crud.user` before updating it.
+"""
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic.json import pydantic_encoder
+from redis.exceptions import RedisError
+
+from auo_project import crud, models
+from auo_project.core.config import settings
+from auo_project.core.permission import get_permission_names, permission_bits
+from auo_project.core.redis import get_redis
+from auo_project.db.session import AsyncSession
+
+PRINCIPAL_VERSION_KEY = "principal:version"
+
+
+def dump_principal(user: models.User) -> Dict[str, Any]:
+    return {
+        "user": user.dict(exclude={"hashed_password"}),
+        "org": user.org.dict() if user.org else None,
+        "groups": [group.dict() for group in user.groups],
+        "roles": [role.dict() for role in user.roles],
+        "user_branches": [branch.dict() for branch in user.user_branches],
+        "permissions": get_permission_names(user),
+    }
+
+
+def load_principal(principal: Dict[str, Any]) -> models.User:
+    user = models.User(**principal["user"])
+    if principal["org"] is not None:
+        user.org = models.Org(**principal["org"])
+    user.groups = [models.Group(**group) for group in principal["groups"]]
+    user.roles = [models.Role(**role) for role in principal["roles"]]
+    user.user_branches = [
+        models.UserBranch(**branch) for branch in principal["user_branches"]
+    ]
+    # not a column, set it like sqlalchemy sets the instance state
+    object.__setattr__(
+        user,
+        "permission_mask",
+        permission_bits.get_mask(principal["permissions"]),
+    )
+    return user
+
+
+class PrincipalCache:
+    """username: (expires at, version, principal), least recently used first"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.local_version = 0
+        self._items: "OrderedDict[str, Tuple[float, str, Dict[str, Any]]]" = (
+            OrderedDict()
+        )
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str, version: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._items.get(username)
+            if item is None or item[0] < time.monotonic() or item[1] != version:
+                self.misses += 1
+                return None
+            self._items.move_to_end(username)
+            self.hits += 1
+            return item[2]
+
+    def put(self, username: str, version: str, principal: Dict[str, Any]):
+        with self._lock:
+            self._items[username] = (time.monotonic() + self.ttl, version, principal)
+            self._items.move_to_end(username)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.local_version += 1
+            self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache(
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE,
+)
+
+
+async def get_redis_version() -> Optional[int]:
+    redis = get_redis()
+    if redis is None:
+        return None
+    try:
+        return int(await redis.get(PRINCIPAL_VERSION_KEY) or 0)
+    except RedisError as e:
+        print(f"get principal version error: {e!r}")
+        return None
+
+
+async def get_principal_user(
+    db_session: AsyncSession,
+    username: str,
+) -> Optional[models.User]:
+    redis_version = await get_redis_version()
+    version = f"{redis_version}:{principal_cache.local_version}"
+    principal = principal_cache.get(username, version)
+
+    redis_key = f"principal:{redis_version}:{username}"
+    if principal is None and redis_version is not None:
+        try:
+            value = await get_redis().get(redis_key)
+            principal = json.loads(value) if value else None
+        except RedisError as e:
+            print(f"get principal {username} error: {e!r}")
+
+    if principal is None:
+        user = await crud.user.get_by_username(
+            db_session=db_session,
+            username=username,
+            relations=["groups", "roles", "actions"],
+        )
+        if user is None:
+            return None
+        principal = dump_principal(user)
+        if redis_version is not None:
+            try:
+                await get_redis().set(
+                    redis_key,
+                    json.dumps(principal, default=pydantic_encoder),
+                    ex=settings.PRINCIPAL_REDIS_TTL,
+                )
+            except RedisError as e:
+                print(f"set principal {username} error: {e!r}")
+
+    principal_cache.put(username, version, principal)
+    return load_principal(principal)
+
+
+async def invalidate_principals():
+    """reload every principal, call after changing users, roles or actions"""
+    principal_cache.clear()
+    redis = get_redis()
+    if redis is not None:
+        try:
+            await redis.incr(PRINCIPAL_VERSION_KEY)
+        except RedisError as e:
+            print(f"invalidate principals error: {e!r}")
@@ -0,0 +1,43 @@
+"""
+Redis client of the caches shared by the workers.
+
+`get_redis` returns None when REDIS_CACHE_ENABLED is off, the callers then
+keep their in process cache only. Like `core.http`, every event loop gets its
+own client and connection pool, like the database engines of `db.session`.
+A redis error must never fail a request: callers catch `RedisError` and fall
+back to the database.
+"""
+import asyncio
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from redis.asyncio import Redis
+
+from auo_project.core.config import settings
+
+# event loop: client
+_clients = WeakKeyDictionary()
+
+
+def get_redis() -> Optional[Redis]:
+    if not settings.REDIS_CACHE_ENABLED:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = Redis.from_url(
+            str(settings.REDIS_DATABASE_URI),
+            socket_timeout=settings.REDIS_CACHE_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CACHE_TIMEOUT,
+        )
+        _clients[loop] = client
+    return client
+
+
+def set_redis(client: Optional[Redis]):
+    """use `client` in the running event loop, e.g. a fakeredis in tests"""
+    loop = asyncio.get_running_loop()
+    if client is None:
+        _clients.pop(loop, None)
+    else:
+        _clients[loop] = client
@@ -0,0 +1,217 @@
+"""
+Parallel reprocessing of measurement zips, e.g. after a formula change.
+
+Decrypting and parsing zips (`read_file`, `parse_content`, pandas) runs in a
+process pool, while a single async writer drains the parsed results into the
+database through a bounded queue and commits every `batch_size` zips.
+Committed file ids are appended to a checkpoint file so an interrupted run
+can be resumed.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+from typing import List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from auo_project import crud
+from auo_project.core.azure import private_blob_service, spool_zip_file
+from auo_project.core.file import (
+    MEASURE_RAW_DATA_KEY,
+    MEASURE_RAW_TILES_KEY,
+    get_measure_raw_data,
+    get_measure_raw_tiles,
+    read_file,
+    update_file_status,
+    write_result,
+)
+from auo_project.db.session import SessionLocal
+
+
+def parse_measure_zip(source: str, local: bool = False) -> dict:
+    """
+    Read a zip into a picklable result dict, runs in a worker process.
+
+    The MeasureRaw columns are serialized and encoded here as well and the
+    parsed waveforms are dropped, so only what the writer needs is sent back
+    to the main process.
+    """
+    try:
+        if local:
+            with open(source, "rb") as zip_file:
+                return _to_plain_result(read_file(zip_file, lazy=True))
+        with spool_zip_file(private_blob_service, source) as zip_file:
+            return _to_plain_result(read_file(zip_file, lazy=True))
+    except Exception as e:
+        return {"error_msg": str(e)}
+
+
+def _to_plain_result(result_dict) -> dict:
+    result = {}
+    try:
+        if result_dict.get("error_msg"):
+            return {"error_msg": result_dict["error_msg"]}
+        result[MEASURE_RAW_DATA_KEY] = get_measure_raw_data(result_dict)
+        result[MEASURE_RAW_TILES_KEY] = get_measure_raw_tiles(
+            result_dict,
+            result[MEASURE_RAW_DATA_KEY],
+        )
+        for key in result_dict.keys():
+            if "/" not in key:
+                result[key] = result_dict[key]
+    finally:
+        result_dict.close()
+    return result
+
+
+def load_checkpoint(checkpoint_path: Optional[Path]) -> Set[str]:
+    if not checkpoint_path or not checkpoint_path.exists():
+        return set()
+    with open(checkpoint_path) as f:
+        return set([line.strip() for line in f if line.strip()])
+
+
+def save_checkpoint(checkpoint_path: Optional[Path], file_ids: List[UUID]):
+    if not checkpoint_path or not file_ids:
+        return
+    with open(checkpoint_path, "a") as f:
+        f.writelines([f"{file_id}\n" for file_id in file_ids])
+
+
+async def reprocess_files(
+    jobs: List[Tuple[UUID, str]],
+    db_session: AsyncSession = None,
+    local: bool = False,
+    overwrite: bool = True,
+    workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    batch_size: int = 20,
+    checkpoint_path: Optional[Path] = None,
+    report_every: int = 100,
+) -> dict:
+    """
+    Reprocess `(file_id, zip location)` jobs.
+
+    `location` is a blob path of the raw zip container, or a local path when
+    `local` is set. At most `max_pending` parsed zips wait for the writer.
+    """
+    db_session = db_session or SessionLocal()
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    todo_jobs = [job for job in jobs if str(job[0]) not in checkpoint]
+    stats = {
+        "total": len(todo_jobs),
+        "skipped": len(jobs) - len(todo_jobs),
+        "done": 0,
+        "invalid": 0,
+        "failed": 0,
+        "failed_file_ids": [],
+        "seconds": 0.0,
+    }
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max_pending)
+    start = perf_counter()
+
+    def report():
+        elapsed = perf_counter() - start
+        rate = (stats["done"] + stats["failed"]) / elapsed if elapsed else 0
+        print(
+            f"reprocess {stats['done'] + stats['failed']}/{stats['total']} files, "
+            f"{rate:.2f} files/s, invalid {stats['invalid']}, "
+            f"failed {stats['failed']}",
+        )
+
+    # spawn, the forked children would otherwise share the pooled db sockets
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("spawn"),
+    ) as pool:
+
+        async def produce():
+            for file_id, source in todo_jobs:
+                future = loop.run_in_executor(pool, parse_measure_zip, source, local)
+                await queue.put((file_id, future))
+            await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        committed_file_ids = []
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                file_id, future = item
+                try:
+                    result_dict = await future
+                    file = await crud.file.get(db_session=db_session, id=file_id)
+                    result = await write_result(
+                        file=file,
+                        result_dict=result_dict,
+                        overwrite=overwrite,
+                        db_session=db_session,
+                        autocommit=False,
+                    )
+                    await update_file_status(
+                        db_session=db_session,
+                        file=file,
+                        result=result,
+                        autocommit=False,
+                    )
+                except Exception as e:
+                    print("reprocess file error: ", file_id, e)
+                    stats["failed"] += 1
+                    stats["failed_file_ids"].append(file_id)
+                    continue
+
+                if isinstance(result, dict) and result.get("error_msg"):
+                    stats["invalid"] += 1
+                stats["done"] += 1
+                committed_file_ids.append(file_id)
+
+                if len(committed_file_ids) >= batch_size:
+                    await db_session.commit()
+                    save_checkpoint(checkpoint_path, committed_file_ids)
+                    committed_file_ids = []
+                if (stats["done"] + stats["failed"]) % report_every == 0:
+                    report()
+
+            await db_session.commit()
+            save_checkpoint(checkpoint_path, committed_file_ids)
+        finally:
+            producer.cancel()
+
+    stats["seconds"] = perf_counter() - start
+    report()
+    return stats
+
+
+async def reprocess_dir(
+    zip_dir: Path,
+    db_session: AsyncSession = None,
+    **kwargs,
+) -> dict:
+    """reprocess local zips, matched to uploaded files by their location"""
+    db_session = db_session or SessionLocal()
+    jobs = []
+    for zip_path in sorted(zip_dir.glob("*.zip")):
+        file = await crud.file.get_by_location(
+            db_session=db_session,
+            location=zip_path.name,
+        )
+        if not file:
+            print(f"not found file of {zip_path.name}")
+            continue
+        jobs.append((file.id, str(zip_path)))
+    return await reprocess_files(
+        jobs=jobs,
+        db_session=db_session,
+        local=True,
+        **kwargs,
+    )
@@ -13,6 +13,7 @@ from jose import jwt
 from passlib.context import CryptContext
 
 from auo_project.core.config import AuthConfig, settings
+from auo_project.core.denylist import token_denylist
 from auo_project.core.exceptions import (
     AccessTokenRequired,
     CSRFError,
@@ -456,6 +457,14 @@ class AuthJWT(AuthConfig):
         if self._token_in_denylist_callback.__func__(raw_token):
             raise RevokedTokenError(status_code=401, message="Token has been revoked")
 
+    async def check_token_is_revoked(self) -> None:
+        """
+        Raise RevokedTokenError when the verified token of the request was
+        revoked by logout or forced revocation, see core.denylist
+        """
+        if await token_denylist.is_revoked(self._decoded_token):
+            raise RevokedTokenError(status_code=401, message="Token has been revoked")
+
     def _verifying_token(
         self,
         encoded_token: str,
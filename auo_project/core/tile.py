@@ -0,0 +1,133 @@
+"""
+Multi-resolution tiles of the all second analyze raw channels.
+
+A channel is a scatter of amp against static pressure (or depth). It is
+stored as a pyramid of levels per axis, each level sorted by x:
+
+    level 0         min and max amp point of TILE_BASE_BINS equal x bins
+    level n         the same with TILE_BASE_BINS * 2 ** n bins
+    last level      every point
+
+Every level is a subset of the points, so a coarse level draws the same
+envelope as the full scatter. A request picks the finest level with at
+most `points` points in its x window and cuts the window with
+`np.searchsorted`, so only that part of one level is sent.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from auo_project.core.chart import ANALYZE_RAW_CHART_FIELDS, ANALYZE_RAW_NAMES
+from auo_project.core.waveform import decode_waveform, encode_waveform, get_waveform
+
+TILE_AXES = ("static", "depth")
+TILE_BASE_BINS = 32
+
+
+def get_axis_points(data: np.ndarray, axis: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(x, amp) of the valid rows of an analyze raw array, sorted by x"""
+    data = data[:, : len(ANALYZE_RAW_NAMES)]
+    data = data[~np.isnan(data).any(axis=1)]
+    amp = data[:, ANALYZE_RAW_NAMES.index("amp")]
+    x = data[:, ANALYZE_RAW_NAMES.index(axis)]
+    if axis == "depth":
+        # same scale as the depth_amp chart
+        x = x / np.float32(0.2)
+    order = np.argsort(x, kind="stable")
+    return x[order], amp[order]
+
+
+def get_minmax_level(x: np.ndarray, amp: np.ndarray, bins: int) -> np.ndarray:
+    """indices of the min and max amp point of `bins` equal width x bins"""
+    span = x[-1] - x[0]
+    if span <= 0:
+        bin_ids = np.zeros(len(x), dtype=np.int64)
+    else:
+        bin_ids = np.minimum(((x - x[0]) / span * bins).astype(np.int64), bins - 1)
+    # sorted by bin then amp, the first and last of each bin are its min and max
+    order = np.lexsort((amp, bin_ids))
+    _, first, counts = np.unique(
+        bin_ids[order],
+        return_index=True,
+        return_counts=True,
+    )
+    last = first + counts - 1
+    return np.unique(np.concatenate([order[first], order[last]]))
+
+
+def build_pyramid(x: np.ndarray, amp: np.ndarray) -> List[np.ndarray]:
+    """levels of (n, 2) [x, amp] arrays, coarsest first and all points last"""
+    levels = []
+    bins = TILE_BASE_BINS
+    while 2 * bins < len(x):
+        indices = get_minmax_level(x, amp, bins)
+        levels.append(np.column_stack([x[indices], amp[indices]]))
+        bins *= 2
+    levels.append(np.column_stack([x, amp]))
+    return levels
+
+
+def get_analyze_raw_tiles(measure_raw, compress: bool = False) -> List[Dict]:
+    """
+    MeasureRawTile rows (without measure_id) of the six analyze raw channels
+    of a MeasureRaw, or any object with the same attributes
+    """
+    tiles = []
+    for channel, field in ANALYZE_RAW_CHART_FIELDS.items():
+        data = get_waveform(measure_raw, field)
+        if data is None or not len(data) or data.shape[1] < len(ANALYZE_RAW_NAMES):
+            continue
+        for axis in TILE_AXES:
+            x, amp = get_axis_points(data, axis)
+            if not len(x):
+                continue
+            for level, points in enumerate(build_pyramid(x, amp)):
+                tiles.append(
+                    {
+                        "channel": channel,
+                        "axis": axis,
+                        "level": level,
+                        "count": len(points),
+                        "x_min": float(points[0, 0]),
+                        "x_max": float(points[-1, 0]),
+                        "data": encode_waveform(points, compress=compress),
+                    },
+                )
+    return tiles
+
+
+def select_level(
+    tiles: List,
+    points: int,
+    x_min: Optional[float] = None,
+    x_max: Optional[float] = None,
+) -> int:
+    """
+    The finest level of one channel and axis with about `points` points or
+    less in the x window, estimated from the level counts and x range.
+
+    `tiles` are MeasureRawTile rows (data not needed) ordered by level.
+    """
+    chosen = tiles[0].level
+    for tile in tiles:
+        span = tile.x_max - tile.x_min
+        low = tile.x_min if x_min is None else max(x_min, tile.x_min)
+        high = tile.x_max if x_max is None else min(x_max, tile.x_max)
+        ratio = 1.0 if span <= 0 else max(high - low, 0) / span
+        if tile.count * ratio > points:
+            break
+        chosen = tile.level
+    return chosen
+
+
+def cut_window(
+    content: bytes,
+    x_min: Optional[float] = None,
+    x_max: Optional[float] = None,
+) -> np.ndarray:
+    """[x, amp] points of a level within the x window"""
+    data = decode_waveform(content)
+    x = data[:, 0]
+    start = 0 if x_min is None else np.searchsorted(x, x_min, side="left")
+    end = len(x) if x_max is None else np.searchsorted(x, x_max, side="right")
+    return data[start:end]
@@ -1,5 +1,6 @@
+from functools import lru_cache
 from io import StringIO
-from typing import List
+from typing import Dict, Iterable, List, Tuple
 
 import pandas as pd
 import pydash as py_
@@ -99,10 +100,82 @@ surface_disease_records = pd.read_csv(
 ).to_dict("records")
 
 
+SURFACE_DISEASE_FIELDS = (
+    "tongue_tip",
+    "tongue_color",
+    "tongue_shap",
+    "tongue_status1",
+    "tongue_status2",
+    "tongue_coating_color",
+    "tongue_coating_status",
+)
+
+SymptomSignature = Tuple[Tuple[str, ...], ...]
+
+
 def get_surface_disease_records():
     return surface_disease_records
 
 
+def process_symptom_id_list(content: str) -> List[str]:
+    if isinstance(content, str):
+        return content.split("、")
+    return []
+
+
+def get_symptom_signature(symptoms: Dict[str, Iterable[str]]) -> SymptomSignature:
+    """
+    the sorted symptoms of each surface disease field, two signatures are equal
+    when every field has the same symptoms in any order
+    """
+    return tuple(tuple(sorted(symptoms[field])) for field in SURFACE_DISEASE_FIELDS)
+
+
+def build_surface_disease_index(records: List[dict]) -> Dict[SymptomSignature, str]:
+    """surface disease of each signature, the first record wins"""
+    index = {}
+    for record in records:
+        if not isinstance(record["surface_disease"], str):
+            continue
+        signature = get_symptom_signature(
+            {
+                field: process_symptom_id_list(record[field])
+                for field in SURFACE_DISEASE_FIELDS
+            },
+        )
+        index.setdefault(signature, record["surface_disease"])
+    return index
+
+
+surface_disease_index = build_surface_disease_index(surface_disease_records)
+
+
+@lru_cache(maxsize=8)
+def group_normal_symptoms(
+    normal_symptoms: Tuple[Tuple[str, str], ...],
+) -> Dict[str, frozenset]:
+    normal_symptom_dict = {}
+    for item_id, symptom_id in normal_symptoms:
+        normal_symptom_dict.setdefault(item_id, set()).add(symptom_id)
+    return {
+        item_id: frozenset(symptom_ids)
+        for item_id, symptom_ids in normal_symptom_dict.items()
+    }
+
+
+def get_normal_symptom_dict(
+    tongue_sympotms: List[models.MeasureTongueSymptom],
+) -> Dict[str, frozenset]:
+    """normal symptom ids per item id, cached per set of normal symptoms"""
+    return group_normal_symptoms(
+        tuple(
+            (symptom.item_id, symptom.symptom_id)
+            for symptom in tongue_sympotms
+            if symptom.is_normal
+        ),
+    )
+
+
 def get_tongue_summary(
     tongue_info: schemas.MeasureAdvancedTongue2UpdateInput,
     tongue_sympotms: List[models.MeasureTongueSymptom],
@@ -115,13 +188,7 @@ def get_tongue_summary(
         ("舌神", ["tongue_status2"], ""),
         ("舌下脈絡", ["tongue_coating_bottom"], ""),
     ]
-    normal_symptoms = py_.filter_(tongue_sympotms, lambda x: x.is_normal)
-    normal_symptom_dict = (
-        py_.chain(normal_symptoms)
-        .group_by("item_id")
-        .map_values(lambda values: [e.symptom_id for e in values])
-        .value()
-    )
+    normal_symptom_dict = get_normal_symptom_dict(tongue_sympotms)
 
     # show the symptom of the summary
     special_rules = {
@@ -160,10 +227,10 @@ def get_tongue_summary(
             if special_rules_match.get(item) is True:
                 sub_abnormal_symptoms = symptoms
             else:
-                sub_abnormal_symptoms = py_.difference(
-                    symptoms,
-                    normal_symptom_dict.get(item, []),
-                )
+                normal_symptom_ids = normal_symptom_dict.get(item, frozenset())
+                sub_abnormal_symptoms = [
+                    symptom for symptom in symptoms if symptom not in normal_symptom_ids
+                ]
             abnormal_symptoms_list.extend(sub_abnormal_symptoms)
         if abnormal_symptoms_list:
             tongue_summary_list.append(
@@ -180,47 +247,17 @@ def get_tongue_summary(
     if uniq_disease_list:
         tongue_summary_list.append(f"一般會有{'、'.join(uniq_disease_list)}的傾向")
 
-    def process_symptom_id_list(content: str):
-        if isinstance(content, str):
-            return content.split("、")
-        return []
-
-    records = get_surface_disease_records()
-    records = [
-        {
-            "tongue_tip": process_symptom_id_list(record["tongue_tip"]),
-            "tongue_color": process_symptom_id_list(record["tongue_color"]),
-            "tongue_shap": process_symptom_id_list(record["tongue_shap"]),
-            "tongue_coating_color": process_symptom_id_list(
-                record["tongue_coating_color"],
-            ),
-            "tongue_coating_status": process_symptom_id_list(
-                record["tongue_coating_status"],
-            ),
-            "tongue_status1": process_symptom_id_list(record["tongue_status1"]),
-            "tongue_status2": process_symptom_id_list(record["tongue_status2"]),
-            # "tongue_coating_bottom": process_symptom_id_list(
-            #     record["tongue_coating_bottom"]
-            # ),
-            "surface_disease": record["surface_disease"],
-        }
-        for record in records
-    ]
-
     surface_summary_list = []
-    for record in records:
-        condition_match = []
-        for item_id, symptom_id_list in record.items():
-            if item_id == "surface_disease":
-                continue
-
-            selected_symptoms = getattr(tongue_info, item_id, [])
-            match = sorted(selected_symptoms) == sorted(symptom_id_list)
-            condition_match.append(match)
-
-        if all(condition_match):
-            surface_summary_list.append(record["surface_disease"])
-            break
+    surface_disease = surface_disease_index.get(
+        get_symptom_signature(
+            {
+                field: getattr(tongue_info, field, [])
+                for field in SURFACE_DISEASE_FIELDS
+            },
+        ),
+    )
+    if surface_disease:
+        surface_summary_list.append(surface_disease)
     if surface_summary_list:
         tongue_summary_list.append(f"可能有{'、'.join(surface_summary_list)}的情況")
 
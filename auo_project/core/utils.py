@@ -6,17 +6,15 @@ from io import StringIO
 from random import randrange
 from typing import Optional, Union
 from io import BytesIO
-from PIL import Image
 
 from fastapi import HTTPException
 import dateutil.parser
 import pandas as pd
 import pydash as py_
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import text
 
 from auo_project import schemas, crud, models
-from auo_project.core.constants import MAX_DEPTH_RATIO
+from auo_project.core.image import NormalizedImage
 from auo_project.db.session import AsyncSession
 
 
@@ -469,71 +467,12 @@ def get_subject_schema(org_name: str):
 
 
 async def get_formulas(db_session: AsyncSession, org_name: str):
-    if org_name in ("auo_health"):
-        resp = await db_session.execute(
-            text(
-                """
-            select
-                max_depth_ratio,
-                strength_code,
-                width_code,
-                hr_type_code
-            from measure.custom_formulas
-            """,
-            ),
-        )
-        formulas = resp.fetchone()
-
-        if formulas is None:
-            return (
-                MAX_DEPTH_RATIO,
-                get_measure_strength,
-                get_measure_width,
-                get_subject_schema,
-            )
+    """max_depth_ratio and strength, width, hr type formulas of an org"""
+    from auo_project.core.formula import DEFAULT_FORMULAS, get_custom_formulas
 
-        max_depth_ratio = MAX_DEPTH_RATIO
-        try:
-            max_depth_ratio = tuple(map(int, formulas[0].split(":")))
-            if len(max_depth_ratio) != 3:
-                raise Exception("max_depth_ratio length must be 3")
-            print("max_depth_ratio", max_depth_ratio)
-        except Exception as e:
-            print("max_depth_ratio error:", e)
-
-        ns = {}
-        get_custom_strength = get_measure_strength
-        try:
-            exec(formulas[1], {"__builtins__": {}}, ns)
-            get_custom_strength = ns["get_custom_strength"]
-        except Exception as e:
-            print("strength_code_string error:", e)
-
-        get_custom_width = get_measure_width
-        try:
-            exec(formulas[2], {"__builtins__": {}}, ns)
-            get_custom_width = ns["get_custom_width"]
-        except Exception as e:
-            print("width_code_string error:", e)
-
-        get_custom_hr_type = get_hr_type
-        try:
-            exec(formulas[3], {"__builtins__": {}}, ns)
-            get_custom_hr_type = ns["get_custom_hr_type"]
-        except Exception as e:
-            print("hr_type_code_string error:", e)
-        return (
-            max_depth_ratio,
-            get_custom_strength,
-            get_custom_width,
-            get_custom_hr_type,
-        )
-    return (
-        MAX_DEPTH_RATIO,
-        get_measure_strength,
-        get_measure_width,
-        get_hr_type,
-    )
+    if org_name in ("auo_health"):
+        return await get_custom_formulas(db_session=db_session)
+    return DEFAULT_FORMULAS
 
 
 def generate_password(k: int = 24) -> str:
@@ -544,18 +483,13 @@ def generate_password(k: int = 24) -> str:
 
 
 def convert_jpg_to_png(file) -> BytesIO:
-    img = Image.open(file, mode='r')
-    img_format = img.format
-    print(f"img file format: {img_format}")
-    if img_format == "PNG":
+    file.seek(0)
+    image = NormalizedImage(file.read())
+    print(f"img file format: {image.format}")
+    if image.format == "PNG":
         file.seek(0)
         return file
-    file.seek(0)
-    img = Image.open(file, mode="r")
-    img_byte_arr = BytesIO()
-    img.save(img_byte_arr, "PNG")
-    img_byte_arr.seek(0)
-    return img_byte_arr
+    return image.png_file()
 
 async def delete_subject_func(db_session: AsyncSession, subject_id: UUID, operator_id: UUID) -> models.Subject:
     subject = await crud.subject.get(db_session=db_session, id=subject_id)
@@ -0,0 +1,220 @@
+"""
+Compact binary encoding of the MeasureRaw waveform channels.
+
+A channel is stored as a little-endian float32 array in a bytea column:
+
+    byte 0      format version (WAVEFORM_FORMAT_VERSION)
+    byte 1      flags, FLAG_ZLIB when the array is zlib compressed
+    byte 2-3    column count, uint16
+    byte 4-7    row count, uint32
+    byte 8-     float32 array, row-major
+
+Uncompressed values are decoded with `np.frombuffer` without copying.
+
+Ingest also writes the text columns next to the binary ones (dual write)
+while MEASURE_RAW_WRITE_TEXT is set: float32 is exact for the stored sensor
+values only up to 7 digits, so `core.utils.get_max_amp_value` and the
+precomputed charts (`core.chart.get_analyze_raw_charts`) are computed at
+ingest from the parsed float64 values, not from the stored columns. Every
+reader of the stored waveforms falls back to the binary column, so the text
+write can be turned off once `backfill-raw-waveforms` has filled the binary
+columns of the existing rows; dropping the text columns is left to a later
+migration.
+
+`round_float32` turns the decoded samples back into the decimals they were
+parsed from before they are sent as JSON.
+
+The downsample_* helpers pick the indices of the points to draw when a
+channel has more samples than a chart needs.
+"""
+import struct
+import zlib
+from io import StringIO
+from math import ceil
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+WAVEFORM_FORMAT_VERSION = 1
+FLAG_ZLIB = 1
+HEADER = struct.Struct("<BBHI")
+DTYPE = np.dtype("<f4")
+# significant digits of a float32 that survive the round trip
+FLOAT32_DIGITS = 7
+
+# measure.raw_data text column -> binary column
+WAVEFORM_BIN_FIELDS = {
+    "six_sec_l_cu": "six_sec_l_cu_bin",
+    "six_sec_l_qu": "six_sec_l_qu_bin",
+    "six_sec_l_ch": "six_sec_l_ch_bin",
+    "six_sec_r_cu": "six_sec_r_cu_bin",
+    "six_sec_r_qu": "six_sec_r_qu_bin",
+    "six_sec_r_ch": "six_sec_r_ch_bin",
+    "all_sec_analyze_raw_l_cu": "all_sec_analyze_raw_l_cu_bin",
+    "all_sec_analyze_raw_l_qu": "all_sec_analyze_raw_l_qu_bin",
+    "all_sec_analyze_raw_l_ch": "all_sec_analyze_raw_l_ch_bin",
+    "all_sec_analyze_raw_r_cu": "all_sec_analyze_raw_r_cu_bin",
+    "all_sec_analyze_raw_r_qu": "all_sec_analyze_raw_r_qu_bin",
+    "all_sec_analyze_raw_r_ch": "all_sec_analyze_raw_r_ch_bin",
+}
+
+
+def parse_waveform_text(
+    content: Optional[str],
+    dtype: np.dtype = DTYPE,
+) -> Optional[np.ndarray]:
+    """parse a tab/newline separated text column, non numeric values become NaN"""
+    if not content:
+        return None
+    df = pd.read_csv(StringIO(content), header=None, sep="\t")
+    return df.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=dtype)
+
+
+def to_waveform_array(
+    data: Union[pd.DataFrame, np.ndarray, str, None],
+    dtype: np.dtype = DTYPE,
+) -> Optional[np.ndarray]:
+    """a channel as (rows, cols) array, non numeric values become NaN"""
+    if isinstance(data, str):
+        return parse_waveform_text(data, dtype)
+    if isinstance(data, pd.DataFrame):
+        return data.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=dtype)
+    return data
+
+
+def encode_waveform(
+    data: Union[pd.DataFrame, np.ndarray, str, None],
+    compress: bool = False,
+) -> Optional[bytes]:
+    data = to_waveform_array(data)
+    if data is None:
+        return None
+
+    array = np.ascontiguousarray(data, dtype=DTYPE)
+    if array.ndim == 1:
+        array = array.reshape(-1, 1)
+    rows, cols = array.shape
+    payload = array.tobytes()
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(WAVEFORM_FORMAT_VERSION, flags, cols, rows) + payload
+
+
+def decode_waveform(content: Optional[bytes]) -> Optional[np.ndarray]:
+    """
+    Decode to a read-only (rows, cols) float32 array.
+
+    The array is a view over `content` unless it is compressed.
+    """
+    if not content:
+        return None
+    version, flags, cols, rows = HEADER.unpack_from(content)
+    if version != WAVEFORM_FORMAT_VERSION:
+        raise ValueError(f"unsupported waveform format version: {version}")
+    payload = memoryview(content)[HEADER.size :]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return np.frombuffer(payload, dtype=DTYPE, count=rows * cols).reshape(rows, cols)
+
+
+def round_float32(values: np.ndarray) -> np.ndarray:
+    """
+    float64 of float32 samples rounded to FLOAT32_DIGITS significant digits,
+    their stored precision: 0.1 is sent as 0.1, not 0.10000000149011612
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    exponent = FLOAT32_DIGITS - 1 - np.where(np.isfinite(magnitude), magnitude, 0)
+    # divide by an exact power of ten, so the result is the nearest float64
+    # of the rounded decimal
+    scale = 10.0 ** np.abs(exponent)
+    return np.where(
+        exponent >= 0,
+        np.round(values * scale) / scale,
+        np.round(values / scale) * scale,
+    )
+
+
+def get_waveform(measure_raw, field: str) -> Optional[np.ndarray]:
+    """
+    Get a channel of a MeasureRaw (or a row with the same attributes) as array,
+    prefer the binary column and fall back to parsing the text column.
+    """
+    if measure_raw is None:
+        return None
+    content = getattr(measure_raw, WAVEFORM_BIN_FIELDS[field], None)
+    if content:
+        return decode_waveform(content)
+    return parse_waveform_text(getattr(measure_raw, field, None))
+
+
+def downsample_stride(y: np.ndarray, points: int) -> np.ndarray:
+    """every n-th sample"""
+    step = max(1, ceil(len(y) / points))
+    return np.arange(0, len(y), step)
+
+
+def downsample_minmax(y: np.ndarray, points: int) -> np.ndarray:
+    """the min and max sample of `points // 2` equal sized buckets, keeps peaks"""
+    n = len(y)
+    if n <= points:
+        return np.arange(n)
+    size = ceil(n / max(1, points // 2))
+    buckets = ceil(n / size)
+    # pad the last bucket with its last sample
+    padded = np.empty(buckets * size, dtype=y.dtype)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    indices = np.concatenate(
+        [
+            offsets + padded.argmin(axis=1),
+            offsets + padded.argmax(axis=1),
+        ],
+    )
+    return np.unique(np.minimum(indices, n - 1))
+
+
+def downsample_lttb(y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets, keeps the visual shape of the line.
+
+    Samples are evenly spaced, so x is the sample index. The first and last
+    sample are always kept.
+    """
+    n = len(y)
+    if n <= points or points < 3:
+        return np.arange(n)
+    y = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    indices = np.empty(points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket, the last sample for the last bucket
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = (next_start + next_end - 1) / 2.0
+        avg_y = y[next_start:next_end].mean()
+        x = np.arange(start, end)
+        areas = np.abs(
+            (a - avg_x) * (y[start:end] - y[a]) - (a - x) * (avg_y - y[a]),
+        )
+        a = start + int(areas.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def downsample(y: np.ndarray, points: int, mode: str = "minmax") -> np.ndarray:
+    """indices of the samples to keep, see `core.constants.DownsampleMode`"""
+    if mode == "lttb":
+        return downsample_lttb(y, points)
+    if mode == "stride":
+        return downsample_stride(y, points)
+    return downsample_minmax(y, points)
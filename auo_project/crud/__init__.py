@@ -9,14 +9,18 @@ from auo_project.crud.measure_advanced_tongue2_crud import measure_advanced_tong
 from auo_project.crud.measure_advanced_tongue_crud import measure_advanced_tongue
 from auo_project.crud.measure_bcq_crud import measure_bcq
 from auo_project.crud.measure_disease_option_crud import measure_disease_option
+from auo_project.crud.measure_image_derivative_crud import measure_image_derivative
 from auo_project.crud.measure_info_crud import measure_info
+from auo_project.crud.measure_mean_aggregate_crud import measure_cn_mean_aggregate
 from auo_project.crud.measure_mean_crud import measure_cn_mean
 from auo_project.crud.measure_parameter_crud import measure_parameter
 from auo_project.crud.measure_parameter_option_curd import measure_parameter_option
 from auo_project.crud.measure_pulse_28_options_crud import measure_pulse_28_option
 from auo_project.crud.measure_question_option_crud import measure_question_option
 from auo_project.crud.measure_raw_crud import measure_raw
+from auo_project.crud.measure_raw_tile_crud import measure_raw_tile
 from auo_project.crud.measure_statistic_crud import measure_statistic
+from auo_project.crud.measure_statistic_wide_crud import measure_statistic_wide
 from auo_project.crud.measure_survey_crud import measure_survey
 from auo_project.crud.measure_survey_result_crud import measure_survey_result
 from auo_project.crud.measure_tongue_config_crud import measure_tongue_config
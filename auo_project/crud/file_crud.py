@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
 from sqlmodel import select
@@ -20,5 +20,18 @@ class CRUDFile(CRUDBase[File, FileCreate, FileUpdate]):
         )
         return response.scalars().all()
 
+    async def get_by_location(
+        self,
+        db_session: AsyncSession,
+        location: str,
+    ) -> Optional[File]:
+        response = await db_session.execute(
+            select(File)
+            .where(File.location == location)
+            .order_by(File.created_at.desc())
+            .limit(1),
+        )
+        return response.scalar_one_or_none()
+
 
 file = CRUDFile(File)
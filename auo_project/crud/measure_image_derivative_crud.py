@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from auo_project.crud.base_crud import CRUDBase
+from auo_project.models.measure_image_derivative_model import MeasureImageDerivative
+from auo_project.schemas.measure_image_derivative_schema import (
+    MeasureImageDerivativeCreate,
+    MeasureImageDerivativeUpdate,
+)
+
+
+class CRUDMeasureImageDerivative(
+    CRUDBase[
+        MeasureImageDerivative,
+        MeasureImageDerivativeCreate,
+        MeasureImageDerivativeUpdate,
+    ],
+):
+    async def get_by_source_locs(
+        self,
+        db_session: AsyncSession,
+        *,
+        source_locs: List[str],
+    ) -> Dict[str, MeasureImageDerivative]:
+        if not source_locs:
+            return {}
+        response = await db_session.execute(
+            select(MeasureImageDerivative).where(
+                MeasureImageDerivative.source_loc.in_(source_locs),
+            ),
+        )
+        return {row.source_loc: row for row in response.scalars().all()}
+
+    async def get_by_content_hash(
+        self,
+        db_session: AsyncSession,
+        *,
+        content_hash: str,
+    ) -> Optional[MeasureImageDerivative]:
+        response = await db_session.execute(
+            select(MeasureImageDerivative)
+            .where(MeasureImageDerivative.content_hash == content_hash)
+            .limit(1),
+        )
+        return response.scalar_one_or_none()
+
+    async def upsert(
+        self,
+        db_session: AsyncSession,
+        *,
+        source_loc: str,
+        content_hash: str,
+        variants: List[Dict[str, Any]],
+        autocommit: bool = True,
+    ) -> None:
+        now = datetime.utcnow()
+        statement = insert(MeasureImageDerivative).values(
+            id=uuid4(),
+            source_loc=source_loc,
+            content_hash=content_hash,
+            variants=variants,
+            created_at=now,
+            updated_at=now,
+        )
+        await db_session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[MeasureImageDerivative.source_loc],
+                set_={
+                    "content_hash": statement.excluded.content_hash,
+                    "variants": statement.excluded.variants,
+                    "updated_at": statement.excluded.updated_at,
+                },
+            ),
+        )
+        if autocommit:
+            await db_session.commit()
+
+
+measure_image_derivative = CRUDMeasureImageDerivative(MeasureImageDerivative)
@@ -0,0 +1,398 @@
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
+
+from sqlalchemy import func, text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from auo_project.crud.base_crud import CRUDBase
+from auo_project.models.measure_mean_aggregate_model import MeasureMeanAggregate
+from auo_project.schemas.measure_mean_aggregate_schema import (
+    MeasureMeanAggregateCreate,
+    MeasureMeanAggregateUpdate,
+)
+
+# columns of measure.overall_means
+NORM_COLUMNS = (
+    ["a0"] + [f"c{i}" for i in range(1, 12)] + [f"p{i}" for i in range(1, 12)]
+)
+
+NORM_STATISTICS = ("MEAN", "STD", "CV")
+
+# MEAN statistic of the measures in :measure_ids counted in the norms: active,
+# of a subject with a sex
+COUNTED_MEANS_QUERY = """
+    select
+        info.id as measure_id,
+        sub.sex,
+        jsonb_object_agg(
+            lower(left(stat.hand, 1)) || '_' || lower(stat.position),
+            jsonb_build_object({columns})
+        ) as means
+    from measure.infos as info
+    inner join measure.subjects as sub on sub.id = info.subject_id
+    inner join measure.statistics as stat on stat.measure_id = info.id
+    where info.id = any(:measure_ids)
+    and info.is_active
+    and sub.sex is not null
+    and stat.statistic = 'MEAN'
+    group by info.id, sub.sex
+""".format(
+    columns=", ".join(f"'{column}', stat.{column}" for column in NORM_COLUMNS),
+)
+
+# take back what the members of :measure_ids added, add what they count now
+APPLY_DELTA_STATEMENT = text(
+    f"""
+    insert into measure.overall_mean_aggregates as a (
+        hand, position, sex, name, n, total, total_sq
+    )
+    select
+        case when left(hand_position, 1) = 'l' then 'Left' else 'Right' end,
+        initcap(substr(hand_position, 3)),
+        sex,
+        name,
+        sum(sign),
+        sum(sign * value),
+        sum(sign * value * value)
+    from (
+        select
+            m.sign,
+            m.sex,
+            hp.key as hand_position,
+            v.key as name,
+            v.value::numeric as value
+        from (
+            select -1 as sign, sex, means
+            from measure.overall_mean_members
+            where measure_id = any(:measure_ids)
+            union all
+            select 1 as sign, sex, means
+            from ({COUNTED_MEANS_QUERY}) as counted
+        ) as m,
+        jsonb_each(m.means) as hp,
+        jsonb_each_text(hp.value) as v
+    ) as t
+    where value is not null
+    group by hand_position, sex, name
+    -- the same row order in every transaction, the upsert locks them
+    order by hand_position, sex, name
+    on conflict (hand, position, sex, name) do update
+    set n = a.n + excluded.n,
+        total = a.total + excluded.total,
+        total_sq = a.total_sq + excluded.total_sq,
+        updated_at = current_timestamp(0)
+    """,
+)
+
+# the members of :measure_ids must not change before they are replaced: one
+# lock per bucket of measures, taken in order, so concurrent syncs of other
+# measures go on and a sync of many measures holds at most MEMBER_LOCK_BUCKETS
+MEMBER_LOCK_BUCKETS = 256
+
+LOCK_MEMBERS_STATEMENT = text(
+    f"""
+    select pg_advisory_xact_lock(hashtext('measure.overall_mean_members'), bucket)
+    from (
+        select distinct mod(hashtext(id::text), {MEMBER_LOCK_BUCKETS}) as bucket
+        from unnest(cast(:measure_ids as uuid[])) as id
+        order by bucket
+    ) as buckets
+    """,
+)
+
+DELETE_MEMBERS_STATEMENT = text(
+    """
+    delete from measure.overall_mean_members
+    where measure_id = any(:measure_ids)
+    """,
+)
+
+INSERT_MEMBERS_STATEMENT = text(
+    f"""
+    insert into measure.overall_mean_members (
+        measure_id, sex, means, created_at, updated_at
+    )
+    select measure_id, sex, means, :now, :now
+    from ({COUNTED_MEANS_QUERY}) as counted
+    """,
+)
+
+# measure.overall_means from the aggregates, one row per hand, position, sex
+REFRESH_MEANS_STATEMENT = text(
+    """
+    insert into measure.overall_means as m (
+        hand, position, sex, cnt, {columns}
+    )
+    select
+        hand,
+        position,
+        sex,
+        max(n),
+        {means}
+    from measure.overall_mean_aggregates
+    group by hand, position, sex
+    having max(n) > 0
+    order by hand, position, sex
+    on conflict (hand, position, sex)
+    do update set
+        cnt = excluded.cnt,
+        {updates},
+        updated_at = current_timestamp(0)
+    """.format(
+        columns=", ".join(NORM_COLUMNS),
+        means=",\n        ".join(
+            f"max(total / nullif(n, 0)) filter (where name = '{column}') as {column}"
+            for column in NORM_COLUMNS
+        ),
+        updates=",\n        ".join(
+            f"{column} = excluded.{column}" for column in NORM_COLUMNS
+        ),
+    ),
+)
+
+ENQUEUE_STATEMENT = text(
+    """
+    insert into measure.overall_mean_pending (measure_id, created_at, updated_at)
+    select distinct id, :now, :now
+    from unnest(cast(:measure_ids as uuid[])) as id
+    on conflict (measure_id) do nothing
+    """,
+)
+
+# take the oldest :limit pending measures, the ones another fold holds are
+# left to it
+DEQUEUE_STATEMENT = text(
+    """
+    delete from measure.overall_mean_pending
+    where id in (
+        select id
+        from measure.overall_mean_pending
+        order by created_at
+        limit :limit
+        for update skip locked
+    )
+    returning measure_id
+    """,
+)
+
+# measures whose count in the norms may be stale: changed info or subject
+# since :since, or deleted
+RECONCILE_MEASURES_QUERY = text(
+    """
+    select id from measure.infos where updated_at >= :since
+    union
+    select info.id
+    from measure.infos as info
+    inner join measure.subjects as sub on sub.id = info.subject_id
+    where sub.updated_at >= :since
+    union
+    select m.measure_id
+    from measure.overall_mean_members as m
+    where not exists (select 1 from measure.infos as info where info.id = m.measure_id)
+    """,
+)
+
+
+def get_norm(
+    n: int,
+    total: Decimal,
+    total_sq: Decimal,
+    statistic_name: str,
+) -> Optional[float]:
+    """
+    MEAN, STD (sample standard deviation) or CV (STD / MEAN) of `n` values
+    from their sum and sum of squares
+    """
+    if not n:
+        return None
+    total, total_sq = Decimal(total), Decimal(total_sq)
+    mean = total / n
+    if statistic_name == "MEAN":
+        return float(mean)
+    if n < 2:
+        return None
+    # rounding of the running sums may leave a tiny negative for equal values
+    std = (max(total_sq - total * total / n, Decimal(0)) / (n - 1)).sqrt()
+    if statistic_name == "STD":
+        return float(std)
+    if not mean:
+        return None
+    return float(std / mean)
+
+
+class CRUDMeasureMeanAggregate(
+    CRUDBase[
+        MeasureMeanAggregate,
+        MeasureMeanAggregateCreate,
+        MeasureMeanAggregateUpdate,
+    ],
+):
+    async def sync(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_ids: List[UUID],
+        lock_members: bool = True,
+        autocommit: bool = True,
+    ) -> None:
+        """
+        Count the measures in the norms as they are now: take back their last
+        MEAN statistic from measure.overall_mean_aggregates and add the
+        current one, when they are active, of a subject with a sex and not
+        deleted. Call it in the transaction changing those. Without
+        `lock_members` the caller holds the members already, like the rebuild
+        truncating them.
+        """
+        if not measure_ids:
+            return
+        params = {"measure_ids": list(measure_ids)}
+        if lock_members:
+            await db_session.execute(LOCK_MEMBERS_STATEMENT, params)
+        await db_session.execute(APPLY_DELTA_STATEMENT, params)
+        await db_session.execute(DELETE_MEMBERS_STATEMENT, params)
+        await db_session.execute(
+            INSERT_MEMBERS_STATEMENT,
+            {**params, "now": datetime.utcnow()},
+        )
+        if autocommit:
+            await db_session.commit()
+
+    async def enqueue(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_ids: List[UUID],
+        autocommit: bool = True,
+    ) -> None:
+        """
+        Mark the measures to be counted again by the next `fold`. Only their
+        own measure.overall_mean_pending rows are written, so the ingest
+        transactions do not hold the aggregate rows shared by every measure
+        of a sex.
+        """
+        if not measure_ids:
+            return
+        await db_session.execute(
+            ENQUEUE_STATEMENT,
+            {"measure_ids": list(measure_ids), "now": datetime.utcnow()},
+        )
+        if autocommit:
+            await db_session.commit()
+
+    async def fold(
+        self,
+        db_session: AsyncSession,
+        *,
+        limit: int,
+        autocommit: bool = True,
+    ) -> int:
+        """sync up to `limit` pending measures, returns how many"""
+        response = await db_session.execute(DEQUEUE_STATEMENT, {"limit": limit})
+        measure_ids = response.scalars().all()
+        await self.sync(
+            db_session=db_session,
+            measure_ids=measure_ids,
+            autocommit=False,
+        )
+        if autocommit:
+            await db_session.commit()
+        return len(measure_ids)
+
+    async def reconcile(
+        self,
+        db_session: AsyncSession,
+        *,
+        since: datetime,
+        autocommit: bool = True,
+    ) -> int:
+        """count again the measures changed since `since` or deleted"""
+        response = await db_session.execute(
+            RECONCILE_MEASURES_QUERY,
+            {"since": since},
+        )
+        measure_ids = response.scalars().all()
+        await self.sync(
+            db_session=db_session,
+            measure_ids=measure_ids,
+            autocommit=autocommit,
+        )
+        return len(measure_ids)
+
+    async def refresh_means(
+        self,
+        db_session: AsyncSession,
+        *,
+        autocommit: bool = True,
+    ) -> None:
+        """write measure.overall_means from the aggregates"""
+        await db_session.execute(REFRESH_MEANS_STATEMENT)
+        if autocommit:
+            await db_session.commit()
+
+    def get_norm_dict(
+        self,
+        aggregates: Iterable,
+        statistic_name: str = "MEAN",
+    ) -> Dict[str, SimpleNamespace]:
+        """
+        {hand_position: norm} like `crud.measure_cn_mean.get_dict_by_sex` of
+        rows with hand, position, name, n, total and total_sq
+        """
+        statistic_name = statistic_name.upper()
+        if statistic_name not in NORM_STATISTICS:
+            raise ValueError(f"Not supported statistic: {statistic_name}")
+        norm_dict = {}
+        for aggregate in aggregates:
+            hand_position = f'{"l" if aggregate.hand == "Left" else "r"}_{aggregate.position.lower()}'
+            norm = norm_dict.get(hand_position)
+            if norm is None:
+                norm = norm_dict[hand_position] = SimpleNamespace(
+                    hand=aggregate.hand,
+                    position=aggregate.position,
+                    cnt=0,
+                    **{column: None for column in NORM_COLUMNS},
+                )
+            norm.cnt = max(norm.cnt, aggregate.n)
+            setattr(
+                norm,
+                aggregate.name,
+                get_norm(
+                    aggregate.n,
+                    aggregate.total,
+                    aggregate.total_sq,
+                    statistic_name,
+                ),
+            )
+        return norm_dict
+
+    async def get_norm_dict_by_sex(
+        self,
+        db_session: AsyncSession,
+        *,
+        sex: Optional[int],
+        statistic_name: str = "MEAN",
+    ) -> Dict[str, SimpleNamespace]:
+        """the norms of a sex, or of both when `sex` is None"""
+        query = select(
+            MeasureMeanAggregate.hand,
+            MeasureMeanAggregate.position,
+            MeasureMeanAggregate.name,
+            func.sum(MeasureMeanAggregate.n).label("n"),
+            func.sum(MeasureMeanAggregate.total).label("total"),
+            func.sum(MeasureMeanAggregate.total_sq).label("total_sq"),
+        ).group_by(
+            MeasureMeanAggregate.hand,
+            MeasureMeanAggregate.position,
+            MeasureMeanAggregate.name,
+        )
+        if sex is not None:
+            query = query.where(MeasureMeanAggregate.sex == sex)
+        response = await db_session.execute(query)
+        return self.get_norm_dict(response.all(), statistic_name)
+
+
+measure_cn_mean_aggregate = CRUDMeasureMeanAggregate(MeasureMeanAggregate)
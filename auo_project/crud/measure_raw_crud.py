@@ -1,11 +1,14 @@
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
+from sqlalchemy import and_, case, exists, or_
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from auo_project.core.waveform import WAVEFORM_BIN_FIELDS
 from auo_project.crud.base_crud import CRUDBase
 from auo_project.models.measure_raw_model import MeasureRaw
+from auo_project.models.measure_raw_tile_model import MeasureRawTile
 from auo_project.schemas.measure_raw_schema import MeasureRawCreate, MeasureRawUpdate
 
 
@@ -18,5 +21,111 @@ class CRUDMeasureRaw(CRUDBase[MeasureRaw, MeasureRawCreate, MeasureRawUpdate]):
         )
         return measure_raw.scalar_one_or_none()
 
+    async def get_waveforms_by_measure_id(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_id: UUID,
+        fields: List[str],
+    ):
+        """
+        Select only the waveform channels in `fields`, read with
+        `core.waveform.get_waveform`. The text column is only fetched when its
+        binary column is not filled yet.
+        """
+        columns = []
+        for field in fields:
+            bin_column = getattr(MeasureRaw, WAVEFORM_BIN_FIELDS[field])
+            columns.append(bin_column)
+            columns.append(
+                case(
+                    (bin_column.is_(None), getattr(MeasureRaw, field)),
+                    else_=None,
+                ).label(field),
+            )
+        response = await db_session.execute(
+            select(*columns).where(MeasureRaw.measure_id == measure_id),
+        )
+        return response.one_or_none()
+
+    async def get_multi_without_bin(
+        self,
+        db_session: AsyncSession,
+        *,
+        after_id: Optional[UUID] = None,
+        limit: int = 100,
+    ) -> List[MeasureRaw]:
+        """rows with a text waveform but without its binary column, ordered by id"""
+        query = select(MeasureRaw).where(
+            or_(
+                *[
+                    and_(
+                        getattr(MeasureRaw, bin_field).is_(None),
+                        getattr(MeasureRaw, field).isnot(None),
+                    )
+                    for field, bin_field in WAVEFORM_BIN_FIELDS.items()
+                ],
+            ),
+        )
+        if after_id:
+            query = query.where(MeasureRaw.id > after_id)
+        response = await db_session.execute(
+            query.order_by(MeasureRaw.id).limit(limit),
+        )
+        return response.scalars().all()
+
+    async def get_analyze_chart_by_measure_id(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_id: UUID,
+    ) -> Optional[dict]:
+        response = await db_session.execute(
+            select(MeasureRaw.all_sec_analyze_chart).where(
+                MeasureRaw.measure_id == measure_id,
+            ),
+        )
+        return response.scalar_one_or_none()
+
+    async def get_multi_without_chart(
+        self,
+        db_session: AsyncSession,
+        *,
+        after_id: Optional[UUID] = None,
+        overwrite: bool = False,
+        limit: int = 100,
+    ) -> List[MeasureRaw]:
+        """rows without precomputed charts (all rows with `overwrite`), ordered by id"""
+        query = select(MeasureRaw)
+        if not overwrite:
+            query = query.where(MeasureRaw.all_sec_analyze_chart.is_(None))
+        if after_id:
+            query = query.where(MeasureRaw.id > after_id)
+        response = await db_session.execute(
+            query.order_by(MeasureRaw.id).limit(limit),
+        )
+        return response.scalars().all()
+
+    async def get_multi_without_tiles(
+        self,
+        db_session: AsyncSession,
+        *,
+        after_id: Optional[UUID] = None,
+        overwrite: bool = False,
+        limit: int = 100,
+    ) -> List[MeasureRaw]:
+        """rows without analyze raw tiles (all rows with `overwrite`), ordered by id"""
+        query = select(MeasureRaw)
+        if not overwrite:
+            query = query.where(
+                ~exists().where(MeasureRawTile.measure_id == MeasureRaw.measure_id),
+            )
+        if after_id:
+            query = query.where(MeasureRaw.id > after_id)
+        response = await db_session.execute(
+            query.order_by(MeasureRaw.id).limit(limit),
+        )
+        return response.scalars().all()
+
 
 measure_raw = CRUDMeasureRaw(MeasureRaw)
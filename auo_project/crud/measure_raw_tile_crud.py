@@ -0,0 +1,80 @@
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from sqlmodel import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from auo_project.crud.base_crud import CRUDBase
+from auo_project.models.measure_raw_tile_model import MeasureRawTile
+from auo_project.schemas.measure_raw_tile_schema import (
+    MeasureRawTileCreate,
+    MeasureRawTileUpdate,
+)
+
+
+class CRUDMeasureRawTile(
+    CRUDBase[MeasureRawTile, MeasureRawTileCreate, MeasureRawTileUpdate],
+):
+    async def get_levels(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_id: UUID,
+        axis: str,
+    ):
+        """channel, level, count and x range of each level, without the data"""
+        response = await db_session.execute(
+            select(
+                MeasureRawTile.channel,
+                MeasureRawTile.level,
+                MeasureRawTile.count,
+                MeasureRawTile.x_min,
+                MeasureRawTile.x_max,
+            )
+            .where(
+                MeasureRawTile.measure_id == measure_id,
+                MeasureRawTile.axis == axis,
+            )
+            .order_by(MeasureRawTile.channel, MeasureRawTile.level),
+        )
+        return response.all()
+
+    async def get_data(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_id: UUID,
+        channel: str,
+        axis: str,
+        level: int,
+    ) -> Optional[bytes]:
+        response = await db_session.execute(
+            select(MeasureRawTile.data).where(
+                MeasureRawTile.measure_id == measure_id,
+                MeasureRawTile.channel == channel,
+                MeasureRawTile.axis == axis,
+                MeasureRawTile.level == level,
+            ),
+        )
+        return response.scalar_one_or_none()
+
+    async def replace_all(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_id: UUID,
+        tiles: List[Dict[str, Any]],
+        autocommit: bool = True,
+    ) -> None:
+        """replace the tiles of a measure by `core.tile.get_analyze_raw_tiles` rows"""
+        await db_session.execute(
+            delete(MeasureRawTile).where(MeasureRawTile.measure_id == measure_id),
+        )
+        db_session.add_all(
+            [MeasureRawTile(measure_id=measure_id, **tile) for tile in tiles],
+        )
+        if autocommit:
+            await db_session.commit()
+
+
+measure_raw_tile = CRUDMeasureRawTile(MeasureRawTile)
@@ -1,10 +1,14 @@
-from typing import Any, Dict, List, Optional
-from uuid import UUID
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+from uuid import UUID, uuid4
 
+from pydantic import BaseModel
+from sqlalchemy.dialects.postgresql import insert
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from auo_project.crud.base_crud import CRUDBase
+from auo_project.crud.measure_statistic_wide_crud import measure_statistic_wide
 from auo_project.models.measure_statistic_model import MeasureStatistic
 from auo_project.schemas.measure_statistic_schema import (
     MeasureStatisticCreate,
@@ -12,6 +16,8 @@ from auo_project.schemas.measure_statistic_schema import (
     MeasureStatisticUpdate,
 )
 
+UNIQ_CONSTRAINT_NAME = "measure_statistics_measure_id_statistic_hand_position_key"
+
 
 class CRUDMeasureStatistic(
     CRUDBase[MeasureStatistic, MeasureStatisticCreate, MeasureStatisticUpdate],
@@ -35,6 +41,65 @@ class CRUDMeasureStatistic(
         )
         return statistic.scalar_one_or_none()
 
+    async def upsert_many(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_id: UUID,
+        objs_in: List[Union[MeasureStatisticCreate, BaseModel]],
+        overwrite: bool = False,
+        autocommit: bool = True,
+    ) -> int:
+        """
+        Write all statistics of a measure with one `INSERT ... ON CONFLICT
+        (measure_id, statistic, hand, position)` statement.
+
+        Existing rows are kept unless `overwrite` is set, the same as checking
+        `get_by_uniq_keys` before `create` for each row. Duplicated keys in
+        `objs_in` keep the first one.
+        """
+        now = datetime.utcnow()
+        values = {}
+        for obj_in in objs_in:
+            statistic_in = MeasureStatisticCreate(
+                **obj_in.dict(exclude={"measure_id"}),
+                measure_id=measure_id,
+            )
+            key = (statistic_in.statistic, statistic_in.hand, statistic_in.position)
+            if key in values:
+                continue
+            values[key] = {
+                **statistic_in.dict(),
+                "id": uuid4(),
+                "created_at": now,
+                "updated_at": now,
+            }
+
+        rows = list(values.values())
+        if rows:
+            # one statistics.csv is a few dozen rows, far below the bind
+            # parameter limit of a statement
+            stmt = insert(MeasureStatistic).values(rows)
+            if overwrite:
+                kept_cols = ("id", "measure_id", "statistic", "hand", "position")
+                stmt = stmt.on_conflict_do_update(
+                    constraint=UNIQ_CONSTRAINT_NAME,
+                    set_=dict(
+                        [
+                            (col, stmt.excluded[col])
+                            for col in rows[0].keys()
+                            if col not in kept_cols and col != "created_at"
+                        ],
+                    ),
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(constraint=UNIQ_CONSTRAINT_NAME)
+            await db_session.execute(stmt)
+
+        if autocommit:
+            await db_session.commit()
+        return len(rows)
+
     async def get_means(
         self, db_session: AsyncSession, *, measure_id: UUID
     ) -> List[MeasureStatistic]:
@@ -130,8 +195,12 @@ class CRUDMeasureStatistic(
     async def get_means_dict(
         self, db_session: AsyncSession, *, measure_id: UUID
     ) -> Dict[str, Any]:
-        means = await self.get_means(db_session=db_session, measure_id=measure_id)
-        return self.get_flat_statistic_dict(means)
+        means_dict = await self.get_flat_dict_by_ids_and_statistics(
+            db_session=db_session,
+            measure_ids=[measure_id],
+            statistic_name="MEAN",
+        )
+        return next(iter(means_dict.values()), {})
 
     async def get_means_by_ids(
         self, db_session: AsyncSession, *, measure_ids: List[UUID]
@@ -147,13 +216,35 @@ class CRUDMeasureStatistic(
     async def get_flat_dict_by_ids_and_statistics(
         self, db_session: AsyncSession, *, measure_ids: List[UUID], statistic_name: str
     ) -> Dict[str, Any]:
-        statistics = await self.get_by_ids_and_statistic(
+        """
+        {measure_id: {hand_position: statistic}}, read from the one row per
+        measure of measure.statistics_wide. Measures missing there, not
+        backfilled yet, are pivoted from measure.statistics.
+        """
+        result2 = {}
+        for statistic_wide in await measure_statistic_wide.get_by_measure_ids(
             db_session=db_session,
             measure_ids=measure_ids,
+        ):
+            flat_dict = measure_statistic_wide.get_flat_statistic_dict(
+                statistic_wide,
+                statistic_name,
+            )
+            if flat_dict is not None:
+                result2[statistic_wide.measure_id] = flat_dict
+        found_ids = {str(measure_id) for measure_id in result2}
+        missing_ids = [
+            measure_id for measure_id in measure_ids if str(measure_id) not in found_ids
+        ]
+        if not missing_ids:
+            return result2
+
+        statistics = await self.get_by_ids_and_statistic(
+            db_session=db_session,
+            measure_ids=missing_ids,
             statistic_name=statistic_name,
         )
         result = {}
-        result2 = {}
         for statistic in statistics:
             result.setdefault(statistic.measure_id, [])
             result[statistic.measure_id].append(statistic)
@@ -0,0 +1,131 @@
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from auo_project.crud.base_crud import CRUDBase
+from auo_project.models.measure_statistic_wide_model import MeasureStatisticWide
+from auo_project.schemas.measure_statistic_wide_schema import (
+    MeasureStatisticWideCreate,
+    MeasureStatisticWideUpdate,
+)
+
+# measure.statistics statistic: measure.statistics_wide column
+WIDE_STATISTICS = {"MEAN": "mean", "STD": "std", "CV": "cv"}
+
+# one row per measure, {"l_cu": {"a0": ..., ...}, ...} per statistic
+REFRESH_STATEMENT = text(
+    """
+    insert into measure.statistics_wide (
+        id, measure_id, mean, std, cv, created_at, updated_at
+    )
+    select
+        gen_random_uuid(),
+        measure_id,
+        coalesce(jsonb_object_agg(hand_position, value) filter (where statistic = 'MEAN'), '{}'),
+        coalesce(jsonb_object_agg(hand_position, value) filter (where statistic = 'STD'), '{}'),
+        coalesce(jsonb_object_agg(hand_position, value) filter (where statistic = 'CV'), '{}'),
+        :now,
+        :now
+    from (
+        select
+            measure_id,
+            statistic,
+            lower(left(hand, 1)) || '_' || lower(position) as hand_position,
+            to_jsonb(s) - array[
+                'id', 'measure_id', 'statistic', 'hand', 'position',
+                'created_at', 'updated_at'
+            ] as value
+        from measure.statistics as s
+        where measure_id = any(:measure_ids)
+    ) as t
+    group by measure_id
+    on conflict (measure_id) do update
+    set mean = excluded.mean,
+        std = excluded.std,
+        cv = excluded.cv,
+        updated_at = excluded.updated_at
+    """,
+)
+
+# rows of measures whose statistics are all gone
+DELETE_STALE_STATEMENT = text(
+    """
+    delete from measure.statistics_wide as w
+    where w.measure_id = any(:measure_ids)
+    and not exists (
+        select 1 from measure.statistics as s where s.measure_id = w.measure_id
+    )
+    """,
+)
+
+
+class CRUDMeasureStatisticWide(
+    CRUDBase[
+        MeasureStatisticWide,
+        MeasureStatisticWideCreate,
+        MeasureStatisticWideUpdate,
+    ],
+):
+    async def refresh(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_ids: List[UUID],
+        autocommit: bool = True,
+    ) -> int:
+        """
+        Write the wide rows of measures from their measure.statistics rows,
+        call it in the transaction writing those.
+        """
+        if not measure_ids:
+            return 0
+        params = {"measure_ids": list(measure_ids)}
+        result = await db_session.execute(
+            REFRESH_STATEMENT,
+            {**params, "now": datetime.utcnow()},
+        )
+        await db_session.execute(DELETE_STALE_STATEMENT, params)
+        if autocommit:
+            await db_session.commit()
+        return result.rowcount
+
+    async def get_by_measure_ids(
+        self,
+        db_session: AsyncSession,
+        *,
+        measure_ids: List[UUID],
+    ) -> List[MeasureStatisticWide]:
+        if not measure_ids:
+            return []
+        response = await db_session.execute(
+            select(MeasureStatisticWide).where(
+                MeasureStatisticWide.measure_id.in_(measure_ids),
+            ),
+        )
+        return response.scalars().all()
+
+    def get_flat_statistic_dict(
+        self,
+        statistic_wide: MeasureStatisticWide,
+        statistic_name: str,
+    ) -> Optional[Dict[str, SimpleNamespace]]:
+        """
+        {hand_position: statistic} like
+        `crud.measure_statistic.get_flat_statistic_dict`, the statistics only
+        read by attribute, or None for a statistic not kept here
+        """
+        column = WIDE_STATISTICS.get(statistic_name.upper())
+        if column is None:
+            return None
+        return {
+            hand_position: SimpleNamespace(**values)
+            for hand_position, values in getattr(statistic_wide, column).items()
+        }
+
+
+measure_statistic_wide = CRUDMeasureStatisticWide(MeasureStatisticWide)
@@ -1,13 +1,14 @@
+import asyncio
 from io import BytesIO
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional, Union
 from uuid import UUID
 from zipfile import ZipFile
 
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from auo_project.core import azure
+from auo_project.core.blob import get_executor, private_blob_store
 from auo_project.core.config import settings
 from auo_project.crud.base_crud import CRUDBase
 from auo_project.models.measure_tongue_config_upload_model import (
@@ -19,6 +20,17 @@ from auo_project.schemas.measure_tongue_config_upload_schema import (
 )
 
 
+def read_cc_pickle(zip_bytes: bytes) -> Optional[bytes]:
+    """color_correction.pkl of a tongue config zip"""
+    with ZipFile(BytesIO(zip_bytes), mode="r") as config_zip:
+        for file in config_zip.infolist():
+            filepath = Path(file.filename)
+            if filepath.name == "color_correction.pkl":
+                with config_zip.open(str(filepath), mode="r") as f:
+                    return f.read()
+    return None
+
+
 class CRUDMeasureTongueConfigUpload(
     CRUDBase[
         MeasureTongueConfigUpload,
@@ -55,26 +67,77 @@ class CRUDMeasureTongueConfigUpload(
         )
         if config_upload is None:
             return None
+        return await self.download_cc_pickle(config_upload=config_upload)
 
-        zip_bytes = azure.download_file(
-            blob_service_client=azure.private_blob_service,
-            category=settings.AZURE_STORAGE_CONTAINER_TONGUE_CONFIG,
-            file_path=config_upload.file_loc,
+    async def download_cc_pickle(
+        self,
+        config_upload: MeasureTongueConfigUpload,
+    ) -> Optional[bytes]:
+        zip_bytes = await private_blob_store.download(
+            settings.AZURE_STORAGE_CONTAINER_TONGUE_CONFIG,
+            config_upload.file_loc,
         )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), read_cc_pickle, zip_bytes)
 
-        zip_file = BytesIO(zip_bytes.readall())
+    def invalidate_cc_cache(self, config_upload: MeasureTongueConfigUpload):
+        # imported here, core.color_correction imports crud
+        from auo_project.core.color_correction import cc_cache
 
-        with ZipFile(zip_file, mode="r") as config_zip:
-            infolist = config_zip.infolist()
-            for file in infolist:
-                filepath = Path(file.filename)
-                filename = filepath.name
-                if filename == "color_correction.pkl":
-                    with config_zip.open(str(filepath), mode="r") as f:
-                        pickle_content = f.read()
-                        return pickle_content
+        cc_cache.invalidate(
+            org_id=config_upload.org_id,
+            color_hash=config_upload.color_hash,
+        )
 
-        return None
+    async def create(
+        self,
+        *,
+        db_session: AsyncSession,
+        obj_in: Union[MeasureTongueConfigUploadCreate, MeasureTongueConfigUpload],
+        autocommit: bool = True,
+    ) -> MeasureTongueConfigUpload:
+        config_upload = await super().create(
+            db_session=db_session,
+            obj_in=obj_in,
+            autocommit=autocommit,
+        )
+        self.invalidate_cc_cache(config_upload)
+        return config_upload
+
+    async def update(
+        self,
+        *,
+        db_session: AsyncSession,
+        obj_current: MeasureTongueConfigUpload,
+        obj_new: Union[
+            MeasureTongueConfigUploadUpdate,
+            Dict[str, Any],
+            MeasureTongueConfigUpload,
+        ],
+        autocommit: bool = True,
+    ) -> MeasureTongueConfigUpload:
+        # the old color hash, in case the update changes it
+        self.invalidate_cc_cache(obj_current)
+        config_upload = await super().update(
+            db_session=db_session,
+            obj_current=obj_current,
+            obj_new=obj_new,
+            autocommit=autocommit,
+        )
+        self.invalidate_cc_cache(config_upload)
+        return config_upload
+
+    async def remove(
+        self,
+        *,
+        db_session: AsyncSession,
+        id: Union[UUID, str],
+        autocommit: bool = True,
+    ) -> None:
+        config_upload = await self.get(db_session=db_session, id=id)
+        if config_upload is not None:
+            self.invalidate_cc_cache(config_upload)
+        await super().remove(db_session=db_session, id=id, autocommit=autocommit)
 
 
 measure_tongue_config_upload = CRUDMeasureTongueConfigUpload(MeasureTongueConfigUpload)
@@ -1,4 +1,7 @@
+from typing import List, Optional
 from uuid import UUID
+
+from sqlalchemy.orm import noload
 from sqlmodel import or_, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
@@ -41,6 +44,36 @@ class CRUDMeasureTongueUpload(
 
         return response.scalars().all()
 
+    async def claim_unprocessed_rows(
+        self,
+        db_session: AsyncSession,
+        limit: int,
+        exclude_ids: Optional[List[UUID]] = None,
+    ) -> list[MeasureTongueUpload]:
+        """
+        Lock up to `limit` unprocessed rows until the transaction ends,
+        skipping the rows other workers locked, so several workers can drain
+        the backlog without correcting a row twice.
+        """
+        query = (
+            select(MeasureTongueUpload)
+            .where(
+                or_(
+                    MeasureTongueUpload.tongue_front_corrected_loc.is_(None),
+                    MeasureTongueUpload.tongue_back_corrected_loc.is_(None),
+                ),
+            )
+            .order_by(MeasureTongueUpload.created_at)
+            .limit(limit)
+            .options(noload("*"))
+            .with_for_update(skip_locked=True)
+        )
+        if exclude_ids:
+            query = query.where(MeasureTongueUpload.id.not_in(exclude_ids))
+        response = await db_session.execute(query)
+
+        return response.scalars().all()
+
     def get_container_name(self) -> str:
         return settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
 
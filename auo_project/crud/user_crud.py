@@ -1,5 +1,4 @@
 from datetime import datetime
-from itertools import chain
 from typing import Any, Dict, List, Optional, Sequence, Union
 from uuid import UUID
 
@@ -9,7 +8,8 @@ from sqlalchemy.orm import selectinload
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from auo_project.core.security import get_password_hash, verify_password
+from auo_project.core.permission import get_required_mask, get_user_permission_mask
+from auo_project.core.password import check_password, hash_password
 from auo_project.crud.base_crud import CRUDBase
 from auo_project.models.user_model import User
 from auo_project.models.user_branch_model import UserBranch
@@ -55,8 +55,12 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         *,
         db_session: AsyncSession,
         obj_in: UserCreate,
+        hashed_password: Optional[str] = None,
         autocommit: bool = True,
     ) -> User:
+        """`hashed_password`: of obj_in.password, e.g. from hash_passwords"""
+        if hashed_password is None:
+            hashed_password = await hash_password(obj_in.password)
         db_obj = User(
             org_id=obj_in.org_id,
             branch_id=obj_in.branch_id,
@@ -65,7 +69,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             mobile=obj_in.mobile,
             email=obj_in.email,
             is_superuser=obj_in.is_superuser,
-            hashed_password=get_password_hash(obj_in.password),
+            hashed_password=hashed_password,
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow(),
         )
@@ -92,7 +96,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             mobile=obj_in.mobile,
             email=obj_in.email,
             is_superuser=obj_in.is_superuser,
-            hashed_password=get_password_hash(obj_in.password),
+            hashed_password=await hash_password(obj_in.password),
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow(),
         )
@@ -102,7 +106,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         await db_session.refresh(db_obj)
         return db_obj
 
-    def update(
+    async def update(
         self,
         *,
         db_session: AsyncSession,
@@ -114,10 +118,10 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         else:
             update_data = obj_in.dict(exclude_unset=True)
         if update_data.get("password"):
-            hashed_password = get_password_hash(update_data["password"])
+            hashed_password = await hash_password(update_data["password"])
             del update_data["password"]
             update_data["hashed_password"] = hashed_password
-        return super().update(
+        return await super().update(
             db_session=db_session,
             obj_current=db_obj,
             obj_new=update_data,
@@ -150,7 +154,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         user = await self.get_by_email(email=email, db_session=db_session)
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        if not await check_password(password, user.hashed_password):
             return None
         return user
 
@@ -168,35 +172,10 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         if not groups and not roles and not actions:
             return True
 
-        own_group_names = [group.name for group in user.groups]
-        role_names = [role.name for role in user.roles]
-        action_names = [action.name for action in user.actions]
-
-        if groups and set(groups) & set(own_group_names):
-            return True
-
-        if roles and set(roles) & set(role_names):
-            return True
-
-        if actions and set(actions) & set(action_names):
-            return True
-
-        own_group_roles = list(
-            chain.from_iterable([group.roles for group in user.groups]),
-        )
-        own_roles = user.roles + own_group_roles
-        own_role_names = set([role.name for role in own_roles])
-        if roles and set(roles) & set(own_role_names):
-            return True
-
-        own_actions = chain.from_iterable(
-            [user.actions, chain.from_iterable([role.actions for role in own_roles])],
+        return bool(
+            get_user_permission_mask(user)
+            & get_required_mask(groups=groups, roles=roles, actions=actions),
         )
-        own_action_names = set([action.name for action in own_actions])
-        if actions and set(actions) & set(own_action_names):
-            return True
-
-        return False
 
     def is_active(self, user: User) -> bool:
         return user.is_active
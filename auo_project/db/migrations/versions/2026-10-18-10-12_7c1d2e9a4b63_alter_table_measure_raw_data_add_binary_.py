@@ -0,0 +1,45 @@
+"""alter table measure.raw_data add binary waveform columns
+
+Revision ID: 7c1d2e9a4b63
+Revises: 39ee16d33b18
+Create Date: 2026-10-18 10:12:31.284109
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c1d2e9a4b63"
+down_revision = "39ee16d33b18"
+branch_labels = None
+depends_on = None
+
+columns = [
+    "six_sec_l_cu_bin",
+    "six_sec_l_qu_bin",
+    "six_sec_l_ch_bin",
+    "six_sec_r_cu_bin",
+    "six_sec_r_qu_bin",
+    "six_sec_r_ch_bin",
+    "all_sec_analyze_raw_l_cu_bin",
+    "all_sec_analyze_raw_l_qu_bin",
+    "all_sec_analyze_raw_l_ch_bin",
+    "all_sec_analyze_raw_r_cu_bin",
+    "all_sec_analyze_raw_r_qu_bin",
+    "all_sec_analyze_raw_r_ch_bin",
+]
+
+
+def upgrade() -> None:
+    for column in columns:
+        op.add_column(
+            "raw_data",
+            sa.Column(column, sa.LargeBinary(), nullable=True),
+            schema="measure",
+        )
+
+
+def downgrade() -> None:
+    for column in columns:
+        op.drop_column("raw_data", column, schema="measure")
@@ -0,0 +1,28 @@
+"""alter table measure.raw_data add all_sec_analyze_chart
+
+Revision ID: a93f5b20e7d1
+Revises: 7c1d2e9a4b63
+Create Date: 2026-10-18 14:05:12.503211
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a93f5b20e7d1"
+down_revision = "7c1d2e9a4b63"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "raw_data",
+        sa.Column("all_sec_analyze_chart", sa.JSON(), nullable=True),
+        schema="measure",
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("raw_data", "all_sec_analyze_chart", schema="measure")
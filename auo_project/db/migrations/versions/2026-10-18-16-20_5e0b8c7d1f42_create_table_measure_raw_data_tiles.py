@@ -0,0 +1,66 @@
+"""create table measure.raw_data_tiles
+
+Revision ID: 5e0b8c7d1f42
+Revises: a93f5b20e7d1
+Create Date: 2026-10-18 16:20:47.118302
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5e0b8c7d1f42"
+down_revision = "a93f5b20e7d1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "raw_data_tiles",
+        sa.Column(
+            "id",
+            sqlmodel.sql.sqltypes.GUID(),
+            primary_key=True,
+            server_default=sa.text("gen_random_uuid()"),
+        ),
+        sa.Column(
+            "measure_id",
+            sqlmodel.sql.sqltypes.GUID(),
+            sa.ForeignKey("measure.infos.id"),
+            nullable=False,
+            index=True,
+        ),
+        sa.Column("channel", sa.String(4), nullable=False),
+        sa.Column("axis", sa.String(10), nullable=False),
+        sa.Column("level", sa.Integer, nullable=False),
+        sa.Column("count", sa.Integer, nullable=False),
+        sa.Column("x_min", sa.Float, nullable=False),
+        sa.Column("x_max", sa.Float, nullable=False),
+        sa.Column("data", sa.LargeBinary, nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+        ),
+        sa.UniqueConstraint(
+            "measure_id",
+            "channel",
+            "axis",
+            "level",
+            name="measure_raw_data_tiles_measure_id_channel_axis_level_key",
+        ),
+        schema="measure",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("raw_data_tiles", schema="measure")
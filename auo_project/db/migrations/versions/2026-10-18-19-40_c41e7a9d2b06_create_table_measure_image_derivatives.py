@@ -0,0 +1,59 @@
+"""create table measure.image_derivatives
+
+Revision ID: c41e7a9d2b06
+Revises: 5e0b8c7d1f42
+Create Date: 2026-10-18 19:40:12.503817
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c41e7a9d2b06"
+down_revision = "5e0b8c7d1f42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "image_derivatives",
+        sa.Column(
+            "id",
+            sqlmodel.sql.sqltypes.GUID(),
+            primary_key=True,
+            server_default=sa.text("gen_random_uuid()"),
+        ),
+        sa.Column(
+            "source_loc",
+            sqlmodel.sql.sqltypes.AutoString(),
+            nullable=False,
+            unique=True,
+            index=True,
+        ),
+        sa.Column(
+            "content_hash",
+            sqlmodel.sql.sqltypes.AutoString(),
+            nullable=False,
+            index=True,
+        ),
+        sa.Column("variants", sa.JSON, nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+        ),
+        schema="measure",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("image_derivatives", schema="measure")
@@ -0,0 +1,29 @@
+"""create table measure.merged_measures_state
+
+Revision ID: 9c2d6a1e4b73
+Revises: c41e7a9d2b06
+Create Date: 2026-10-18 21:30:12.384910
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9c2d6a1e4b73"
+down_revision = "c41e7a9d2b06"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "merged_measures_state",
+        sa.Column("name", sa.Text, primary_key=True),
+        sa.Column("query_hash", sa.Text, nullable=False),
+        sa.Column("refreshed_at", sa.DateTime, nullable=False),
+        schema="measure",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("merged_measures_state", schema="measure")
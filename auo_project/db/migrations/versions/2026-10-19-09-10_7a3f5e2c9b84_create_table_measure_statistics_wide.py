@@ -0,0 +1,58 @@
+"""create table measure.statistics_wide
+
+Revision ID: 7a3f5e2c9b84
+Revises: 9c2d6a1e4b73
+Create Date: 2026-10-19 09:10:27.118402
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "7a3f5e2c9b84"
+down_revision = "9c2d6a1e4b73"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "statistics_wide",
+        sa.Column(
+            "id",
+            sqlmodel.sql.sqltypes.GUID(),
+            primary_key=True,
+            server_default=sa.text("gen_random_uuid()"),
+        ),
+        sa.Column(
+            "measure_id",
+            sqlmodel.sql.sqltypes.GUID(),
+            sa.ForeignKey("measure.infos.id", ondelete="CASCADE"),
+            nullable=False,
+            unique=True,
+            index=True,
+        ),
+        sa.Column("mean", postgresql.JSONB, nullable=False),
+        sa.Column("std", postgresql.JSONB, nullable=False),
+        sa.Column("cv", postgresql.JSONB, nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+            index=True,
+        ),
+        schema="measure",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("statistics_wide", schema="measure")
@@ -0,0 +1,88 @@
+"""create tables measure.overall_mean_aggregates and measure.overall_mean_members
+
+Revision ID: e5b19d4c7f30
+Revises: 7a3f5e2c9b84
+Create Date: 2026-10-19 14:25:43.502117
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "e5b19d4c7f30"
+down_revision = "7a3f5e2c9b84"
+branch_labels = None
+depends_on = None
+
+
+def timestamp_columns():
+    return [
+        sa.Column(
+            "created_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+            index=True,
+        ),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "overall_mean_aggregates",
+        sa.Column(
+            "id",
+            sqlmodel.sql.sqltypes.GUID(),
+            primary_key=True,
+            server_default=sa.text("gen_random_uuid()"),
+        ),
+        sa.Column("hand", sa.String(length=10), nullable=False),
+        sa.Column("position", sa.String(length=2), nullable=False),
+        sa.Column("sex", sa.Integer, nullable=False),
+        sa.Column("name", sa.String(length=5), nullable=False),
+        sa.Column("n", sa.Integer, server_default="0", nullable=False),
+        sa.Column("total", sa.Numeric, server_default="0", nullable=False),
+        sa.Column("total_sq", sa.Numeric, server_default="0", nullable=False),
+        *timestamp_columns(),
+        sa.UniqueConstraint(
+            "hand",
+            "position",
+            "sex",
+            "name",
+            name="measure_overall_mean_aggregates_hand_position_sex_name_key",
+        ),
+        schema="measure",
+    )
+    op.create_table(
+        "overall_mean_members",
+        sa.Column(
+            "id",
+            sqlmodel.sql.sqltypes.GUID(),
+            primary_key=True,
+            server_default=sa.text("gen_random_uuid()"),
+        ),
+        sa.Column(
+            "measure_id",
+            sqlmodel.sql.sqltypes.GUID(),
+            nullable=False,
+            unique=True,
+            index=True,
+        ),
+        sa.Column("sex", sa.Integer, nullable=False),
+        sa.Column("means", postgresql.JSONB, nullable=False),
+        *timestamp_columns(),
+        schema="measure",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("overall_mean_members", schema="measure")
+    op.drop_table("overall_mean_aggregates", schema="measure")
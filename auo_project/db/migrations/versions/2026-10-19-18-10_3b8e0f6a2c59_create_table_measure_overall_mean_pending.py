@@ -0,0 +1,53 @@
+"""create table measure.overall_mean_pending
+
+Revision ID: 3b8e0f6a2c59
+Revises: e5b19d4c7f30
+Create Date: 2026-10-19 18:10:27.915336
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3b8e0f6a2c59"
+down_revision = "e5b19d4c7f30"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "overall_mean_pending",
+        sa.Column(
+            "id",
+            sqlmodel.sql.sqltypes.GUID(),
+            primary_key=True,
+            server_default=sa.text("gen_random_uuid()"),
+        ),
+        sa.Column(
+            "measure_id",
+            sqlmodel.sql.sqltypes.GUID(),
+            nullable=False,
+            unique=True,
+            index=True,
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime,
+            server_default=sa.text("current_timestamp(0)"),
+            nullable=False,
+            index=True,
+        ),
+        schema="measure",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("overall_mean_pending", schema="measure")
@@ -1,4 +1,32 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+"""
+Database engines and sessions.
+
+asyncpg connections belong to the event loop that opened them, so
+`get_engine` keeps one engine, and its connection pool, per process and
+event loop: the web workers and the celery workers (see
+`auo_project.services.celery.loop`) run a single loop each and so reuse one
+pool for their lifetime. A forked process starts with no engine.
+
+`SessionLocal()` and `async_session_factory()` bind the session to the
+engine of the running loop. The pool is configured by DB_POOL_SIZE,
+DB_MAX_OVERFLOW, DB_POOL_PRE_PING and DB_POOL_RECYCLE.
+
+`get_read_session()` opens a session on the read replica
+(REPLICA_DATABASE_HOST or REPLICA_ASYNC_DATABASE_URI) for the heavy read
+only queries, unless the replica is unreachable or lags more than
+REPLICA_MAX_LAG seconds behind, then on the primary. Writes always go to the
+primary.
+"""
+import asyncio
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, Optional
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlmodel.ext.asyncio.session import AsyncSession
 
@@ -8,29 +36,166 @@ conn_args = {}
 if settings.DATABASE_SSL_REQURED:
     conn_args["ssl"] = "require"
 
-engine = create_async_engine(
-    settings.ASYNC_DATABASE_URI,
-    echo=settings.DATABASE_ECHO,
-    future=True,
-    pool_size=settings.DB_POOL_SIZE,
-    max_overflow=settings.DB_POOL_SIZE + 5,
-    connect_args=conn_args,
+
+def create_engine(url: str) -> AsyncEngine:
+    return create_async_engine(
+        url,
+        echo=settings.DATABASE_ECHO,
+        future=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=(
+            settings.DB_POOL_SIZE + 5
+            if settings.DB_MAX_OVERFLOW is None
+            else settings.DB_MAX_OVERFLOW
+        ),
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args=conn_args,
+    )
+
+
+class EngineRegistry:
+    """event loop (None outside of a loop): engine, of the current process"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._lock = Lock()
+        self._pid: Optional[int] = None
+        self._engines = WeakKeyDictionary()
+        self._default: Optional[AsyncEngine] = None
+        self.created = 0
+        self.connects = 0
+
+    def _count_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def get(self) -> AsyncEngine:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            if self._pid != os.getpid():
+                # the pools of the parent process are not ours to close
+                self._pid = os.getpid()
+                self._engines = WeakKeyDictionary()
+                self._default = None
+            engine = self._default if loop is None else self._engines.get(loop)
+            if engine is None:
+                engine = create_engine(self.url)
+                event.listen(engine.sync_engine, "connect", self._count_connect)
+                self.created += 1
+                if loop is None:
+                    self._default = engine
+                else:
+                    self._engines[loop] = engine
+            return engine
+
+    async def dispose(self):
+        """close the connections of the engine of the running loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            engine = self._engines.pop(loop, None)
+        if engine is not None:
+            await engine.dispose()
+
+    def stats(self) -> Dict[str, int]:
+        return {"created": self.created, "connects": self.connects}
+
+
+engines = EngineRegistry(settings.ASYNC_DATABASE_URI)
+get_engine = engines.get
+
+replica_engines = (
+    EngineRegistry(settings.REPLICA_ASYNC_DATABASE_URI)
+    if settings.REPLICA_ASYNC_DATABASE_URI
+    else None
 )
 
-SessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
+# 0 when the replica replayed everything it received, e.g. an idle primary
+REPLICA_LAG_QUERY = text(
+    """
+    select case
+        when not pg_is_in_recovery() then 0
+        when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0
+        else extract(epoch from now() - pg_last_xact_replay_timestamp())
+    end
+    """,
 )
 
-async_session_factory = sessionmaker(
+
+class ReplicaLag:
+    """replication lag of the replica, checked at most every `interval` seconds"""
+
+    def __init__(self, max_lag: float, interval: float):
+        self.max_lag = max_lag
+        self.interval = interval
+        self.checked_at: Optional[float] = None
+        # None: the replica is unreachable
+        self.lag: Optional[float] = None
+        self.replica_reads = 0
+        self.primary_reads = 0
+
+    async def check(self, engine: AsyncEngine):
+        # set first, the requests meanwhile use the last lag
+        self.checked_at = time.monotonic()
+        try:
+            async with engine.connect() as connection:
+                lag = (await connection.execute(REPLICA_LAG_QUERY)).scalar()
+            self.lag = float(lag or 0)
+        except (SQLAlchemyError, OSError) as e:
+            print(f"check replica lag error: {e!r}")
+            self.lag = None
+
+    async def is_usable(self, engine: AsyncEngine) -> bool:
+        if (
+            self.checked_at is None
+            or time.monotonic() - self.checked_at > self.interval
+        ):
+            await self.check(engine)
+        usable = self.lag is not None and self.lag <= self.max_lag
+        if usable:
+            self.replica_reads += 1
+        else:
+            self.primary_reads += 1
+        return usable
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lag": self.lag,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+        }
+
+
+replica_lag = ReplicaLag(
+    max_lag=settings.REPLICA_MAX_LAG,
+    interval=settings.REPLICA_LAG_CHECK_INTERVAL,
+)
+
+
+class _SessionMaker(sessionmaker):
+    def __call__(self, **local_kw) -> AsyncSession:
+        local_kw.setdefault("bind", get_engine())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = _SessionMaker(
     autocommit=False,
     autoflush=False,
-    bind=engine,
     class_=AsyncSession,
     expire_on_commit=False,
 )
 
-mixins_session = scoped_session(sessionmaker(bind=engine, autocommit=True))
+async_session_factory = SessionLocal
+
+mixins_session = scoped_session(sessionmaker(bind=get_engine(), autocommit=True))
+
+
+async def get_read_session() -> AsyncSession:
+    """session for read only queries, on the replica when it is usable"""
+    if replica_engines is not None:
+        engine = replica_engines.get()
+        if await replica_lag.is_usable(engine):
+            return SessionLocal(bind=engine)
+    return SessionLocal()
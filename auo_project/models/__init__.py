@@ -15,11 +15,17 @@ from auo_project.models.links_model import (
 from auo_project.models.measure_advanced_tongue2_model import MeasureAdvancedTongue2
 from auo_project.models.measure_advanced_tongue_model import MeasureAdvancedTongue
 from auo_project.models.measure_bcq_model import BCQ
+from auo_project.models.measure_image_derivative_model import MeasureImageDerivative
 from auo_project.models.measure_info_model import MeasureInfo
+from auo_project.models.measure_mean_aggregate_model import MeasureMeanAggregate
+from auo_project.models.measure_mean_member_model import MeasureMeanMember
 from auo_project.models.measure_mean_model import MeasureMean
+from auo_project.models.measure_mean_pending_model import MeasureMeanPending
 from auo_project.models.measure_pulse_28_options_model import MeasurePulse28Option
 from auo_project.models.measure_raw_model import MeasureRaw
+from auo_project.models.measure_raw_tile_model import MeasureRawTile
 from auo_project.models.measure_statistic_model import MeasureStatistic
+from auo_project.models.measure_statistic_wide_model import MeasureStatisticWide
 from auo_project.models.measure_survey_model import MeasureSurvey
 from auo_project.models.measure_survey_result_model import MeasureSurveyResult
 from auo_project.models.measure_tongue_config_model import MeasureTongueConfig
@@ -0,0 +1,31 @@
+from typing import List
+
+from sqlmodel import JSON, Column, Field
+
+from auo_project.models.base_model import BaseModel, BaseTimestampModel, BaseUUIDModel
+
+
+class MeasureImageDerivativeBase(BaseModel):
+    source_loc: str = Field(
+        index=True,
+        unique=True,
+        nullable=False,
+        title="原始圖片位置",
+    )
+    content_hash: str = Field(index=True, nullable=False, title="原始圖片 sha256")
+    # [{name, format, width, height, loc}], see core.derivative
+    variants: List[dict] = Field(
+        default=[],
+        nullable=False,
+        sa_column=Column(JSON),
+    )
+
+
+class MeasureImageDerivative(
+    BaseUUIDModel,
+    BaseTimestampModel,
+    MeasureImageDerivativeBase,
+    table=True,
+):
+    __tablename__ = "image_derivatives"
+    __table_args__ = {"schema": "measure"}
@@ -448,6 +448,14 @@ class MeasureInfo(BaseUUIDModel, BaseTimestampModel, MeasureInfoBase, table=True
             "cascade": "all, delete",
         },
     )
+    raw_tiles: "MeasureRawTile" = Relationship(
+        back_populates="measure_info",
+        sa_relationship_kwargs={
+            "lazy": "select",
+            "uselist": True,
+            "cascade": "all, delete",
+        },
+    )
     statistics: "MeasureStatistic" = Relationship(
         back_populates="measure_info",
         sa_relationship_kwargs={
@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+from sqlalchemy import Numeric
+from sqlmodel import Column, Field, UniqueConstraint
+
+from auo_project.models.base_model import BaseModel, BaseTimestampModel, BaseUUIDModel
+
+
+class MeasureMeanAggregateBase(BaseModel):
+    hand: str = Field(index=True, nullable=False, max_length=10)
+    position: str = Field(index=True, nullable=False, max_length=2)
+    sex: int = Field(index=True, nullable=False)
+    # column of measure.statistics, a0, c1-c11 or p1-p11
+    name: str = Field(nullable=False, max_length=5)
+    # count, sum and sum of squares of the MEAN statistic of the counted measures
+    n: int = Field(default=0, nullable=False)
+    total: Decimal = Field(
+        default=0,
+        sa_column=Column(Numeric, nullable=False, server_default="0"),
+    )
+    total_sq: Decimal = Field(
+        default=0,
+        sa_column=Column(Numeric, nullable=False, server_default="0"),
+    )
+
+
+class MeasureMeanAggregate(
+    BaseUUIDModel,
+    BaseTimestampModel,
+    MeasureMeanAggregateBase,
+    table=True,
+):
+    __tablename__ = "overall_mean_aggregates"
+    __table_args__ = (
+        UniqueConstraint(
+            "hand",
+            "position",
+            "sex",
+            "name",
+            name="measure_overall_mean_aggregates_hand_position_sex_name_key",
+        ),
+        {"schema": "measure"},
+    )
@@ -0,0 +1,27 @@
+from typing import Dict
+from uuid import UUID
+
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Column, Field
+
+from auo_project.models.base_model import BaseModel, BaseTimestampModel, BaseUUIDModel
+
+
+class MeasureMeanMemberBase(BaseModel):
+    # no foreign key, the contribution of a deleted measure is taken back by
+    # the next reconciliation
+    measure_id: UUID = Field(index=True, unique=True, nullable=False)
+    sex: int = Field(nullable=False)
+    # the MEAN statistic counted in measure.overall_mean_aggregates,
+    # {"l_cu": {"a0": 1.0, "c1": 0.5, ...}, ...}
+    means: Dict[str, dict] = Field(default={}, nullable=False, sa_column=Column(JSONB))
+
+
+class MeasureMeanMember(
+    BaseUUIDModel,
+    BaseTimestampModel,
+    MeasureMeanMemberBase,
+    table=True,
+):
+    __tablename__ = "overall_mean_members"
+    __table_args__ = {"schema": "measure"}
@@ -0,0 +1,21 @@
+from uuid import UUID
+
+from sqlmodel import Field
+
+from auo_project.models.base_model import BaseModel, BaseTimestampModel, BaseUUIDModel
+
+
+# measures written since the last fold into measure.overall_mean_aggregates
+class MeasureMeanPendingBase(BaseModel):
+    # no foreign key, a deleted measure is taken back when it is folded
+    measure_id: UUID = Field(index=True, unique=True, nullable=False)
+
+
+class MeasureMeanPending(
+    BaseUUIDModel,
+    BaseTimestampModel,
+    MeasureMeanPendingBase,
+    table=True,
+):
+    __tablename__ = "overall_mean_pending"
+    __table_args__ = {"schema": "measure"}
@@ -1,5 +1,7 @@
+from typing import Optional
 from uuid import UUID
 
+from sqlalchemy import JSON, Column
 from sqlmodel import Field, Relationship
 
 from auo_project.models.base_model import BaseModel, BaseTimestampModel, BaseUUIDModel
@@ -24,6 +26,25 @@ class MeasureRawBase(BaseModel):
     all_sec_analyze_raw_r_cu: str = Field(default=None, index=False, nullable=True)
     all_sec_analyze_raw_r_qu: str = Field(default=None, index=False, nullable=True)
     all_sec_analyze_raw_r_ch: str = Field(default=None, index=False, nullable=True)
+    # little-endian float32 arrays, see core.waveform
+    six_sec_l_cu_bin: Optional[bytes] = Field(default=None, nullable=True)
+    six_sec_l_qu_bin: Optional[bytes] = Field(default=None, nullable=True)
+    six_sec_l_ch_bin: Optional[bytes] = Field(default=None, nullable=True)
+    six_sec_r_cu_bin: Optional[bytes] = Field(default=None, nullable=True)
+    six_sec_r_qu_bin: Optional[bytes] = Field(default=None, nullable=True)
+    six_sec_r_ch_bin: Optional[bytes] = Field(default=None, nullable=True)
+    all_sec_analyze_raw_l_cu_bin: Optional[bytes] = Field(default=None, nullable=True)
+    all_sec_analyze_raw_l_qu_bin: Optional[bytes] = Field(default=None, nullable=True)
+    all_sec_analyze_raw_l_ch_bin: Optional[bytes] = Field(default=None, nullable=True)
+    all_sec_analyze_raw_r_cu_bin: Optional[bytes] = Field(default=None, nullable=True)
+    all_sec_analyze_raw_r_qu_bin: Optional[bytes] = Field(default=None, nullable=True)
+    all_sec_analyze_raw_r_ch_bin: Optional[bytes] = Field(default=None, nullable=True)
+    # scatter charts of the analyze raw channels, see core.chart.get_analyze_raw_charts
+    all_sec_analyze_chart: Optional[dict] = Field(
+        default=None,
+        nullable=True,
+        sa_column=Column(JSON),
+    )
 
 
 class MeasureRaw(BaseUUIDModel, BaseTimestampModel, MeasureRawBase, table=True):
@@ -0,0 +1,44 @@
+from uuid import UUID
+
+from sqlmodel import Field, Relationship, UniqueConstraint
+
+from auo_project.models.base_model import BaseModel, BaseTimestampModel, BaseUUIDModel
+
+
+class MeasureRawTileBase(BaseModel):
+    measure_id: UUID = Field(
+        index=True,
+        nullable=False,
+        foreign_key="measure.infos.id",
+    )
+    channel: str = Field(nullable=False, max_length=4, title="l_cu, l_qu, ...")
+    axis: str = Field(nullable=False, max_length=10, title="static, depth")
+    level: int = Field(nullable=False, title="0 最粗")
+    count: int = Field(nullable=False, title="點數")
+    x_min: float = Field(nullable=False)
+    x_max: float = Field(nullable=False)
+    # [x, amp] float32 array sorted by x, see core.waveform and core.tile
+    data: bytes = Field(nullable=False)
+
+
+class MeasureRawTile(
+    BaseUUIDModel,
+    BaseTimestampModel,
+    MeasureRawTileBase,
+    table=True,
+):
+    __tablename__ = "raw_data_tiles"
+    __table_args__ = (
+        UniqueConstraint(
+            "measure_id",
+            "channel",
+            "axis",
+            "level",
+            name="measure_raw_data_tiles_measure_id_channel_axis_level_key",
+        ),
+        {"schema": "measure"},
+    )
+    measure_info: "MeasureInfo" = Relationship(
+        back_populates="raw_tiles",
+        sa_relationship_kwargs={"lazy": "select"},
+    )
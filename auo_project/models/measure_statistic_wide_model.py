@@ -0,0 +1,37 @@
+from typing import Dict
+from uuid import UUID
+
+from sqlalchemy import ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Column, Field
+from sqlmodel.sql.sqltypes import GUID
+
+from auo_project.models.base_model import BaseModel, BaseTimestampModel, BaseUUIDModel
+
+
+class MeasureStatisticWideBase(BaseModel):
+    # on delete cascade, as created by migration 7a3f5e2c9b84
+    measure_id: UUID = Field(
+        sa_column=Column(
+            GUID(),
+            ForeignKey("measure.infos.id", ondelete="CASCADE"),
+            index=True,
+            unique=True,
+            nullable=False,
+        ),
+    )
+    # {hand_position: {column: value}} of measure.statistics, e.g.
+    # {"l_cu": {"a0": 1.0, "c1": 0.5, ...}, ...}
+    mean: Dict[str, dict] = Field(default={}, nullable=False, sa_column=Column(JSONB))
+    std: Dict[str, dict] = Field(default={}, nullable=False, sa_column=Column(JSONB))
+    cv: Dict[str, dict] = Field(default={}, nullable=False, sa_column=Column(JSONB))
+
+
+class MeasureStatisticWide(
+    BaseUUIDModel,
+    BaseTimestampModel,
+    MeasureStatisticWideBase,
+    table=True,
+):
+    __tablename__ = "statistics_wide"
+    __table_args__ = {"schema": "measure"}
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import ClassVar, List, Optional
 from uuid import UUID
 
 from pydantic import EmailStr
@@ -56,6 +56,8 @@ class User(BaseUUIDModel, BaseTimestampModel, UserBase, table=True):
     __tablename__ = "auth_users"
     __table_args__ = {"schema": "app"}
     hashed_password: str = Field(max_length=100, nullable=False, index=False)
+    # permission bitset of a user resolved by core.principal, see core.permission
+    permission_mask: ClassVar[Optional[int]] = None
     org: Optional["Org"] = Relationship(
         back_populates="users",
         sa_relationship_kwargs={"lazy": "selectin"},
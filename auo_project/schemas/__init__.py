@@ -60,6 +60,11 @@ from auo_project.schemas.measure_bcq_schema import (
     BCQUpdate,
 )
 from auo_project.schemas.measure_disease_option_schema import MeasureDiseaseOption
+from auo_project.schemas.measure_image_derivative_schema import (
+    MeasureImageDerivativeCreate,
+    MeasureImageDerivativeRead,
+    MeasureImageDerivativeUpdate,
+)
 from auo_project.schemas.measure_info_schema import (
     BCQ,
     IrregularHR,
@@ -84,6 +89,16 @@ from auo_project.schemas.measure_info_schema import (
     TongueImage,
     TongueInfo,
 )
+from auo_project.schemas.measure_mean_aggregate_schema import (
+    MeasureMeanAggregateCreate,
+    MeasureMeanAggregateRead,
+    MeasureMeanAggregateUpdate,
+)
+from auo_project.schemas.measure_mean_member_schema import (
+    MeasureMeanMemberCreate,
+    MeasureMeanMemberRead,
+    MeasureMeanMemberUpdate,
+)
 from auo_project.schemas.measure_mean_schema import (
     MeasureMeanCreate,
     MeasureMeanRead,
@@ -94,12 +109,22 @@ from auo_project.schemas.measure_raw_schema import (
     MeasureRawRead,
     MeasureRawUpdate,
 )
+from auo_project.schemas.measure_raw_tile_schema import (
+    MeasureRawTileCreate,
+    MeasureRawTileRead,
+    MeasureRawTileUpdate,
+)
 from auo_project.schemas.measure_statistic_schema import (
     MeasureStatisticCreate,
     MeasureStatisticFlat,
     MeasureStatisticRead,
     MeasureStatisticUpdate,
 )
+from auo_project.schemas.measure_statistic_wide_schema import (
+    MeasureStatisticWideCreate,
+    MeasureStatisticWideRead,
+    MeasureStatisticWideUpdate,
+)
 from auo_project.schemas.measure_survey_result_schema import (
     MeasureSurveyResultCreate,
     MeasureSurveyResultRead,
@@ -0,0 +1,15 @@
+from uuid import UUID
+
+from auo_project.models.measure_image_derivative_model import MeasureImageDerivativeBase
+
+
+class MeasureImageDerivativeRead(MeasureImageDerivativeBase):
+    id: UUID
+
+
+class MeasureImageDerivativeCreate(MeasureImageDerivativeBase):
+    pass
+
+
+class MeasureImageDerivativeUpdate(MeasureImageDerivativeBase):
+    pass
@@ -0,0 +1,15 @@
+from uuid import UUID
+
+from auo_project.models.measure_mean_aggregate_model import MeasureMeanAggregateBase
+
+
+class MeasureMeanAggregateRead(MeasureMeanAggregateBase):
+    id: UUID
+
+
+class MeasureMeanAggregateCreate(MeasureMeanAggregateBase):
+    pass
+
+
+class MeasureMeanAggregateUpdate(MeasureMeanAggregateBase):
+    pass
@@ -0,0 +1,15 @@
+from uuid import UUID
+
+from auo_project.models.measure_mean_member_model import MeasureMeanMemberBase
+
+
+class MeasureMeanMemberRead(MeasureMeanMemberBase):
+    id: UUID
+
+
+class MeasureMeanMemberCreate(MeasureMeanMemberBase):
+    pass
+
+
+class MeasureMeanMemberUpdate(MeasureMeanMemberBase):
+    pass
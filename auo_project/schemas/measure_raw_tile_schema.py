@@ -0,0 +1,15 @@
+from uuid import UUID
+
+from auo_project.models.measure_raw_tile_model import MeasureRawTileBase
+
+
+class MeasureRawTileRead(MeasureRawTileBase):
+    id: UUID
+
+
+class MeasureRawTileCreate(MeasureRawTileBase):
+    pass
+
+
+class MeasureRawTileUpdate(MeasureRawTileBase):
+    pass
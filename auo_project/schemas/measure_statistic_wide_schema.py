@@ -0,0 +1,15 @@
+from uuid import UUID
+
+from auo_project.models.measure_statistic_wide_model import MeasureStatisticWideBase
+
+
+class MeasureStatisticWideRead(MeasureStatisticWideBase):
+    id: UUID
+
+
+class MeasureStatisticWideCreate(MeasureStatisticWideBase):
+    pass
+
+
+class MeasureStatisticWideUpdate(MeasureStatisticWideBase):
+    pass
@@ -0,0 +1,42 @@
+"""
+One event loop per worker process for the async tasks.
+
+`async_to_sync` ran every task in a new event loop, and the database engine,
+redis and http clients, kept per event loop, were built again for every
+task. `run_async` runs the coroutines of a process in one loop kept running
+in a daemon thread, created again in a forked process.
+"""
+import asyncio
+import functools
+import os
+from threading import Lock, Thread
+from typing import Any, Awaitable, Callable, Optional
+
+_lock = Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_pid: Optional[int] = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _pid
+    with _lock:
+        if _loop is None or _pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _pid = os.getpid()
+            Thread(target=_loop.run_forever, name="task-loop", daemon=True).start()
+        return _loop
+
+
+def run_async(func: Callable[..., Awaitable[Any]]) -> Callable[..., Any]:
+    """call `func` in the loop of the process and wait for its result"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        future = asyncio.run_coroutine_threadsafe(func(*args, **kwargs), get_loop())
+        return future.result()
+
+    return wrapper
+
+
+def has_loop() -> bool:
+    return _loop is not None and _pid == os.getpid()
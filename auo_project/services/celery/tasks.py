@@ -1,21 +1,26 @@
+from typing import List
 from uuid import UUID
 
-from asgiref.sync import async_to_sync
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown
 
 from auo_project.core.cc import (
     generate_tongue_cc_image,
     generate_tongue_wb_image,
     process_tongue_image,
 )
+from auo_project.core.derivative import generate_image_derivatives_of_locs
 from auo_project.core.measure import (
     create_merged_measures,
+    fold_measure_cn_means,
     update_measure_cn_means,
     update_measure_cn_means_by_human,
 )
 from auo_project.core.recipe import remove_inactive_recipes
 from auo_project.core.upload import post_finish, update_uploading_upload_status
+from auo_project.db.session import engines
 from auo_project.services.celery import celery_app
+from auo_project.services.celery.loop import has_loop, run_async
 
 
 @celery_app.on_after_configure.connect
@@ -34,6 +39,13 @@ def setup_periodic_tasks(sender, **kwargs):
         expire=60,
     )
 
+    # Call every minute
+    sender.add_periodic_task(
+        crontab(minute="*"),
+        task_fold_measure_cn_means.s(),
+        expire=60,
+    )
+
     # Call everyday
     sender.add_periodic_task(
         crontab(
@@ -52,6 +64,12 @@ def setup_periodic_tasks(sender, **kwargs):
     )
 
 
+@worker_process_shutdown.connect
+def close_db_connections(**kwargs):
+    if has_loop():
+        run_async(engines.dispose)()
+
+
 @celery_app.task(acks_late=True)
 def test_celery(word: str) -> str:
     return f"test task return {word}"
@@ -59,40 +77,50 @@ def test_celery(word: str) -> str:
 
 @celery_app.task()
 def tusd_post_finish(arbitrary_json):
-    async_to_sync(post_finish)(arbitrary_json)
+    run_async(post_finish)(arbitrary_json)
 
 
 @celery_app.task()
 def task_update_measure_cn_means():
-    async_to_sync(update_measure_cn_means)()
-    async_to_sync(update_measure_cn_means_by_human)()
+    run_async(update_measure_cn_means)()
+    run_async(update_measure_cn_means_by_human)()
+
+
+@celery_app.task()
+def task_fold_measure_cn_means():
+    run_async(fold_measure_cn_means)()
 
 
 @celery_app.task()
 def task_cleanup_inactive_recipes():
-    async_to_sync(remove_inactive_recipes)()
+    run_async(remove_inactive_recipes)()
 
 
 @celery_app.task()
 def task_update_uploading_upload_status():
-    async_to_sync(update_uploading_upload_status)()
+    run_async(update_uploading_upload_status)()
 
 
 @celery_app.task()
 def task_create_merged_measures():
-    async_to_sync(create_merged_measures)()
+    run_async(create_merged_measures)()
 
 
 @celery_app.task(retry_kwargs={"max_retries": 3})
 def task_generate_tongue_wb_image(front_or_back: str, config_id: UUID):
-    async_to_sync(generate_tongue_wb_image)(front_or_back, config_id)
+    run_async(generate_tongue_wb_image)(front_or_back, config_id)
 
 
 @celery_app.task(retry_kwargs={"max_retries": 3})
 def task_generate_tongue_cc_image(front_or_back: str, config_id: UUID):
-    async_to_sync(generate_tongue_cc_image)(front_or_back, config_id)
+    run_async(generate_tongue_cc_image)(front_or_back, config_id)
+
+
+@celery_app.task(retry_kwargs={"max_retries": 3})
+def task_generate_image_derivatives(source_locs: List[str]):
+    run_async(generate_image_derivatives_of_locs)(source_locs)
 
 
 @celery_app.task(retry_kwargs={"max_retries": 3})
 def task_process_tongue_image(tongue_upload_id: UUID):
-    async_to_sync(process_tongue_image)(tongue_upload_id)
+    run_async(process_tongue_image)(tongue_upload_id)
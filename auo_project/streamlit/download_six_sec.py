@@ -6,6 +6,7 @@ from sqlalchemy import create_engine
 
 import streamlit as st
 from auo_project.core.config import settings
+from auo_project.core.waveform import decode_waveform, round_float32
 
 
 def safe_float(value):
@@ -15,6 +16,15 @@ def safe_float(value):
         return value
 
 
+def get_six_sec_values(text, content):
+    """values of a six sec channel, decoded from the binary column without text"""
+    if text:
+        return map(safe_float, text.strip("\r\n").split("\n"))
+    if content:
+        return round_float32(decode_waveform(bytes(content))[:, 0]).tolist()
+    return []
+
+
 def page():
     if "run_button" in st.session_state and st.session_state.run_button == True:
         st.session_state.disabled = True
@@ -58,7 +68,13 @@ def page():
                         raw_data.six_sec_l_ch,
                         raw_data.six_sec_r_cu,
                         raw_data.six_sec_r_qu,
-                        raw_data.six_sec_r_ch
+                        raw_data.six_sec_r_ch,
+                        raw_data.six_sec_l_cu_bin,
+                        raw_data.six_sec_l_qu_bin,
+                        raw_data.six_sec_l_ch_bin,
+                        raw_data.six_sec_r_cu_bin,
+                        raw_data.six_sec_r_qu_bin,
+                        raw_data.six_sec_r_ch_bin
                     from measure.raw_data
                     inner join measure.infos on raw_data.measure_id = infos.id
                     where raw_data.measure_id = %s
@@ -92,36 +108,12 @@ def page():
                     "six_sec_r_ch",
                 ],
             )
-            six_sec_l_cu = (
-                map(safe_float, record[3].strip("\r\n").split("\n"))
-                if record[3]
-                else []
-            )
-            six_sec_l_qu = (
-                map(safe_float, record[4].strip("\r\n").split("\n"))
-                if record[4]
-                else []
-            )
-            six_sec_l_ch = (
-                map(safe_float, record[5].strip("\r\n").split("\n"))
-                if record[5]
-                else []
-            )
-            six_sec_r_cu = (
-                map(safe_float, record[6].strip("\r\n").split("\n"))
-                if record[6]
-                else []
-            )
-            six_sec_r_qu = (
-                map(safe_float, record[7].strip("\r\n").split("\n"))
-                if record[7]
-                else []
-            )
-            six_sec_r_ch = (
-                map(safe_float, record[8].strip("\r\n").split("\n"))
-                if record[8]
-                else []
-            )
+            six_sec_l_cu = get_six_sec_values(record[3], record[9])
+            six_sec_l_qu = get_six_sec_values(record[4], record[10])
+            six_sec_l_ch = get_six_sec_values(record[5], record[11])
+            six_sec_r_cu = get_six_sec_values(record[6], record[12])
+            six_sec_r_qu = get_six_sec_values(record[7], record[13])
+            six_sec_r_ch = get_six_sec_values(record[8], record[14])
             points_it = zip_longest(
                 six_sec_l_cu,
                 six_sec_l_qu,
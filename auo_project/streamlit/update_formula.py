@@ -117,7 +117,7 @@ def save_formula(column_name, code_string):
     cursor.execute(
         f"""
 update measure.custom_formulas
-set {column_name} = %s
+set {column_name} = %s, updated_at = now()
 """,
         (code_string,),
     )
@@ -61,8 +61,6 @@ async def _engine() -> AsyncGenerator[AsyncEngine, None]:
         if settings.ENVIRONMENT == "testing"
         else settings.DATABASE_NAME
     )
-    from auo_project.db.session import engine
-
     engine = get_engine(dbname)
     try:
         yield engine
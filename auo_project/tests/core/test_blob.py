@@ -0,0 +1,73 @@
+from io import BytesIO
+
+import pytest
+
+from auo_project.core.blob import BlobStore, LocalBlobBackend
+
+
+@pytest.fixture
+def blob_store(tmp_path) -> BlobStore:
+    return BlobStore(LocalBlobBackend(root=str(tmp_path), account="internet"))
+
+
+@pytest.mark.anyio
+async def test_local_round_trip(blob_store: BlobStore, tmp_path) -> None:
+    items = [
+        ("images", "org/1/T_up.jpg", b"front"),
+        ("images", "org/1/T_down.jpg", BytesIO(b"back")),
+        ("raw", "measure.zip", "text"),
+    ]
+
+    paths = await blob_store.upload_many(items)
+
+    assert paths == ["org/1/T_up.jpg", "org/1/T_down.jpg", "measure.zip"]
+    assert (tmp_path / "internet" / "images" / "org/1/T_up.jpg").read_bytes() == (
+        b"front"
+    )
+    contents = await blob_store.download_many(
+        [(container, path) for container, path, _ in reversed(items)],
+    )
+    assert contents == [b"text", b"back", b"front"]
+    assert await blob_store.exists("images", "org/1/T_up.jpg")
+
+    await blob_store.delete_many([("images", "org/1/T_up.jpg"), ("raw", "measure.zip")])
+
+    assert not await blob_store.exists("images", "org/1/T_up.jpg")
+    assert not await blob_store.exists("raw", "measure.zip")
+    assert await blob_store.download("images", "org/1/T_down.jpg") == b"back"
+
+
+@pytest.mark.anyio
+async def test_local_metrics(blob_store: BlobStore) -> None:
+    await blob_store.upload_many(
+        [("images", f"{i}.jpg", b"x" * (i + 1)) for i in range(3)],
+    )
+    await blob_store.download_many([("images", "0.jpg"), ("images", "2.jpg")])
+    await blob_store.delete_many([("images", "1.jpg")])
+
+    stats = blob_store.metrics.snapshot()
+
+    assert {op: stat["count"] for op, stat in stats.items()} == {
+        "upload": 3,
+        "download": 2,
+        "delete": 1,
+    }
+    assert stats["upload"]["bytes"] == 1 + 2 + 3
+    assert stats["download"]["bytes"] == 1 + 3
+    assert stats["delete"]["bytes"] == 0
+    assert stats["upload"]["max_seconds"] <= stats["upload"]["seconds"]
+    assert blob_store.metrics.last["op"] == "delete"
+    assert blob_store.metrics.last["path"] == "1.jpg"
+
+
+@pytest.mark.anyio
+async def test_local_no_overwrite_and_escape(blob_store: BlobStore) -> None:
+    await blob_store.upload("images", "a.jpg", b"a")
+
+    with pytest.raises(FileExistsError):
+        await blob_store.upload("images", "a.jpg", b"b", overwrite=False)
+    with pytest.raises(ValueError):
+        await blob_store.upload("images", "../../outside.jpg", b"c")
+    with pytest.raises(FileNotFoundError):
+        await blob_store.download("images", "missing.jpg")
+    assert await blob_store.download("images", "a.jpg") == b"a"
@@ -0,0 +1,205 @@
+import contextlib
+import statistics
+from decimal import Decimal
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from auo_project import crud
+from auo_project.core import measure as measure_module
+from auo_project.core.config import settings
+from auo_project.core.measure import fold_measure_cn_means, get_cn_means_dict
+from auo_project.crud import measure_mean_aggregate_crud as aggregate_crud
+from auo_project.crud.measure_mean_aggregate_crud import get_norm
+
+VALUES = [0.81, 1.02, 0.97, 1.15, 0.88]
+
+
+def make_aggregate(values, name="a0", hand="Left", position="Qu"):
+    """what the delta statement keeps for `values`"""
+    return SimpleNamespace(
+        hand=hand,
+        position=position,
+        name=name,
+        n=len(values),
+        total=sum(Decimal(str(value)) for value in values),
+        total_sq=sum(Decimal(str(value)) ** 2 for value in values),
+    )
+
+
+def test_norms_of_running_sums() -> None:
+    aggregate = make_aggregate(VALUES)
+    args = (aggregate.n, aggregate.total, aggregate.total_sq)
+
+    assert get_norm(*args, "MEAN") == pytest.approx(statistics.mean(VALUES))
+    assert get_norm(*args, "STD") == pytest.approx(statistics.stdev(VALUES))
+    assert get_norm(*args, "CV") == pytest.approx(
+        statistics.stdev(VALUES) / statistics.mean(VALUES),
+    )
+
+
+def test_norms_after_taking_back_a_measure() -> None:
+    aggregate = make_aggregate(VALUES)
+    removed = make_aggregate(VALUES[:1])
+
+    n = aggregate.n - removed.n
+    total = aggregate.total - removed.total
+    total_sq = aggregate.total_sq - removed.total_sq
+
+    assert get_norm(n, total, total_sq, "MEAN") == pytest.approx(
+        statistics.mean(VALUES[1:]),
+    )
+    assert get_norm(n, total, total_sq, "STD") == pytest.approx(
+        statistics.stdev(VALUES[1:]),
+    )
+
+
+def test_norms_of_few_values() -> None:
+    assert get_norm(0, 0, 0, "MEAN") is None
+    assert get_norm(1, Decimal("2.5"), Decimal("6.25"), "MEAN") == 2.5
+    assert get_norm(1, Decimal("2.5"), Decimal("6.25"), "STD") is None
+    assert get_norm(2, Decimal("5"), Decimal("12.5"), "STD") == 0
+    assert get_norm(2, Decimal("0"), Decimal("0"), "CV") is None
+
+
+def test_norm_dict() -> None:
+    aggregates = [
+        make_aggregate(VALUES, name="a0"),
+        make_aggregate(VALUES[:3], name="c1"),
+        make_aggregate(VALUES, name="a0", hand="Right", position="Ch"),
+    ]
+
+    norm_dict = crud.measure_cn_mean_aggregate.get_norm_dict(aggregates, "std")
+
+    assert set(norm_dict) == {"l_qu", "r_ch"}
+    assert norm_dict["l_qu"].cnt == len(VALUES)
+    assert norm_dict["l_qu"].c1 == pytest.approx(statistics.stdev(VALUES[:3]))
+    assert norm_dict["l_qu"].p11 is None
+    assert norm_dict["r_ch"].a0 == pytest.approx(statistics.stdev(VALUES))
+    with pytest.raises(ValueError):
+        crud.measure_cn_mean_aggregate.get_norm_dict(aggregates, "MAX")
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "cn_means_measure_id, source",
+    [(None, "aggregates"), ("86eacaf9-5109-47e8-be41-45fe823a1a29", "overall_means")],
+)
+async def test_cn_means_dict_source(monkeypatch, cn_means_measure_id, source) -> None:
+    calls = []
+
+    async def get_norm_dict_by_sex(db_session, *, sex):
+        calls.append(("aggregates", sex))
+        return {}
+
+    async def get_dict_by_sex(db_session, *, sex):
+        calls.append(("overall_means", sex))
+        return {}
+
+    monkeypatch.setattr(
+        crud.measure_cn_mean_aggregate,
+        "get_norm_dict_by_sex",
+        get_norm_dict_by_sex,
+    )
+    monkeypatch.setattr(crud.measure_cn_mean, "get_dict_by_sex", get_dict_by_sex)
+    monkeypatch.setattr(settings, "CN_MEANS_MEASURE_ID", cn_means_measure_id)
+
+    await get_cn_means_dict(db_session=None, sex=1)
+
+    assert calls == [(source, 1)]
+
+
+class FakeSession:
+    """records the statements, the dequeue returns `pending`"""
+
+    def __init__(self, pending=()):
+        self.pending = list(pending)
+        self.statements = []
+        self.commits = 0
+
+    async def execute(self, statement, params=None):
+        self.statements.append((statement, params))
+        return SimpleNamespace(
+            scalars=lambda: SimpleNamespace(all=lambda: self.pending),
+        )
+
+    async def commit(self):
+        self.commits += 1
+
+
+@pytest.mark.anyio
+async def test_enqueue_writes_only_the_queue() -> None:
+    db_session = FakeSession()
+    measure_ids = [uuid4(), uuid4()]
+
+    await crud.measure_cn_mean_aggregate.enqueue(
+        db_session=db_session,
+        measure_ids=measure_ids,
+        autocommit=False,
+    )
+
+    [(statement, params)] = db_session.statements
+    assert statement is aggregate_crud.ENQUEUE_STATEMENT
+    assert "overall_mean_aggregates" not in str(statement)
+    assert params["measure_ids"] == measure_ids
+    assert db_session.commits == 0
+
+
+@pytest.mark.anyio
+async def test_fold_syncs_the_dequeued_measures() -> None:
+    pending = [uuid4(), uuid4()]
+    db_session = FakeSession(pending)
+
+    folded = await crud.measure_cn_mean_aggregate.fold(
+        db_session=db_session,
+        limit=10,
+    )
+
+    assert folded == 2
+    assert [statement for statement, _ in db_session.statements] == [
+        aggregate_crud.DEQUEUE_STATEMENT,
+        aggregate_crud.LOCK_MEMBERS_STATEMENT,
+        aggregate_crud.APPLY_DELTA_STATEMENT,
+        aggregate_crud.DELETE_MEMBERS_STATEMENT,
+        aggregate_crud.INSERT_MEMBERS_STATEMENT,
+    ]
+    assert db_session.statements[0][1] == {"limit": 10}
+    assert db_session.statements[1][1] == {"measure_ids": pending}
+    assert db_session.commits == 1
+
+
+@pytest.mark.anyio
+async def test_fold_of_an_empty_queue() -> None:
+    db_session = FakeSession()
+
+    folded = await crud.measure_cn_mean_aggregate.fold(
+        db_session=db_session,
+        limit=10,
+    )
+
+    assert folded == 0
+    assert [statement for statement, _ in db_session.statements] == [
+        aggregate_crud.DEQUEUE_STATEMENT,
+    ]
+
+
+@pytest.mark.anyio
+async def test_fold_until_the_queue_is_short(monkeypatch) -> None:
+    batches = [3, 3, 1, 3]
+    limits = []
+
+    @contextlib.asynccontextmanager
+    async def get_db2():
+        yield None
+
+    async def fold(db_session, *, limit):
+        limits.append(limit)
+        return batches.pop(0)
+
+    monkeypatch.setattr(measure_module.deps, "get_db2", get_db2)
+    monkeypatch.setattr(crud.measure_cn_mean_aggregate, "fold", fold)
+    monkeypatch.setattr(settings, "CN_MEANS_FOLD_BATCH_SIZE", 3)
+
+    assert await fold_measure_cn_means() == 7
+    assert limits == [3, 3, 3]
@@ -0,0 +1,458 @@
+import asyncio
+import contextlib
+import pickle
+from datetime import datetime
+from io import BytesIO
+from types import SimpleNamespace
+from uuid import uuid4
+from zipfile import ZipFile
+
+import numpy as np
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from auo_project import crud
+from auo_project.core import color_correction as color_correction_module
+from auo_project.core.color_correction import (
+    ColorCorrectionCache,
+    ColorCorrectionData,
+    _match_cumulative_cdf_mod,
+    cc_cache,
+    get_cc_instance,
+    get_cc_instance_size,
+    match_histograms_mod,
+    process_tongue_raw_images,
+)
+from auo_project.crud import measure_tongue_config_upload_crud as config_upload_crud
+
+
+def reference_match_cumulative_cdf(source, template, full):
+    """The per pixel implementation the lookup table has to reproduce."""
+    src_values, src_counts = np.unique(source.ravel(), return_counts=True)
+    tmpl_values, tmpl_counts = np.unique(template.ravel(), return_counts=True)
+    src_quantiles = np.cumsum(src_counts) / source.size
+    tmpl_quantiles = np.cumsum(tmpl_counts) / template.size
+    interp_a_values = np.interp(src_quantiles, tmpl_quantiles, tmpl_values)
+
+    interpb = [-1] * 256
+    for i in range(0, len(interp_a_values)):
+        interpb[src_values[i]] = interp_a_values[i]
+
+    prev_value = -1
+    prev_index = -1
+    for i in range(0, 256):
+        if interpb[i] == -1:
+            next_index = -1
+            next_value = -1
+            for j in range(i + 1, 256):
+                if interpb[j] >= 0:
+                    next_value = interpb[j]
+                    next_index = j
+            if prev_index < 0:
+                interpb[i] = (i + 1) * next_value / (next_index + 1)
+            elif next_index < 0:
+                interpb[i] = prev_value + (
+                    (255 - prev_value) * (i - prev_index) / (255 - prev_index)
+                )
+            else:
+                interpb[i] = prev_value + (i - prev_index) * (
+                    next_value - prev_value
+                ) / (next_index - prev_index)
+        else:
+            prev_value = interpb[i]
+            prev_index = i
+
+    ret2 = np.zeros(full.shape)
+    for i in range(0, full.shape[0]):
+        for j in range(0, full.shape[1]):
+            ret2[i][j] = interpb[full[i][j]]
+    return ret2
+
+
+def reference_match_histograms(inputCard, referenceCard, fullImage):
+    matched = np.empty(fullImage.shape, dtype=fullImage.dtype)
+    for channel in range(inputCard.shape[-1]):
+        matched[..., channel] = reference_match_cumulative_cdf(
+            inputCard[..., channel],
+            referenceCard[..., channel],
+            fullImage[..., channel],
+        )
+    return matched
+
+
+def random_card(rng, low: int, high: int, shape=(24, 32, 3)) -> np.ndarray:
+    return rng.integers(low, high + 1, shape, dtype=np.uint8)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_match_histograms_mod_same_as_reference(seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    # narrow cards leave gaps before, between and after the source values
+    low, high = sorted(rng.integers(0, 256, 2))
+    input_card = random_card(rng, low, max(high, low + 1))
+    reference_card = random_card(rng, 0, 255)
+    full_image = random_card(rng, 0, 255, shape=(40, 50, 3))
+
+    expected = reference_match_histograms(input_card, reference_card, full_image)
+    matched = match_histograms_mod(input_card, reference_card, full_image)
+
+    assert matched.dtype == np.uint8
+    assert np.array_equal(matched, expected)
+
+
+@pytest.mark.parametrize(
+    "low, high",
+    [(0, 0), (255, 255), (0, 255), (100, 101), (3, 250)],
+)
+def test_match_cumulative_cdf_mod_same_as_reference(low: int, high: int) -> None:
+    rng = np.random.default_rng(low * 256 + high)
+    source = random_card(rng, low, high, shape=(16, 16))
+    template = random_card(rng, 0, 255, shape=(16, 16))
+    full = random_card(rng, 0, 255, shape=(30, 20))
+
+    expected = reference_match_cumulative_cdf(source, template, full)
+    matched = _match_cumulative_cdf_mod(source, template, full)
+
+    assert np.array_equal(matched, expected)
+
+
+def cc_config_zip() -> bytes:
+    cc_pickle = pickle.dumps(
+        ColorCorrectionData(imageCard=np.zeros((2, 2, 3)), referenceCard=None),
+    )
+    zip_file = BytesIO()
+    with ZipFile(zip_file, mode="w") as config_zip:
+        config_zip.writestr("config/color_correction.pkl", cc_pickle)
+    return zip_file.getvalue()
+
+
+@pytest.fixture
+def config_uploads(monkeypatch):
+    """
+    the latest tongue config upload of every color hash, a test replaces it
+    to save a newer upload; returns the uploads and the downloaded paths
+    """
+    zip_bytes = cc_config_zip()
+    uploads = {
+        "c1": SimpleNamespace(
+            id=uuid4(),
+            updated_at=datetime(2024, 1, 1),
+            file_loc="org/config.zip",
+        ),
+    }
+    downloads = []
+
+    async def get_by_color_hash(db_session, org_id, color_hash):
+        return uploads.get(color_hash)
+
+    async def download(container, path):
+        downloads.append(path)
+        return zip_bytes
+
+    monkeypatch.setattr(
+        crud.measure_tongue_config_upload,
+        "get_by_color_hash",
+        get_by_color_hash,
+    )
+    monkeypatch.setattr(config_upload_crud.private_blob_store, "download", download)
+    cc_cache.clear()
+    yield uploads, downloads
+    cc_cache.clear()
+
+
+@pytest.mark.anyio
+async def test_cc_instance_downloaded_once(config_uploads) -> None:
+    _, downloads = config_uploads
+
+    org_id = uuid4()
+    first = await get_cc_instance(db_session=None, org_id=org_id, color_hash="c1")
+    again = await get_cc_instance(db_session=None, org_id=org_id, color_hash="c1")
+
+    assert isinstance(first, ColorCorrectionData)
+    assert first.imageCard.shape == (2, 2, 3)
+    assert again is first
+    assert downloads == ["org/config.zip"]
+    assert cc_cache.stats()["hits"] == 1
+    assert cc_cache.stats()["misses"] == 1
+
+
+@pytest.mark.anyio
+async def test_cc_instance_of_newer_upload(config_uploads) -> None:
+    uploads, downloads = config_uploads
+    org_id = uuid4()
+    first = await get_cc_instance(db_session=None, org_id=org_id, color_hash="c1")
+
+    # saved by another process, this one was not invalidated
+    uploads["c1"] = SimpleNamespace(
+        id=uuid4(),
+        updated_at=datetime(2024, 2, 1),
+        file_loc="org/config2.zip",
+    )
+    newer = await get_cc_instance(db_session=None, org_id=org_id, color_hash="c1")
+    again = await get_cc_instance(db_session=None, org_id=org_id, color_hash="c1")
+
+    assert newer is not first
+    assert again is newer
+    assert downloads == ["org/config.zip", "org/config2.zip"]
+    assert cc_cache.stats()["entries"] == 1
+
+
+def cc_instance_of_bytes(nbytes: int) -> ColorCorrectionData:
+    return ColorCorrectionData(
+        imageCard=np.zeros(nbytes, dtype=np.uint8),
+        referenceCard=None,
+    )
+
+
+def test_cc_cache_evicts_least_recently_used() -> None:
+    size = get_cc_instance_size(cc_instance_of_bytes(1000))
+    cache = ColorCorrectionCache(max_bytes=size * 5 // 2)
+    org_id = uuid4()
+    a, b, c = (cc_instance_of_bytes(1000) for _ in range(3))
+
+    cache.put((org_id, "a"), 1, a)
+    cache.put((org_id, "b"), 1, b)
+    assert cache.get((org_id, "a"), 1) is a
+    cache.put((org_id, "c"), 1, c)
+
+    assert cache.get((org_id, "b"), 1) is None
+    assert cache.get((org_id, "a"), 1) is a
+    assert cache.get((org_id, "c"), 1) is c
+    assert cache.stats() == {
+        "entries": 2,
+        "bytes": size * 2,
+        "max_bytes": size * 5 // 2,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+    }
+
+
+def test_cc_cache_counters() -> None:
+    size = get_cc_instance_size(cc_instance_of_bytes(1000))
+    cache = ColorCorrectionCache(max_bytes=size * 2)
+    key = (uuid4(), "a")
+
+    assert cache.get(key, 1) is None
+    cache.put(key, 1, cc_instance_of_bytes(1000))
+    assert cache.get(key, 1) is not None
+    # an entry of another version is a miss
+    assert cache.get(key, 2) is None
+    # replacing an entry is not an eviction
+    cache.put(key, 2, cc_instance_of_bytes(1000))
+    # an instance larger than the cache is not kept
+    cache.put((uuid4(), "b"), 1, cc_instance_of_bytes(size * 3))
+
+    assert cache.stats() == {
+        "entries": 1,
+        "bytes": size,
+        "max_bytes": size * 2,
+        "hits": 1,
+        "misses": 2,
+        "evictions": 0,
+    }
+
+
+def test_cc_cache_invalidate() -> None:
+    cache = ColorCorrectionCache(max_bytes=10**6)
+    org_id, other_org_id = uuid4(), uuid4()
+    for key in ((org_id, "a"), (org_id, "b"), (other_org_id, "a")):
+        cache.put(key, 1, cc_instance_of_bytes(10))
+
+    cache.invalidate(org_id=org_id, color_hash="a")
+    assert cache.get((org_id, "a"), 1) is None
+    assert cache.get((org_id, "b"), 1) is not None
+
+    cache.invalidate(org_id=org_id)
+    assert cache.get((org_id, "b"), 1) is None
+    assert cache.get((other_org_id, "a"), 1) is not None
+    assert cache.stats()["entries"] == 1
+
+
+@pytest.mark.anyio
+async def test_config_upload_crud_invalidates_cc_cache(monkeypatch) -> None:
+    org_id = uuid4()
+    uploads = {}
+
+    async def create(self, *, db_session, obj_in, autocommit=True):
+        uploads[obj_in.id] = obj_in
+        return obj_in
+
+    async def update(self, *, db_session, obj_current, obj_new, autocommit=True):
+        for key, value in obj_new.items():
+            setattr(obj_current, key, value)
+        return obj_current
+
+    async def get(self, *, db_session, id):
+        return uploads.get(id)
+
+    async def remove(self, *, db_session, id, autocommit=True):
+        uploads.pop(id)
+
+    for name, func in (
+        ("create", create),
+        ("update", update),
+        ("get", get),
+        ("remove", remove),
+    ):
+        monkeypatch.setattr(config_upload_crud.CRUDBase, name, func)
+
+    def cache_all():
+        cc_cache.clear()
+        for color_hash in ("c1", "c2", "c3"):
+            cc_cache.put((org_id, color_hash), 1, cc_instance_of_bytes(10))
+
+    def cached():
+        return sorted(
+            color_hash
+            for color_hash in ("c1", "c2", "c3")
+            if cc_cache.get((org_id, color_hash), 1) is not None
+        )
+
+    config_crud = crud.measure_tongue_config_upload
+    config_upload = SimpleNamespace(id=uuid4(), org_id=org_id, color_hash="c1")
+
+    cache_all()
+    await config_crud.create(db_session=None, obj_in=config_upload)
+    assert cached() == ["c2", "c3"]
+
+    # both the old and the new color hash
+    cache_all()
+    await config_crud.update(
+        db_session=None,
+        obj_current=config_upload,
+        obj_new={"color_hash": "c2"},
+    )
+    assert cached() == ["c3"]
+
+    cache_all()
+    await config_crud.remove(db_session=None, id=config_upload.id)
+    assert cached() == ["c1", "c3"]
+    cc_cache.clear()
+
+
+class ClaimSession:
+    """the statement of a claim, compiled for postgres"""
+
+    def __init__(self):
+        self.sql = None
+
+    async def execute(self, statement):
+        self.sql = str(
+            statement.compile(
+                dialect=postgresql.dialect(),
+                compile_kwargs={"literal_binds": True},
+            ),
+        )
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: []))
+
+
+@pytest.mark.anyio
+async def test_claim_skips_locked_and_excluded_rows() -> None:
+    db_session = ClaimSession()
+    excluded = uuid4()
+
+    await crud.measure_tongue_upload.claim_unprocessed_rows(
+        db_session=db_session,
+        limit=5,
+        exclude_ids=[excluded],
+    )
+
+    assert db_session.sql.endswith("FOR UPDATE SKIP LOCKED")
+    assert "LIMIT 5" in db_session.sql
+    assert "NOT IN" in db_session.sql and excluded.hex in db_session.sql.replace(
+        "-", ""
+    )
+
+    await crud.measure_tongue_upload.claim_unprocessed_rows(
+        db_session=db_session, limit=5
+    )
+
+    assert "NOT IN" not in db_session.sql
+
+
+class TongueUploadTable:
+    """the tongue uploads and their row locks, like FOR UPDATE SKIP LOCKED"""
+
+    def __init__(self, records):
+        self.records = records
+        self.locks = {}
+
+    async def claim_unprocessed_rows(self, db_session, limit, exclude_ids=None):
+        claimed = [
+            record
+            for record in self.records
+            if record.corrected_loc is None
+            and self.locks.get(record.id, db_session) is db_session
+            and record.id not in (exclude_ids or [])
+        ][:limit]
+        for record in claimed:
+            self.locks[record.id] = db_session
+        await asyncio.sleep(0)
+        return claimed
+
+    async def update(self, db_session, obj_current, obj_new, autocommit=True):
+        assert self.locks[obj_current.id] is db_session
+        obj_current.corrected_loc = obj_new.tongue_front_corrected_loc
+
+    def release(self, db_session):
+        for record_id, owner in list(self.locks.items()):
+            if owner is db_session:
+                del self.locks[record_id]
+
+
+@pytest.mark.anyio
+async def test_process_tongue_raw_images_two_workers(monkeypatch) -> None:
+    records = [
+        SimpleNamespace(id=uuid4(), org_id=uuid4(), color_hash="c1", corrected_loc=None)
+        for _ in range(7)
+    ]
+    broken, unknown = records[2], records[5]
+    unknown.color_hash = "unknown"
+    table = TongueUploadTable(records)
+    corrected = []
+
+    class Session:
+        async def commit(self):
+            table.release(self)
+
+    @contextlib.asynccontextmanager
+    async def get_db2():
+        yield Session()
+
+    async def get_cc_instance(db_session, org_id, color_hash):
+        return None if color_hash == "unknown" else object()
+
+    async def correct_tongue_upload(record, cc_instance):
+        await asyncio.sleep(0)
+        corrected.append(record.id)
+        if record is broken:
+            raise OSError("blob upload failed")
+        return f"{record.id}/T_up_corrected.jpg", f"{record.id}/T_down_corrected.jpg"
+
+    monkeypatch.setattr(color_correction_module.deps, "get_db2", get_db2)
+    monkeypatch.setattr(color_correction_module, "get_cc_instance", get_cc_instance)
+    monkeypatch.setattr(
+        color_correction_module,
+        "correct_tongue_upload",
+        correct_tongue_upload,
+    )
+    for method in ("claim_unprocessed_rows", "update"):
+        monkeypatch.setattr(crud.measure_tongue_upload, method, getattr(table, method))
+
+    processed = await asyncio.gather(
+        process_tongue_raw_images(batch_size=2, concurrency=2),
+        process_tongue_raw_images(batch_size=2, concurrency=2),
+    )
+
+    assert sum(processed) == 5
+    assert all(processed)
+    assert not table.locks
+    good = [record for record in records if record not in (broken, unknown)]
+    # a locked row is skipped by the other worker, so each is corrected once
+    assert sorted(corrected.count(record.id) for record in good) == [1] * 5
+    assert all(record.corrected_loc for record in good)
+    # a failed record is excluded from the next claims of the worker
+    assert 1 <= corrected.count(broken.id) <= 2
+    assert unknown.id not in corrected
+    assert broken.corrected_loc is None and unknown.corrected_loc is None
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from uuid import uuid4
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from auo_project.core.config import settings
+from auo_project.core.denylist import BloomFilter, TokenDenylist
+from auo_project.core.redis import set_redis
+
+
+def make_token(sub: str = "tester", iat: float = None) -> dict:
+    now = time.time()
+    return {
+        "sub": sub,
+        "jti": str(uuid4()),
+        "iat": int(now if iat is None else iat),
+        "exp": int(now + 3600),
+    }
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"jti:{uuid4()}" for _ in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"jti:{uuid4()}" in bloom for _ in range(10000))
+    assert false_positives < 300
+
+
+@pytest.mark.anyio
+async def test_revoke_without_redis(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "REDIS_CACHE_ENABLED", False)
+    denylist = TokenDenylist(capacity=100, error_rate=0.01, refresh_seconds=60)
+    token = make_token()
+
+    assert not await denylist.is_revoked(token)
+    await denylist.revoke_token(token)
+    assert await denylist.is_revoked(token)
+    assert not await denylist.is_revoked(make_token())
+
+    await denylist.revoke_user_tokens("tester")
+    assert await denylist.is_revoked(make_token(iat=time.time() - 10))
+    assert not await denylist.is_revoked(make_token(iat=time.time() + 10))
+
+
+@pytest.mark.anyio
+async def test_revoke_with_redis(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "REDIS_CACHE_ENABLED", True)
+    server = FakeServer()
+    set_redis(FakeRedis(server=server))
+    worker = TokenDenylist(capacity=100, error_rate=0.01, refresh_seconds=60)
+    other_worker = TokenDenylist(capacity=100, error_rate=0.01, refresh_seconds=60)
+    try:
+        revoked, valid = make_token(), make_token()
+        await worker.revoke_token(revoked)
+
+        assert await worker.is_revoked(revoked)
+        assert await other_worker.is_revoked(revoked)
+        lookups = other_worker.lookups
+        assert not await other_worker.is_revoked(valid)
+        # the filter answered, no redis lookup
+        assert other_worker.lookups == lookups
+
+        other_worker.start()
+        await asyncio.sleep(0.1)
+        published = make_token()
+        await worker.revoke_token(published)
+        await asyncio.sleep(0.1)
+        assert f"jti:{published['jti']}" in other_worker.bloom
+        assert await other_worker.is_revoked(published)
+    finally:
+        await other_worker.stop()
+        set_redis(None)
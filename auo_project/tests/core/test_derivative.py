@@ -0,0 +1,245 @@
+import contextlib
+from datetime import datetime
+from io import BytesIO
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from PIL import Image
+
+from auo_project import crud, schemas
+from auo_project.core import derivative as derivative_module
+from auo_project.core import file as file_module
+from auo_project.core.derivative import (
+    DERIVATIVE_SIZES,
+    generate_image_derivatives_of_locs,
+    get_content_hash,
+    make_variants,
+    select_variant,
+    try_generate_image_derivatives,
+)
+
+
+def encode_image(width: int, height: int) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", (width, height), (200, 80, 90)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def test_make_variants_sizes_and_paths() -> None:
+    content = encode_image(2000, 1500)
+    content_hash = get_content_hash(content)
+
+    variants = make_variants(content, content_hash)
+
+    assert len(variants) == len(DERIVATIVE_SIZES) * 2
+    for variant, data in variants:
+        size = DERIVATIVE_SIZES[variant["name"]]
+        assert variant["width"] == size
+        assert variant["height"] == size * 3 // 4
+        assert variant["loc"].startswith(f"derivatives/{content_hash}/")
+        image = Image.open(BytesIO(data))
+        assert image.format == {"webp": "WEBP", "jpeg": "JPEG"}[variant["format"]]
+        assert image.size == (variant["width"], variant["height"])
+
+
+def test_make_variants_never_upscales() -> None:
+    content = encode_image(300, 200)
+
+    variants = make_variants(content, get_content_hash(content))
+
+    assert max(variant["width"] for variant, _ in variants) == 300
+
+
+def test_select_variant() -> None:
+    variants = [
+        {"name": name, "format": image_format, "width": width, "loc": name}
+        for name, width in (("thumb", 256), ("small", 640), ("large", 1280))
+        for image_format in ("webp", "jpeg")
+    ]
+
+    assert select_variant(variants, 200)["name"] == "thumb"
+    assert select_variant(variants, 256)["name"] == "thumb"
+    assert select_variant(variants, 700, "jpeg")["name"] == "large"
+    assert select_variant(variants, 700, "jpeg")["format"] == "jpeg"
+    assert select_variant(variants, 2000) is None
+
+
+class FakeSession:
+    """records the savepoints and commits"""
+
+    def __init__(self):
+        self.savepoints = []
+        self.commits = 0
+
+    async def flush(self):
+        pass
+
+    async def commit(self):
+        self.commits += 1
+
+    def begin_nested(self):
+        return FakeSavepoint(self)
+
+
+class FakeSavepoint:
+    def __init__(self, db_session):
+        self.db_session = db_session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.db_session.savepoints.append("rollback" if exc_type else "release")
+        return False
+
+
+def tongue_result_dict() -> dict:
+    measure_time = datetime(2024, 1, 2, 3, 4, 5)
+    return {
+        "infos.txt": schemas.FileInfos.construct(
+            number="A001",
+            measure_time=measure_time,
+            birth_date=datetime(1980, 1, 1),
+            sex=0,
+        ),
+        "infos_analyze.txt": schemas.FileInfosAnalyze(),
+        "report.txt": schemas.FileReport.construct(
+            name="A001",
+            id="A001",
+            number="A001",
+            birthday="1980/01/01",
+            measure_time="2024/01/02 03:04:05",
+        ),
+        "T_up.jpg": file_module.read_image(encode_image(800, 600)),
+        "T_down.jpg": file_module.read_image(encode_image(600, 800)),
+    }
+
+
+def measure_file() -> SimpleNamespace:
+    return SimpleNamespace(
+        id=uuid4(),
+        owner=SimpleNamespace(org_id=uuid4(), branch_id=uuid4()),
+    )
+
+
+@pytest.fixture
+def fake_measure_crud(monkeypatch):
+    """crud of `write_measure` and the derivatives without a database, returns
+    the derivative rows"""
+    rows = []
+
+    async def get_none(db_session, **kwargs):
+        return None
+
+    async def create(db_session, obj_in, autocommit=True):
+        return SimpleNamespace(id=uuid4(), **obj_in.dict())
+
+    async def upsert(db_session, *, source_loc, content_hash, variants, autocommit):
+        rows.append(
+            {
+                "source_loc": source_loc,
+                "content_hash": content_hash,
+                "variants": variants,
+            },
+        )
+
+    async def upload_many(items):
+        return list(items)
+
+    for crud_obj, method in (
+        (crud.subject, "get_by_number_and_org_id"),
+        (crud.measure_info, "get_exist_measure"),
+        (crud.measure_info, "get_by_file_id"),
+        (crud.measure_tongue, "get_by_measure_id"),
+        (crud.measure_raw, "get_by_measure_id"),
+        (crud.measure_image_derivative, "get_by_content_hash"),
+    ):
+        monkeypatch.setattr(crud_obj, method, get_none)
+    for crud_obj in (crud.subject, crud.measure_info, crud.measure_tongue):
+        monkeypatch.setattr(crud_obj, "create", create)
+    monkeypatch.setattr(crud.measure_raw, "create", create)
+    monkeypatch.setattr(crud.measure_raw_tile, "replace_all", get_none)
+    monkeypatch.setattr(crud.measure_image_derivative, "upsert", upsert)
+    monkeypatch.setattr(file_module.internet_blob_store, "upload_many", upload_many)
+    monkeypatch.setattr(
+        "auo_project.core.derivative.internet_blob_store.upload_many",
+        upload_many,
+    )
+    return rows
+
+
+@pytest.mark.anyio
+async def test_write_measure_queues_derivatives(monkeypatch, fake_measure_crud) -> None:
+    tasks = []
+    monkeypatch.setattr(
+        file_module.celery_app,
+        "send_task",
+        lambda name, kwargs: tasks.append((name, kwargs)),
+    )
+    db_session = FakeSession()
+
+    written = await file_module.write_measure(
+        file=measure_file(),
+        result_dict=tongue_result_dict(),
+        overwrite=False,
+        db_session=db_session,
+        autocommit=False,
+    )
+
+    assert written
+    # nothing is resized in the transaction of the measure
+    assert fake_measure_crud == []
+    assert db_session.savepoints == []
+    [(name, kwargs)] = tasks
+    assert name == "auo_project.services.celery.tasks.task_generate_image_derivatives"
+    assert [loc.rsplit("/", 1)[-1] for loc in kwargs["source_locs"]] == [
+        "T_up.jpg",
+        "T_down.jpg",
+    ]
+
+
+@pytest.mark.anyio
+async def test_derivatives_of_queued_locs(monkeypatch, fake_measure_crud) -> None:
+    images = {
+        "s/m/T_up.jpg": encode_image(800, 600),
+        "s/m/T_down.jpg": encode_image(600, 800),
+    }
+    db_session = FakeSession()
+
+    @contextlib.asynccontextmanager
+    async def get_db2():
+        yield db_session
+
+    async def download(container, path):
+        return images[path]
+
+    monkeypatch.setattr(derivative_module.deps, "get_db2", get_db2)
+    monkeypatch.setattr(derivative_module.internet_blob_store, "download", download)
+
+    await generate_image_derivatives_of_locs(list(images))
+
+    assert [row["source_loc"] for row in fake_measure_crud] == list(images)
+    for row in fake_measure_crud:
+        assert row["content_hash"] == get_content_hash(images[row["source_loc"]])
+        assert len(row["variants"]) == len(DERIVATIVE_SIZES) * 2
+
+
+@pytest.mark.anyio
+async def test_derivative_error_in_a_savepoint(monkeypatch, fake_measure_crud) -> None:
+    async def upsert(db_session, **kwargs):
+        raise RuntimeError("duplicate key")
+
+    monkeypatch.setattr(crud.measure_image_derivative, "upsert", upsert)
+    db_session = FakeSession()
+    content = encode_image(300, 200)
+
+    await try_generate_image_derivatives(
+        db_session=db_session,
+        sources=[("a.jpg", content), ("b.jpg", BytesIO(content))],
+        autocommit=False,
+    )
+
+    # the failed upserts are rolled back, the transaction goes on
+    assert db_session.savepoints == ["rollback", "rollback"]
+    assert db_session.commits == 0
@@ -0,0 +1,223 @@
+from io import BytesIO
+from types import SimpleNamespace
+from uuid import uuid4
+from zipfile import ZipFile
+
+import pandas as pd
+import pytest
+
+from auo_project import crud
+from auo_project.core import file as file_module
+from auo_project.core.config import settings
+from auo_project.core.file import (
+    LazyMember,
+    LazyResultDict,
+    get_and_write_batch,
+    read_file,
+    write_result,
+)
+from auo_project.core.security import encrypt
+
+WAVEFORM_MEMBERS = {
+    "Left/6s_cu.txt": "left/6s_cu.txt",
+    "Left/all_raw_qu.txt": "left/all_raw_qu.txt",
+    "Right/6s_ch.txt": "right/6s_ch.txt",
+    "Right/analyze_raw_Cu.txt": "right/analyze_raw_Cu.txt",
+}
+IMAGE_MEMBERS = ["T_up.jpg", "T_down.jpg"]
+
+
+def encrypt_txt(text: str) -> bytes:
+    return encrypt(
+        settings.TXT_FILE_AES_KEY,
+        settings.TXT_FILE_AES_IV,
+        text.encode("utf8"),
+    )
+
+
+def measure_zip(side_folders: bool = True) -> BytesIO:
+    """a measurement zip of waveforms, tongue images, statistics and ver.ini"""
+    zip_file = BytesIO()
+    with ZipFile(zip_file, mode="w") as measure:
+        for idx, filename in enumerate(WAVEFORM_MEMBERS):
+            if not side_folders:
+                filename = filename.split("/")[-1]
+            rows = [f"{i}\t{i * idx / 10}\t{i % 7}" for i in range(50)]
+            measure.writestr(f"m/{filename}", encrypt_txt("\n".join(rows)))
+        for idx, filename in enumerate(IMAGE_MEMBERS):
+            measure.writestr(f"m/{filename}", bytes([idx]) * 64)
+        measure.writestr(
+            "m/statistics.csv",
+            "statistic,id,hand,position,a0\r\nmean,1,left,cu,1.5\r\n",
+        )
+        measure.writestr("m/ver.ini", encrypt_txt("[ver]\nversion=1.2"))
+    zip_file.seek(0)
+    return zip_file
+
+
+def resolved(value):
+    if isinstance(value, BytesIO):
+        return value.getvalue()
+    return value
+
+
+def test_lazy_read_same_as_eager() -> None:
+    eager = read_file(measure_zip())
+    lazy = read_file(measure_zip(), lazy=True)
+
+    try:
+        assert isinstance(lazy, LazyResultDict)
+        assert sorted(lazy) == sorted(eager)
+        assert eager["error_msg"] == ""
+        for key in WAVEFORM_MEMBERS.values():
+            assert isinstance(eager[key], pd.DataFrame)
+            pd.testing.assert_frame_equal(lazy[key], eager[key])
+        for key in eager:
+            if key not in WAVEFORM_MEMBERS.values():
+                assert resolved(lazy[key]) == resolved(eager[key])
+                assert resolved(lazy.get(key)) == resolved(eager[key])
+        assert lazy.get("missing.txt", "default") == "default"
+    finally:
+        lazy.close()
+
+
+def test_lazy_members_parsed_on_access(monkeypatch) -> None:
+    parsed = []
+
+    def read_waveform(content: bytes) -> pd.DataFrame:
+        parsed.append(content)
+        return pd.DataFrame()
+
+    monkeypatch.setattr(file_module, "read_waveform", read_waveform)
+
+    result_dict = read_file(measure_zip(), lazy=True)
+    try:
+        assert parsed == []
+        for key in [*WAVEFORM_MEMBERS.values(), *IMAGE_MEMBERS]:
+            assert isinstance(dict.__getitem__(result_dict, key), LazyMember)
+
+        result_dict["left/6s_cu.txt"]
+        assert len(parsed) == 1
+        # not cached, read again on the next access
+        result_dict.get("left/6s_cu.txt")
+        assert len(parsed) == 2
+    finally:
+        result_dict.close()
+
+    # an eager read parses every waveform up front
+    read_file(measure_zip())
+    assert len(parsed) == 2 + len(WAVEFORM_MEMBERS)
+
+
+def test_lazy_result_closes_the_zip() -> None:
+    result_dict = read_file(measure_zip(), lazy=True)
+
+    result_dict.close()
+
+    with pytest.raises(ValueError):
+        result_dict["T_up.jpg"]
+
+
+class FakeSession:
+    """records the savepoints, rollbacks and the files written at every commit"""
+
+    def __init__(self):
+        self.written = []
+        self.savepoints = []
+        self.commits = []
+        self.rollbacks = 0
+
+    async def commit(self):
+        self.commits.append(list(self.written))
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+    def begin_nested(self):
+        return FakeSavepoint(self)
+
+
+class FakeSavepoint:
+    def __init__(self, db_session):
+        self.db_session = db_session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.db_session.savepoints.append("rollback" if exc_type else "release")
+        return False
+
+
+@pytest.fixture
+def uploaded_files(monkeypatch):
+    """
+    files by id, downloaded as `measure_zip`; writing the measure of a file
+    located at "bad.zip" fails, "no_side.zip" is an invalid zip; returns the
+    files and the file status updates
+    """
+    files = {}
+    statuses = []
+
+    async def get(db_session, id):
+        return files.get(id)
+
+    def spool_zip_file(blob_service_client, file_path):
+        return measure_zip(side_folders=file_path != "no_side.zip")
+
+    async def write_measure(file, result_dict, overwrite, db_session, autocommit=True):
+        if file.location == "bad.zip":
+            raise ValueError("bad measure")
+        db_session.written.append(file.id)
+        return True
+
+    async def update_file_status(db_session, file, result, autocommit=True):
+        statuses.append((file.id, result))
+
+    monkeypatch.setattr(crud.file, "get", get)
+    monkeypatch.setattr(file_module, "spool_zip_file", spool_zip_file)
+    monkeypatch.setattr(file_module, "write_measure", write_measure)
+    monkeypatch.setattr(file_module, "update_file_status", update_file_status)
+    return files, statuses
+
+
+@pytest.mark.anyio
+async def test_get_and_write_batch(uploaded_files) -> None:
+    files, statuses = uploaded_files
+    for location in ("a.zip", "bad.zip", "b.zip", "no_side.zip", "c.zip"):
+        file = SimpleNamespace(id=uuid4(), location=location)
+        files[file.id] = file
+    a, bad, b, no_side, c = files
+    missing = uuid4()
+    db_session = FakeSession()
+
+    failed_file_ids = await get_and_write_batch(
+        db_session=db_session,
+        file_ids=[a, bad, b, missing, no_side, c],
+        batch_size=2,
+        streaming=True,
+    )
+
+    assert failed_file_ids == [bad, missing]
+    # one commit per batch, the bad zip only rolls back its own savepoint
+    assert db_session.commits == [[a], [a, b], [a, b, c]]
+    assert db_session.savepoints == ["release", "rollback", "release", "release"]
+    assert [file_id for file_id, _ in statuses] == [a, b, no_side, c]
+    assert "invalid side" in statuses[2][1]["error_msg"]
+
+
+@pytest.mark.anyio
+async def test_write_result_rolls_back(uploaded_files) -> None:
+    file = SimpleNamespace(id=uuid4(), location="bad.zip")
+    db_session = FakeSession()
+
+    with pytest.raises(ValueError):
+        await write_result(
+            file=file,
+            result_dict=read_file(measure_zip()),
+            overwrite=True,
+            db_session=db_session,
+        )
+
+    assert db_session.rollbacks == 1
+    assert db_session.savepoints == []
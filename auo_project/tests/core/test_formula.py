@@ -0,0 +1,133 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from auo_project.core import formula as formula_module
+from auo_project.core.config import settings
+from auo_project.core.constants import MAX_DEPTH_RATIO
+from auo_project.core.formula import (
+    DEFAULT_FORMULAS,
+    clear_formula_cache,
+    compile_formulas,
+    get_custom_formulas,
+)
+from auo_project.core.utils import get_hr_type
+
+
+def formula_row(hr_type_limit: int = 90, max_depth_ratio: str = "2:3:5"):
+    return SimpleNamespace(
+        max_depth_ratio=max_depth_ratio,
+        strength_code="def get_custom_strength(max_slop, max_amp_value):\n"
+        "    return 1\n",
+        width_code="def get_custom_width(range_length, max_amp_value, max_slop):\n"
+        "    return 2\n",
+        hr_type_code="def get_custom_hr_type(hr, other_hand_hr):\n"
+        f"    return 2 if hr > {hr_type_limit} else 1\n",
+    )
+
+
+class FormulaSession:
+    """measure.custom_formulas of one row, counts the queries by kind"""
+
+    def __init__(self, row):
+        self.row = row
+        self.updated_at = datetime(2026, 10, 18, 10, 0)
+        self.version_queries = 0
+        self.row_queries = 0
+
+    def save(self, row, updated_at: datetime):
+        self.row = row
+        self.updated_at = updated_at
+
+    async def execute(self, statement):
+        if "max(updated_at)" in str(statement):
+            self.version_queries += 1
+            return SimpleNamespace(scalar=lambda: self.updated_at)
+        self.row_queries += 1
+        return SimpleNamespace(fetchone=lambda: self.row)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """monotonic time of the formula cache, moved by the test"""
+    now = {"time": 1000.0}
+    monkeypatch.setattr(formula_module, "monotonic", lambda: now["time"])
+    monkeypatch.setattr(settings, "CUSTOM_FORMULA_CACHE_TTL", 10)
+    clear_formula_cache()
+    yield now
+    clear_formula_cache()
+
+
+def test_compile_formulas() -> None:
+    formulas = compile_formulas(formula_row())
+
+    assert formulas.max_depth_ratio == (2, 3, 5)
+    assert formulas.get_strength(0.1, 10) == 1
+    assert formulas.get_width(10, 10, 0.1) == 2
+    assert formulas.get_hr_type(95, 70) == 2
+
+
+def test_compile_formulas_invalid_parts() -> None:
+    row = formula_row(max_depth_ratio="2:3")
+    row.hr_type_code = "def get_custom_hr_type(hr, other_hand_hr) return 1"
+
+    formulas = compile_formulas(row)
+
+    assert formulas.max_depth_ratio == MAX_DEPTH_RATIO
+    assert formulas.get_hr_type is get_hr_type
+    assert formulas.get_strength(0.1, 10) == 1
+
+
+@pytest.mark.anyio
+async def test_formulas_compiled_once_within_ttl(clock) -> None:
+    db_session = FormulaSession(formula_row())
+
+    formulas = await get_custom_formulas(db_session=db_session)
+    clock["time"] += 5
+    cached = await get_custom_formulas(db_session=db_session)
+
+    assert cached is formulas
+    assert db_session.version_queries == 1
+    assert db_session.row_queries == 1
+
+
+@pytest.mark.anyio
+async def test_formulas_same_version_after_ttl(clock) -> None:
+    db_session = FormulaSession(formula_row())
+
+    formulas = await get_custom_formulas(db_session=db_session)
+    clock["time"] += 11
+    cached = await get_custom_formulas(db_session=db_session)
+
+    # the version is checked again, the formulas are not recompiled
+    assert cached is formulas
+    assert db_session.version_queries == 2
+    assert db_session.row_queries == 1
+
+
+@pytest.mark.anyio
+async def test_formulas_new_version(clock) -> None:
+    db_session = FormulaSession(formula_row(hr_type_limit=90))
+    formulas = await get_custom_formulas(db_session=db_session)
+    assert formulas.get_hr_type(88, 70) == 1
+
+    db_session.save(formula_row(hr_type_limit=85), datetime(2026, 10, 18, 10, 5))
+    clock["time"] += 5
+    assert await get_custom_formulas(db_session=db_session) is formulas
+
+    # picked up at the first version check after the save
+    clock["time"] += 6
+    formulas = await get_custom_formulas(db_session=db_session)
+    assert formulas.get_hr_type(88, 70) == 2
+    assert db_session.row_queries == 2
+
+
+@pytest.mark.anyio
+async def test_formulas_without_row(clock) -> None:
+    db_session = FormulaSession(None)
+    db_session.updated_at = None
+
+    formulas = await get_custom_formulas(db_session=db_session)
+
+    assert formulas is DEFAULT_FORMULAS
@@ -0,0 +1,65 @@
+from io import BytesIO
+
+import httpx
+import pytest
+
+from auo_project.core.ai import get_ai_tongue_result, get_color_card_result
+from auo_project.core.cc import get_crop
+from auo_project.core.http import ServiceClient, services
+from auo_project.tests.stub_services import get_stub_app
+
+
+@pytest.fixture
+def stub_services():
+    transport = httpx.ASGITransport(app=get_stub_app(pending_polls=2))
+    for service in services:
+        service.set_transport(transport)
+        service.metrics.reset()
+    yield services
+    for service in services:
+        service.set_transport(None)
+
+
+@pytest.mark.anyio
+async def test_color_card_result(stub_services) -> None:
+    result = await get_color_card_result(BytesIO(b"png"))
+
+    assert result.read() == b"png"
+
+
+@pytest.mark.anyio
+async def test_crop(stub_services) -> None:
+    result = await get_crop(tongue_file=BytesIO(b"jpg"))
+
+    assert result.read() == b"jpg"
+
+
+@pytest.mark.anyio
+async def test_ai_tongue_result_polls_until_done(stub_services) -> None:
+    color_card_service, tongue_ai_service, _ = stub_services
+
+    result = await get_ai_tongue_result(masked_file=BytesIO(b"jpg"))
+
+    assert result["tongue_color"] == ["淡紅"]
+    assert result["tongue_coating_color"] == ["白"]
+    metrics = tongue_ai_service.metrics.snapshot()
+    # upload, two pending polls and the result
+    assert metrics["count"] == 4
+    assert metrics["statuses"] == {200: 2, 202: 2}
+
+
+@pytest.mark.anyio
+async def test_poll_timeout() -> None:
+    service = ServiceClient("stub", "http://stub")
+    service.set_transport(httpx.ASGITransport(app=get_stub_app(pending_polls=100)))
+    response = await service.post("/api/v2.0/upload/", files={"input_image": b""})
+    task_id = response.json()["task_id"]
+
+    response = await service.poll(
+        f"/api/v2.0/results/{task_id}",
+        timeout=0.3,
+        interval=0.05,
+    )
+
+    assert response is None
+    assert service.metrics.snapshot()["statuses"][202] >= 2
@@ -0,0 +1,48 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from auo_project.core.image import NormalizedImage, normalize_image
+from auo_project.core.utils import convert_jpg_to_png
+
+
+def encode_image(image_format: str) -> bytes:
+    rng = np.random.default_rng(0)
+    array = rng.integers(0, 256, (30, 40, 3), dtype=np.uint8)
+    output = BytesIO()
+    Image.fromarray(array).save(output, format=image_format)
+    return output.getvalue()
+
+
+def test_normalize_jpeg_encodes_png_once() -> None:
+    content = encode_image("JPEG")
+
+    image = normalize_image(content)
+    png = image.to_png()
+
+    assert image.format == "JPEG"
+    assert image.to_png() is png
+    decoded = Image.open(BytesIO(png))
+    assert decoded.format == "PNG"
+    assert np.array_equal(np.asarray(decoded), image.array)
+
+
+def test_normalize_png_keeps_content() -> None:
+    content = encode_image("PNG")
+
+    image = NormalizedImage(content)
+
+    assert image.to_png() is content
+    assert image.size == (40, 30)
+
+
+def test_convert_jpg_to_png_same_pixels() -> None:
+    content = encode_image("JPEG")
+
+    converted = convert_jpg_to_png(BytesIO(content))
+
+    assert np.array_equal(
+        np.asarray(Image.open(converted)),
+        np.asarray(Image.open(BytesIO(content))),
+    )
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import text
+
+from auo_project.core.config import settings
+from auo_project.core.measure import (
+    get_merged_measures_query,
+    get_merged_measures_since,
+    refresh_merged_measures,
+)
+
+MEASURE_IDS_FILTER = "where info.id = any(:measure_ids)"
+
+
+def test_incremental_query_filters_measures() -> None:
+    query = get_merged_measures_query()
+    incremental_query = get_merged_measures_query(incremental=True)
+
+    assert MEASURE_IDS_FILTER not in query
+    assert incremental_query.count(MEASURE_IDS_FILTER) == 1
+    # the same rows and columns, only of the given measures
+    assert incremental_query.replace(MEASURE_IDS_FILTER, "") == query
+    assert "measure_ids" in text(incremental_query).compile().params
+    assert not text(query).compile().params
+
+
+def test_merged_measures_mode() -> None:
+    query_hash = "a1b2"
+    refreshed_at = datetime(2024, 1, 2, 3, 4, 5)
+    state = (query_hash, refreshed_at)
+
+    assert get_merged_measures_since(state, query_hash, True) == (
+        refreshed_at - timedelta(seconds=settings.MERGED_MEASURES_OVERLAP)
+    )
+    # built from scratch: first time, asked, changed columns or dropped table
+    assert get_merged_measures_since(None, query_hash, False) is None
+    assert get_merged_measures_since(state, query_hash, True, full=True) is None
+    assert get_merged_measures_since(state, "c3d4", True) is None
+    assert get_merged_measures_since(state, query_hash, False) is None
+
+
+class FakeSession:
+    """records the statements, deletes and inserts one row per measure id"""
+
+    def __init__(self, changed_ids, orphans: int = 0):
+        self.changed_ids = changed_ids
+        self.orphans = orphans
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.statements.append((sql, params))
+        if sql.startswith("select"):
+            return SimpleNamespace(
+                scalars=lambda: SimpleNamespace(all=lambda: self.changed_ids),
+            )
+        if params is None:
+            return SimpleNamespace(rowcount=self.orphans)
+        return SimpleNamespace(rowcount=len(params["measure_ids"]))
+
+
+@pytest.mark.anyio
+async def test_refresh_merged_measures_batches(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "MERGED_MEASURES_BATCH_SIZE", 2)
+    changed_ids = [uuid4() for _ in range(5)]
+    db_session = FakeSession(changed_ids, orphans=3)
+    since = datetime(2024, 1, 2, 3, 4, 5)
+
+    report = await refresh_merged_measures(db_session, since)
+
+    changed, *batches, orphans = db_session.statements
+    assert changed[1] == {"since": since}
+    # delete then insert the rows of every batch of measures
+    assert [sql.split()[0] for sql, _ in batches] == ["delete", "insert"] * 3
+    assert [params["measure_ids"] for _, params in batches[::2]] == [
+        changed_ids[0:2],
+        changed_ids[2:4],
+        changed_ids[4:],
+    ]
+    assert [params for _, params in batches[1::2]] == [
+        params for _, params in batches[::2]
+    ]
+    assert batches[1][0].startswith("insert into measure.merged_measures select")
+    # then the rows left of deleted measures or survey results
+    assert orphans[0].startswith("delete from measure.merged_measures as m")
+    assert "not exists" in orphans[0]
+    assert orphans[1] is None
+    assert report == {"measures": 5, "deleted": 5 + 3, "inserted": 5}
+
+
+@pytest.mark.anyio
+async def test_refresh_merged_measures_nothing_changed() -> None:
+    db_session = FakeSession([], orphans=1)
+
+    report = await refresh_merged_measures(db_session, datetime(2024, 1, 2))
+
+    assert len(db_session.statements) == 2
+    assert report == {"measures": 0, "deleted": 1, "inserted": 0}
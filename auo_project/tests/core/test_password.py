@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from auo_project.core import password as password_module
+from auo_project.core.password import (
+    check_password,
+    hash_password,
+    hash_passwords,
+    metrics,
+)
+
+
+def slow_hash(password: str) -> str:
+    time.sleep(0.05)
+    return f"hashed:{password}:{threading.current_thread().name}"
+
+
+def slow_verify(plain_password: str, hashed_password: str) -> bool:
+    time.sleep(0.05)
+    return hashed_password.startswith(f"hashed:{plain_password}:")
+
+
+@pytest.fixture
+def fake_bcrypt(monkeypatch):
+    monkeypatch.setattr(password_module, "get_password_hash", slow_hash)
+    monkeypatch.setattr(password_module, "verify_password", slow_verify)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.mark.anyio
+async def test_hash_off_the_event_loop(fake_bcrypt) -> None:
+    hashed = await hash_password("secret")
+
+    assert hashed.startswith("hashed:secret:password")
+    assert await check_password("secret", hashed)
+    assert not await check_password("wrong", hashed)
+    stats = metrics.snapshot()
+    assert stats["hash"]["count"] == 1
+    assert stats["verify"]["count"] == 2
+    assert stats["verify"]["seconds"] >= 0.1
+
+
+@pytest.mark.anyio
+async def test_hash_passwords_in_parallel(fake_bcrypt) -> None:
+    workers = password_module.get_executor()._max_workers
+    passwords = [f"password-{i}" for i in range(workers * 2)]
+
+    started_at = time.perf_counter()
+    hashes = await hash_passwords(passwords)
+    seconds = time.perf_counter() - started_at
+
+    assert [hashed.split(":")[1] for hashed in hashes] == passwords
+    assert seconds < 0.05 * len(passwords) or workers == 1
+    assert metrics.snapshot()["hash"]["count"] == len(passwords)
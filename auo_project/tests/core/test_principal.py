@@ -0,0 +1,143 @@
+import json
+from itertools import chain
+from uuid import uuid4
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+from pydantic.json import pydantic_encoder
+
+from auo_project import crud, models
+from auo_project.core import principal as principal_module
+from auo_project.core.config import settings
+from auo_project.core.principal import (
+    dump_principal,
+    get_principal_user,
+    invalidate_principals,
+    load_principal,
+    principal_cache,
+)
+from auo_project.core.redis import set_redis
+
+
+def walk_has_requires(user, groups=(), roles=(), actions=()) -> bool:
+    """The ORM walk `crud.user.has_requires` did before the bitsets."""
+    if not groups and not roles and not actions:
+        return True
+    own_roles = user.roles + list(
+        chain.from_iterable([group.roles for group in user.groups]),
+    )
+    own_actions = chain(user.actions, *[role.actions for role in own_roles])
+    return bool(
+        set(groups) & {group.name for group in user.groups}
+        or set(roles) & {role.name for role in own_roles}
+        or set(actions) & {action.name for action in own_actions},
+    )
+
+
+def make_user() -> models.User:
+    org_id = uuid4()
+    user = models.User(
+        id=uuid4(),
+        org_id=org_id,
+        branch_id=uuid4(),
+        username=f"user-{uuid4()}",
+        full_name="tester",
+        mobile="0900000000",
+        email="tester@example.com",
+        hashed_password="secret",
+    )
+    manager = models.Role(id=uuid4(), name="MeasureManager", org_id=org_id)
+    manager.actions = [models.Action(id=uuid4(), name="measure:read")]
+    creator = models.Role(id=uuid4(), name="UploadCreator", org_id=org_id)
+    creator.actions = [models.Action(id=uuid4(), name="upload:create")]
+    group = models.Group(id=uuid4(), name="subject")
+    group.roles = [creator]
+    user.org = models.Org(id=org_id, name="x_medical_center")
+    user.groups = [group]
+    user.roles = [manager]
+    user.actions = [models.Action(id=uuid4(), name="account_mgmt:create")]
+    user.user_branches = [
+        models.UserBranch(user_id=user.id, org_id=org_id, branch_id=user.branch_id),
+    ]
+    return user
+
+
+REQUIREMENTS = [
+    {},
+    {"groups": ["subject"]},
+    {"groups": ["user"]},
+    {"roles": ["MeasureManager"]},
+    {"roles": ["UploadCreator"]},
+    {"roles": ["OrgAdmin"]},
+    {"actions": ["measure:read"]},
+    {"actions": ["upload:create"]},
+    {"actions": ["account_mgmt:create"]},
+    {"actions": ["account_mgmt:delete"]},
+    {"groups": ["user"], "roles": ["OrgAdmin"], "actions": ["upload:create"]},
+]
+
+
+@pytest.mark.parametrize("requirement", REQUIREMENTS)
+def test_has_requires_same_as_walk(requirement) -> None:
+    user = make_user()
+    expected = walk_has_requires(user, **requirement)
+
+    assert crud.user.has_requires(user=user, **requirement) == expected
+
+    principal = json.loads(json.dumps(dump_principal(user), default=pydantic_encoder))
+    cached_user = load_principal(principal)
+    assert cached_user.permission_mask is not None
+    assert crud.user.has_requires(user=cached_user, **requirement) == expected
+
+
+def test_load_principal_keeps_user() -> None:
+    user = make_user()
+    principal = json.loads(json.dumps(dump_principal(user), default=pydantic_encoder))
+
+    cached_user = load_principal(principal)
+
+    assert cached_user.id == user.id
+    assert cached_user.org.name == "x_medical_center"
+    assert [group.name for group in cached_user.groups] == ["subject"]
+    assert [role.name for role in cached_user.roles] == ["MeasureManager"]
+    assert crud.user.get_branches_list(user=cached_user) == []
+    assert cached_user.hashed_password is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("use_redis", [False, True])
+async def test_get_principal_user_cache(monkeypatch, use_redis: bool) -> None:
+    user = make_user()
+    loads = []
+
+    async def get_by_username(db_session, username, relations=[]):
+        loads.append(username)
+        return user
+
+    monkeypatch.setattr(crud.user, "get_by_username", get_by_username)
+    monkeypatch.setattr(settings, "REDIS_CACHE_ENABLED", use_redis)
+    set_redis(FakeRedis() if use_redis else None)
+    principal_cache.clear()
+    try:
+        first = await get_principal_user(db_session=None, username=user.username)
+        second = await get_principal_user(db_session=None, username=user.username)
+        assert first is not second
+        assert first.id == second.id == user.id
+        assert loads == [user.username]
+
+        if use_redis:
+            # another worker: empty in process cache, principal from redis
+            monkeypatch.setattr(
+                principal_module,
+                "principal_cache",
+                principal_module.PrincipalCache(ttl=60, max_size=10),
+            )
+            await get_principal_user(db_session=None, username=user.username)
+            assert loads == [user.username]
+
+        await invalidate_principals()
+        await get_principal_user(db_session=None, username=user.username)
+        assert loads == [user.username, user.username]
+    finally:
+        set_redis(None)
+        principal_cache.clear()
@@ -0,0 +1,201 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from auo_project import crud
+from auo_project.core import file as file_module
+from auo_project.core import reprocess as reprocess_module
+from auo_project.core.reprocess import reprocess_dir, reprocess_files
+
+
+class ThreadPool(ThreadPoolExecutor):
+    """the process pool of `reprocess_files` in threads of the test process"""
+
+    def __init__(self, max_workers, mp_context=None):
+        super().__init__(max_workers=max_workers)
+
+
+class FakeSession:
+    """records the savepoints and the file ids written at every commit"""
+
+    def __init__(self):
+        self.written = []
+        self.savepoints = []
+        self.commits = []
+
+    async def commit(self):
+        self.commits.append(list(self.written))
+
+    def begin_nested(self):
+        return FakeSavepoint(self)
+
+
+class FakeSavepoint:
+    def __init__(self, db_session):
+        self.db_session = db_session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.db_session.savepoints.append("rollback" if exc_type else "release")
+        return False
+
+
+@pytest.fixture
+def bad_file_ids(monkeypatch):
+    """
+    `reprocess_files` without workers, blobs or a database, writing a measure
+    fails for the file ids added to the returned set
+    """
+    bad_file_ids = set()
+
+    def parse_measure_zip(source, local=False):
+        return {"source": source, "local": local}
+
+    async def get(db_session, id):
+        return SimpleNamespace(id=id)
+
+    async def write_measure(file, result_dict, overwrite, db_session, autocommit):
+        if file.id in bad_file_ids:
+            raise ValueError("bad measure")
+        db_session.written.append(file.id)
+        return True
+
+    async def update_file_status(db_session, file, result, autocommit=True):
+        pass
+
+    monkeypatch.setattr(reprocess_module, "ProcessPoolExecutor", ThreadPool)
+    monkeypatch.setattr(reprocess_module, "parse_measure_zip", parse_measure_zip)
+    monkeypatch.setattr(reprocess_module, "update_file_status", update_file_status)
+    monkeypatch.setattr(crud.file, "get", get)
+    monkeypatch.setattr(file_module, "write_measure", write_measure)
+    return bad_file_ids
+
+
+def read_checkpoint(checkpoint_path):
+    return checkpoint_path.read_text().split()
+
+
+@pytest.mark.anyio
+async def test_reprocess_files_batch_commit(bad_file_ids, tmp_path) -> None:
+    jobs = [(uuid4(), f"zip/{idx}.zip") for idx in range(5)]
+    file_ids = [file_id for file_id, _ in jobs]
+    checkpoint_path = tmp_path / "checkpoint.txt"
+    db_session = FakeSession()
+
+    stats = await reprocess_files(
+        jobs=jobs,
+        db_session=db_session,
+        workers=2,
+        batch_size=2,
+        checkpoint_path=checkpoint_path,
+    )
+
+    assert db_session.commits == [file_ids[:2], file_ids[:4], file_ids]
+    assert db_session.savepoints == ["release"] * 5
+    assert read_checkpoint(checkpoint_path) == [str(file_id) for file_id in file_ids]
+    assert stats["done"] == 5
+    assert stats["failed"] == 0
+
+
+@pytest.mark.anyio
+async def test_reprocess_files_resume(bad_file_ids, tmp_path) -> None:
+    jobs = [(uuid4(), f"zip/{idx}.zip") for idx in range(5)]
+    checkpoint_path = tmp_path / "checkpoint.txt"
+    checkpoint_path.write_text("".join(f"{file_id}\n" for file_id, _ in jobs[:2]))
+    db_session = FakeSession()
+
+    stats = await reprocess_files(
+        jobs=jobs,
+        db_session=db_session,
+        workers=2,
+        checkpoint_path=checkpoint_path,
+    )
+
+    assert db_session.written == [file_id for file_id, _ in jobs[2:]]
+    assert read_checkpoint(checkpoint_path) == [str(file_id) for file_id, _ in jobs]
+    assert stats["total"] == 3
+    assert stats["skipped"] == 2
+    assert stats["done"] == 3
+
+
+@pytest.mark.anyio
+async def test_reprocess_files_bad_file_rolled_back(bad_file_ids, tmp_path) -> None:
+    jobs = [(uuid4(), f"zip/{idx}.zip") for idx in range(3)]
+    bad_file_id = jobs[1][0]
+    bad_file_ids.add(bad_file_id)
+    checkpoint_path = tmp_path / "checkpoint.txt"
+    db_session = FakeSession()
+
+    stats = await reprocess_files(
+        jobs=jobs,
+        db_session=db_session,
+        workers=2,
+        checkpoint_path=checkpoint_path,
+    )
+
+    # only the savepoint of the bad file is rolled back, the run goes on
+    assert db_session.savepoints == ["release", "rollback", "release"]
+    assert db_session.commits == [[jobs[0][0], jobs[2][0]]]
+    assert read_checkpoint(checkpoint_path) == [str(jobs[0][0]), str(jobs[2][0])]
+    assert stats["failed"] == 1
+    assert stats["failed_file_ids"] == [bad_file_id]
+    assert stats["done"] == 2
+
+
+@pytest.mark.anyio
+async def test_reprocess_dir(bad_file_ids, monkeypatch, tmp_path) -> None:
+    files = {"a.zip": uuid4(), "c.zip": uuid4()}
+    for name in ("a.zip", "b.zip", "c.zip", "d.txt"):
+        (tmp_path / name).write_bytes(b"")
+    parsed = []
+
+    def parse_measure_zip(source, local=False):
+        parsed.append((source, local))
+        return {"source": source}
+
+    async def get_by_location(db_session, location):
+        if location in files:
+            return SimpleNamespace(id=files[location])
+
+    monkeypatch.setattr(reprocess_module, "parse_measure_zip", parse_measure_zip)
+    monkeypatch.setattr(crud.file, "get_by_location", get_by_location)
+    db_session = FakeSession()
+
+    stats = await reprocess_dir(tmp_path, db_session=db_session, workers=1)
+
+    assert sorted(parsed) == [
+        (str(tmp_path / "a.zip"), True),
+        (str(tmp_path / "c.zip"), True),
+    ]
+    assert db_session.written == [files["a.zip"], files["c.zip"]]
+    assert stats["done"] == 2
+
+
+@pytest.mark.anyio
+async def test_download_off_the_event_loop(monkeypatch) -> None:
+    threads = []
+
+    def spool_zip_file(blob_service_client, file_path):
+        threads.append(threading.current_thread())
+        return open(__file__, "rb")
+
+    async def process_file(file, zip_file, overwrite, db_session, **kwargs):
+        return zip_file.read(6)
+
+    monkeypatch.setattr(file_module, "spool_zip_file", spool_zip_file)
+    monkeypatch.setattr(file_module, "process_file", process_file)
+
+    result = await file_module.download_and_process_file(
+        db_session=None,
+        file=SimpleNamespace(location="zip/a.zip"),
+        overwrite=False,
+        streaming=True,
+    )
+
+    assert result == b"import"
+    assert threads[0] is not threading.current_thread()
@@ -0,0 +1,114 @@
+from uuid import uuid4
+
+import pytest
+
+from auo_project import crud, models
+from auo_project.core.utils import compare_cn_diff
+
+HAND_POSITIONS = [
+    (hand, position) for hand in ("Left", "Right") for position in ("Cu", "Qu", "Ch")
+]
+
+
+def make_statistics(measure_id, statistic: str):
+    return [
+        models.MeasureStatistic(
+            id=uuid4(),
+            measure_id=measure_id,
+            statistic=statistic,
+            hand=hand,
+            position=position,
+            a0=float(i),
+            c1=i + 0.5,
+            h1=i * 2.0,
+            hr=70 + i,
+        )
+        for i, (hand, position) in enumerate(HAND_POSITIONS)
+    ]
+
+
+def make_wide(measure_id, statistics) -> models.MeasureStatisticWide:
+    """what the refresh statement writes for `statistics`"""
+    kept = {"id", "measure_id", "statistic", "hand", "position"}
+    values = {"MEAN": {}, "STD": {}, "CV": {}}
+    for statistic in statistics:
+        hand_position = f"{statistic.hand[0].lower()}_{statistic.position.lower()}"
+        values[statistic.statistic][hand_position] = {
+            key: value
+            for key, value in statistic.dict().items()
+            if key not in kept and key not in ("created_at", "updated_at")
+        }
+    return models.MeasureStatisticWide(
+        measure_id=measure_id,
+        mean=values["MEAN"],
+        std=values["STD"],
+        cv=values["CV"],
+    )
+
+
+@pytest.mark.anyio
+async def test_flat_dict_from_wide_rows(monkeypatch) -> None:
+    wide_id, pivot_id = uuid4(), uuid4()
+    wide_statistics = make_statistics(wide_id, "MEAN")
+    pivot_statistics = make_statistics(pivot_id, "MEAN")
+    pivot_requests = []
+
+    async def get_by_measure_ids(db_session, measure_ids):
+        return [make_wide(wide_id, wide_statistics)]
+
+    async def get_by_ids_and_statistic(db_session, measure_ids, statistic_name):
+        pivot_requests.append(measure_ids)
+        return pivot_statistics
+
+    monkeypatch.setattr(
+        crud.measure_statistic_wide,
+        "get_by_measure_ids",
+        get_by_measure_ids,
+    )
+    monkeypatch.setattr(
+        crud.measure_statistic,
+        "get_by_ids_and_statistic",
+        get_by_ids_and_statistic,
+    )
+
+    result = await crud.measure_statistic.get_flat_dict_by_ids_and_statistics(
+        db_session=None,
+        measure_ids=[wide_id, pivot_id],
+        statistic_name="MEAN",
+    )
+
+    # only the measure missing from the wide table is pivoted
+    assert pivot_requests == [[pivot_id]]
+    assert set(result) == {wide_id, pivot_id}
+    wide_dict = result[wide_id]
+    pivot_dict = crud.measure_statistic.get_flat_statistic_dict(wide_statistics)
+    assert set(wide_dict) == set(pivot_dict)
+    for hand_position, statistic in pivot_dict.items():
+        assert compare_cn_diff(wide_dict[hand_position], statistic) == compare_cn_diff(
+            statistic,
+            statistic,
+        )
+    assert crud.measure_statistic.get_flat_statistic_model2(
+        wide_dict,
+    ) == crud.measure_statistic.get_flat_statistic_model2(pivot_dict)
+
+
+def test_flat_dict_of_other_statistic() -> None:
+    measure_id = uuid4()
+    wide = make_wide(measure_id, make_statistics(measure_id, "CV"))
+
+    cv_dict = crud.measure_statistic_wide.get_flat_statistic_dict(wide, "cv")
+    assert cv_dict["r_ch"].hr == 75
+    assert crud.measure_statistic_wide.get_flat_statistic_dict(wide, "MEAN") == {}
+    assert crud.measure_statistic_wide.get_flat_statistic_dict(wide, "MAX") is None
+
+
+def test_wide_rows_deleted_with_the_measure() -> None:
+    measure_id = models.MeasureStatisticWide.__table__.c.measure_id
+    [foreign_key] = measure_id.foreign_keys
+
+    # the same foreign key as migration 7a3f5e2c9b84
+    assert foreign_key.target_fullname == "measure.infos.id"
+    assert foreign_key.ondelete == "CASCADE"
+    assert not measure_id.nullable
+    assert measure_id.unique
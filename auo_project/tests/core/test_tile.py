@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from auo_project.core.tile import (
+    TILE_BASE_BINS,
+    build_pyramid,
+    cut_window,
+    select_level,
+)
+from auo_project.core.waveform import encode_waveform
+
+
+def scatter(n: int = 5000):
+    """(x, amp) sorted by x, float32 like the decoded channels"""
+    rng = np.random.default_rng(0)
+    x = np.sort(rng.uniform(10, 200, n)).astype(np.float32)
+    amp = rng.normal(1, 0.3, n).astype(np.float32)
+    return x, amp
+
+
+def level_tiles(levels):
+    return [
+        SimpleNamespace(
+            level=level,
+            count=len(points),
+            x_min=float(points[0, 0]),
+            x_max=float(points[-1, 0]),
+        )
+        for level, points in enumerate(levels)
+    ]
+
+
+def test_pyramid_levels() -> None:
+    x, amp = scatter()
+
+    levels = build_pyramid(x, amp)
+
+    assert np.array_equal(levels[-1], np.column_stack([x, amp]))
+    all_points = set(map(tuple, levels[-1].tolist()))
+    for level, points in enumerate(levels[:-1]):
+        assert len(points) <= 2 * TILE_BASE_BINS * 2**level
+        assert np.all(np.diff(points[:, 0]) >= 0)
+        assert set(map(tuple, points.tolist())) <= all_points
+        # the envelope of every level is the envelope of the scatter
+        assert points[:, 1].max() == amp.max()
+        assert points[:, 1].min() == amp.min()
+    assert [len(points) for points in levels] == sorted(len(p) for p in levels)
+
+
+def test_pyramid_of_few_points() -> None:
+    x, amp = scatter(2 * TILE_BASE_BINS)
+
+    levels = build_pyramid(x, amp)
+
+    assert len(levels) == 1
+    assert len(levels[0]) == len(x)
+
+
+def test_select_level() -> None:
+    tiles = level_tiles(build_pyramid(*scatter()))
+
+    assert select_level(tiles, 1) == 0
+    assert select_level(tiles, tiles[1].count) == 1
+    assert select_level(tiles, tiles[-1].count) == tiles[-1].level
+    # a narrower window fits a finer level in the same points
+    span = tiles[0].x_max - tiles[0].x_min
+    x_min = tiles[0].x_min + span * 0.45
+    x_max = tiles[0].x_min + span * 0.55
+    assert select_level(tiles, tiles[1].count, x_min=x_min, x_max=x_max) > 1
+    # a window out of the range has no points at any level
+    assert select_level(tiles, 1, x_min=500, x_max=600) == tiles[-1].level
+
+
+def test_cut_window_edges() -> None:
+    points = np.array([[1, 0.5], [2, 0.6], [2, 0.7], [3, 0.8], [4, 0.9]])
+    content = encode_waveform(points)
+
+    assert len(cut_window(content)) == len(points)
+    assert cut_window(content, x_min=2, x_max=3)[:, 0].tolist() == [2, 2, 3]
+    assert cut_window(content, x_min=2.5)[:, 0].tolist() == [3, 4]
+    assert cut_window(content, x_max=1)[:, 0].tolist() == [1]
+    assert len(cut_window(content, x_min=5)) == 0
+    assert len(cut_window(content, x_min=3.5, x_max=3.6)) == 0
@@ -0,0 +1,145 @@
+import random
+from types import SimpleNamespace
+
+from auo_project import schemas
+from auo_project.core.tongue import (
+    SURFACE_DISEASE_FIELDS,
+    build_surface_disease_index,
+    get_symptom_signature,
+    get_tongue_summary,
+    process_symptom_id_list,
+    surface_disease_index,
+    surface_disease_records,
+)
+
+
+def scan_surface_disease(records, tongue_info):
+    """the sorted list scan get_tongue_summary did before the index"""
+    for record in records:
+        if all(
+            sorted(getattr(tongue_info, field, []))
+            == sorted(process_symptom_id_list(record[field]))
+            for field in SURFACE_DISEASE_FIELDS
+        ):
+            # a shifted row has no disease, the summary join then failed
+            if isinstance(record["surface_disease"], str):
+                return record["surface_disease"]
+            return None
+    return None
+
+
+def lookup_surface_disease(index, tongue_info):
+    return index.get(
+        get_symptom_signature(
+            {
+                field: getattr(tongue_info, field, [])
+                for field in SURFACE_DISEASE_FIELDS
+            },
+        ),
+    )
+
+
+def record_tongue_info(record, rng: random.Random) -> SimpleNamespace:
+    """the symptoms of a record, shuffled"""
+    fields = {}
+    for field in SURFACE_DISEASE_FIELDS:
+        symptoms = process_symptom_id_list(record[field])
+        rng.shuffle(symptoms)
+        fields[field] = symptoms
+    return SimpleNamespace(**fields)
+
+
+def random_tongue_info(vocabulary, rng: random.Random) -> SimpleNamespace:
+    return SimpleNamespace(
+        **{
+            field: rng.choices(vocabulary[field], k=rng.randint(0, 3))
+            for field in SURFACE_DISEASE_FIELDS
+        },
+    )
+
+
+def get_vocabulary(records):
+    return {
+        field: sorted(
+            {
+                symptom
+                for record in records
+                for symptom in process_symptom_id_list(record[field])
+            },
+        )
+        for field in SURFACE_DISEASE_FIELDS
+    }
+
+
+def test_index_same_as_scan() -> None:
+    rng = random.Random(0)
+    vocabulary = get_vocabulary(surface_disease_records)
+    inputs = [record_tongue_info(record, rng) for record in surface_disease_records]
+    inputs += [random_tongue_info(vocabulary, rng) for _ in range(3000)]
+
+    matched = 0
+    for tongue_info in inputs:
+        expected = scan_surface_disease(surface_disease_records, tongue_info)
+        assert lookup_surface_disease(surface_disease_index, tongue_info) == expected
+        matched += expected is not None
+    assert matched
+
+
+def test_shifted_rows_left_out() -> None:
+    rng = random.Random(1)
+    shifted = [
+        record
+        for record in surface_disease_records
+        if not isinstance(record["surface_disease"], str)
+    ]
+
+    assert shifted
+    for record in shifted:
+        tongue_info = record_tongue_info(record, rng)
+        assert lookup_surface_disease(surface_disease_index, tongue_info) is None
+
+
+def test_repeated_symptoms_and_first_record() -> None:
+    fields = {field: "甲" for field in SURFACE_DISEASE_FIELDS}
+    records = [
+        {**fields, "tongue_tip": "紅、紅", "surface_disease": "重複"},
+        {**fields, "tongue_tip": "紅、白", "surface_disease": "第一"},
+        {**fields, "tongue_tip": "白、紅", "surface_disease": "第二"},
+        {**fields, "tongue_tip": "白", "surface_disease": float("nan")},
+    ]
+    index = build_surface_disease_index(records)
+    rng = random.Random(2)
+    vocabulary = {field: ["甲", "紅", "白"] for field in SURFACE_DISEASE_FIELDS}
+    base = {field: ["甲"] for field in SURFACE_DISEASE_FIELDS}
+    inputs = [
+        SimpleNamespace(**{**base, "tongue_tip": tongue_tip})
+        for tongue_tip in (["紅", "紅"], ["紅"], ["白", "紅"], ["紅", "白", "紅"], ["白"])
+    ]
+    inputs += [random_tongue_info(vocabulary, rng) for _ in range(500)]
+
+    for tongue_info in inputs:
+        assert lookup_surface_disease(index, tongue_info) == scan_surface_disease(
+            records,
+            tongue_info,
+        )
+    assert lookup_surface_disease(index, inputs[0]) == "重複"
+    assert lookup_surface_disease(index, inputs[1]) is None
+    assert lookup_surface_disease(index, inputs[2]) == "第一"
+
+
+def test_summary_of_a_rule() -> None:
+    record = next(
+        record
+        for record in surface_disease_records
+        if isinstance(record["surface_disease"], str)
+    )
+    tongue_info = schemas.MeasureAdvancedTongue2UpdateInput(
+        **{
+            field: process_symptom_id_list(record[field])
+            for field in SURFACE_DISEASE_FIELDS
+        },
+    )
+
+    summary = get_tongue_summary(tongue_info, [])
+
+    assert f"可能有{record['surface_disease']}的情況" in summary
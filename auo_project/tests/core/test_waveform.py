@@ -0,0 +1,147 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from auo_project.core.chart import get_analyze_raw_charts, get_scatter_chart
+from auo_project.core.config import settings
+from auo_project.core.file import get_measure_raw_columns, get_measure_raw_data
+from auo_project.core.tile import get_analyze_raw_tiles
+from auo_project.core.waveform import (
+    decode_waveform,
+    downsample,
+    downsample_lttb,
+    downsample_minmax,
+    downsample_stride,
+    encode_waveform,
+    get_waveform,
+    round_float32,
+)
+
+# amp, depth, slope, static, as read from analyze_raw_*.txt
+ANALYZE_RAW = pd.DataFrame(
+    [[round(0.1 * i, 1), 0.3 + i, 1.0, round(10.1 + 2.3 * i, 1)] for i in range(1, 21)],
+)
+
+
+def test_charts_from_parsed_values() -> None:
+    raw_data = get_measure_raw_data({"left/analyze_raw_Cu.txt": ANALYZE_RAW})
+
+    chart = raw_data["all_sec_analyze_chart"]["l_cu"]["static_amp"]
+    assert [point["amp"] for point in chart["data"]] == ANALYZE_RAW[0].tolist()
+    assert [point["static"] for point in chart["data"]] == ANALYZE_RAW[3].tolist()
+    # the binary column is float32, the charts are not computed from it
+    stored = decode_waveform(raw_data["all_sec_analyze_raw_l_cu_bin"])
+    assert stored[:, 0].tolist() != ANALYZE_RAW[0].tolist()
+    assert raw_data["all_sec_analyze_chart"]["r_ch"]["static_amp"]["data"] == []
+
+
+def test_stored_charts_prefer_text() -> None:
+    raw_data = get_measure_raw_data({"left/analyze_raw_Cu.txt": ANALYZE_RAW})
+
+    charts = get_analyze_raw_charts(SimpleNamespace(**raw_data))
+
+    assert charts == raw_data["all_sec_analyze_chart"]
+
+
+def test_narrow_analyze_raw() -> None:
+    narrow = np.arange(10, dtype=np.float64).reshape(5, 2)
+
+    chart = get_scatter_chart(narrow)
+
+    assert chart["static_amp"]["data"] == []
+    assert chart["depth_amp"]["regression_points"] == []
+    measure_raw = SimpleNamespace(all_sec_analyze_raw_l_cu_bin=encode_waveform(narrow))
+    assert get_analyze_raw_tiles(measure_raw) == []
+
+
+def pulse_wave(n: int = 6000) -> np.ndarray:
+    """a noisy pulse with a spike up and down, float32 like a decoded channel"""
+    rng = np.random.default_rng(0)
+    t = np.linspace(0, 6, n)
+    y = np.sin(2 * np.pi * 1.2 * t) + rng.normal(0, 0.05, n)
+    y[n * 2 // 3] = 5.0
+    y[n // 5] = -5.0
+    return y.astype(np.float32)
+
+
+@pytest.mark.parametrize("points", [3, 10, 300, 1001])
+def test_downsample_points_bounded(points: int) -> None:
+    y = pulse_wave()
+
+    for mode in ("minmax", "lttb", "stride"):
+        indices = downsample(y, points, mode)
+        assert 0 < len(indices) <= points
+        assert np.all(np.diff(indices) > 0)
+        assert indices[0] >= 0 and indices[-1] < len(y)
+    assert len(downsample_lttb(y, points)) == points
+
+
+def test_downsample_keeps_peaks() -> None:
+    y = pulse_wave()
+
+    minmax = downsample_minmax(y, 100)
+    assert {int(y.argmax()), int(y.argmin())} <= set(minmax.tolist())
+    lttb = downsample_lttb(y, 100)
+    assert {0, len(y) - 1, int(y.argmax()), int(y.argmin())} <= set(lttb.tolist())
+
+
+def test_downsample_short_input() -> None:
+    y = pulse_wave(50)
+
+    for mode in ("minmax", "lttb", "stride"):
+        assert downsample(y, 300, mode).tolist() == list(range(50))
+    assert downsample_stride(y, 10).tolist() == list(range(0, 50, 5))
+
+
+def test_round_float32_stored_decimals() -> None:
+    values = [0.1, 123.45, -2.5, 0.0, 1e-05, 12345.67, 0.3, -0.000123, 98765.43]
+
+    rounded = round_float32(np.array(values, dtype=np.float32))
+
+    assert rounded.tolist() == values
+    assert np.isnan(round_float32(np.array([np.nan], dtype=np.float32))[0])
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_encode_decode_round_trip(compress: bool) -> None:
+    data = ANALYZE_RAW.to_numpy()
+
+    content = encode_waveform(data, compress=compress)
+    decoded = decode_waveform(content)
+
+    assert decoded.shape == data.shape
+    assert decoded.dtype == np.float32
+    assert np.array_equal(decoded, data.astype(np.float32))
+    assert np.array_equal(round_float32(decoded), data)
+    assert not decoded.flags.writeable
+    assert decode_waveform(encode_waveform(None, compress=compress)) is None
+
+
+def test_compressed_waveform_is_smaller() -> None:
+    data = np.tile(np.arange(100, dtype=np.float64), (50, 1))
+
+    plain = encode_waveform(data)
+    compressed = encode_waveform(data, compress=True)
+
+    assert len(compressed) < len(plain)
+    assert np.array_equal(decode_waveform(compressed), decode_waveform(plain))
+
+
+def test_text_waveforms_not_written(monkeypatch) -> None:
+    raw_data = get_measure_raw_data({"left/analyze_raw_Cu.txt": ANALYZE_RAW})
+    assert get_measure_raw_columns(raw_data) is raw_data
+
+    monkeypatch.setattr(settings, "MEASURE_RAW_WRITE_TEXT", False)
+    columns = get_measure_raw_columns(raw_data)
+
+    assert "all_sec_analyze_raw_l_cu" not in columns
+    assert columns["all_sec_analyze_raw_l_cu_bin"] is not None
+    assert columns["all_sec_analyze_chart"] == raw_data["all_sec_analyze_chart"]
+    # read back from the binary column, as the text column is null
+    measure_raw = SimpleNamespace(**{**columns, "all_sec_analyze_raw_l_cu": None})
+    assert np.array_equal(
+        round_float32(get_waveform(measure_raw, "all_sec_analyze_raw_l_cu")),
+        ANALYZE_RAW.to_numpy(),
+    )
@@ -0,0 +1,57 @@
+"""
+Local stub of the external tongue services of `auo_project.core.http`.
+
+The color card and tongue cc endpoints echo the uploaded image, the tongue ai
+result is pending for `pending_polls` polls. Use it in process with
+`service.set_transport(httpx.ASGITransport(app=get_stub_app()))`, or serve it
+and point the TONGUE_*_API_URL settings at it:
+
+    uvicorn --factory auo_project.tests.stub_services:get_stub_app --port 8881
+"""
+from itertools import count
+from typing import Dict
+
+from fastapi import FastAPI, File, Response, UploadFile
+from fastapi.responses import JSONResponse
+
+STUB_RESULTS = {
+    "舌色": {"淡紅舌": True, "紅舌": False},
+    "苔色": {"白苔": True},
+    "舌形": {"正常": True},
+}
+
+
+def get_stub_app(pending_polls: int = 1) -> FastAPI:
+    app = FastAPI()
+    task_ids = count(1)
+    polls: Dict[str, int] = {}
+
+    async def echo(file: UploadFile) -> Response:
+        return Response(content=await file.read(), media_type="image/png")
+
+    @app.post("/api/color_transformation")
+    async def color_transformation(raw_image: UploadFile = File(...)):
+        return await echo(raw_image)
+
+    @app.post("/api/v2.0/upload/")
+    async def upload(input_image: UploadFile = File(...)):
+        task_id = str(next(task_ids))
+        polls[task_id] = 0
+        return {"task_id": task_id}
+
+    @app.get("/api/v2.0/results/{task_id}")
+    async def results(task_id: str):
+        if task_id not in polls:
+            return JSONResponse({"detail": "task not found"}, status_code=404)
+        polls[task_id] += 1
+        if polls[task_id] <= pending_polls:
+            return JSONResponse({"status": "pending"}, status_code=202)
+        return {"results": STUB_RESULTS}
+
+    for path in ("convert", "convert_wb", "convert_tune", "convert_crop"):
+
+        @app.post(f"/api/{path}", name=path)
+        async def convert(tongue_file: UploadFile = File(...)):
+            return await echo(tongue_file)
+
+    return app
@@ -9,8 +9,10 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 from auo_project import crud, models
 from auo_project.core.config import settings
+from auo_project.core.denylist import token_denylist
+from auo_project.core.principal import get_principal_user
 from auo_project.core.security import AuthJWT, decode_jwt_token
-from auo_project.db.session import SessionLocal, async_session_factory, engine
+from auo_project.db.session import SessionLocal, async_session_factory, get_read_session
 from auo_project.models.user_model import User
 from auo_project.services.celery import celery_app
 
@@ -25,17 +27,19 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """read only session, on the read replica when there is one"""
+    async with await get_read_session() as session:
+        yield session
+
+
 import contextlib
 
 
 @contextlib.asynccontextmanager
 async def get_db2() -> AsyncGenerator[AsyncSession, None]:
-    try:
-        db = async_session_factory()
+    async with async_session_factory() as db:
         yield db
-    finally:
-        await db.close()
-        await engine.dispose()
 
 
 def get_celery_app():
@@ -129,12 +133,8 @@ async def get_current_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = await crud.user.get_by_username(
-        db_session=db_session,
-        username=payload["sub"],
-        relations=["groups", "roles", "actions"],
-    )
-    print("user.role", user.roles)
+    await Authorize.check_token_is_revoked()
+    user = await get_principal_user(db_session=db_session, username=payload["sub"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -207,13 +207,15 @@ def check_allowed_headers(
     print(origin, referer)
 
 
-def require_jwt_token_refresh(Authorize: AuthJWT = Depends()):
+async def require_jwt_token_refresh(Authorize: AuthJWT = Depends()):
     Authorize.jwt_refresh_token_required()
+    await Authorize.check_token_is_revoked()
     return Authorize
 
 
-def get_raw_jwt_access_token(Authorize: AuthJWT = Depends()):
+async def get_raw_jwt_access_token(Authorize: AuthJWT = Depends()):
     Authorize.jwt_access_token_required()
+    await Authorize.check_token_is_revoked()
     return Authorize.get_raw_jwt
 
 
@@ -234,10 +236,9 @@ async def get_current_active_user_for_tus(
             detail="Missing access_token_cookie of cookie",
         )
     payload = decode_jwt_token(encoded_token.value, settings.SECRET_KEY)
-    user: models.User = await crud.user.get_by_username(
-        db_session=db_session,
-        username=payload["sub"],
-    )
+    if await token_denylist.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    user = await get_principal_user(db_session=db_session, username=payload["sub"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
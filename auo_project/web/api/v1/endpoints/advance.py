@@ -1982,6 +1982,7 @@ async def get_chart_data(
     chart_input: RecipeChartDataInput,
     recipe_id: UUID,
     db_session: AsyncSession = Depends(deps.get_db),
+    read_db_session: AsyncSession = Depends(deps.get_read_db),
     current_user: models.User = Depends(deps.get_current_active_user),
     ip_allowed: bool = Depends(deps.get_ip_allowed),
 ):
@@ -2001,14 +2002,14 @@ async def get_chart_data(
 
     parameters_input = schemas.RecipeAnalyticalParamsInput(**chart_input.dict())
     error_dict, infos_dict = await validate_values(
-        db_session=db_session,
+        db_session=read_db_session,
         parameters_input=parameters_input,
     )
     if error_dict:
         raise HTTPException(422, detail=json.dumps(error_dict))
 
     z_options_dict = await get_z_options_dict(
-        db_session,
+        read_db_session,
         parameters_input,
         recipe.analytical_unique_options or {},
     )
@@ -2024,7 +2025,7 @@ async def get_chart_data(
 
     start_time = datetime.now()
     measure_statistics = await get_filtered_measure_statistics(
-        db_session=db_session,
+        db_session=read_db_session,
         org_id=current_user.org_id,
         filter_infos_dict=filter_infos_dict,
     )
@@ -2034,7 +2035,7 @@ async def get_chart_data(
     # TODO: choose sex 0 or 1
     # TODO: mean, std, cv
     statistic_dict = await crud.measure_statistic.get_mean_statistics_dict_by_human(
-        db_session=db_session,
+        db_session=read_db_session,
     )
     result = await get_chart_result_data(
         measure_statistics=measure_statistics,
@@ -2051,6 +2052,7 @@ async def export_csv(
     body: ExportCSVInput,
     recipe_id: UUID,
     db_session: AsyncSession = Depends(deps.get_db),
+    read_db_session: AsyncSession = Depends(deps.get_read_db),
     current_user: models.User = Depends(deps.get_current_active_user),
     ip_allowed: bool = Depends(deps.get_ip_allowed),
 ):
@@ -2069,7 +2071,7 @@ async def export_csv(
 
     parameters_input = body.analytical_params
     error_dict, _ = await validate_values(
-        db_session=db_session,
+        db_session=read_db_session,
         parameters_input=parameters_input,
     )
     if error_dict:
@@ -2081,24 +2083,24 @@ async def export_csv(
         )
 
     measure_statistics = await get_filtered_measure_statistics(
-        db_session=db_session,
+        db_session=read_db_session,
         org_id=current_user.org_id,
         filter_infos_dict=filter_infos_dict,
     )
     print("len(measure_statistics)", len(measure_statistics))
     chart_settings = [setting for setting in body.chart_settings if setting]
     z_options_dict = await get_z_options_dict(
-        db_session,
+        read_db_session,
         parameters_input,
         recipe.analytical_unique_options or {},
     )
 
     parameter_labels_dict = await crud.measure_parameter.get_labels_dict(
-        db_session=db_session,
+        db_session=read_db_session,
     )
 
     statistic_dict = await crud.measure_statistic.get_mean_statistics_dict_by_human(
-        db_session=db_session,
+        db_session=read_db_session,
     )
     file_list = []
     for chart_setting in chart_settings:
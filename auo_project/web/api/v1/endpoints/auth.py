@@ -4,17 +4,19 @@ from datetime import datetime, timedelta
 from typing import Any, Optional
 
 from azure.communication.email import EmailClient
-from fastapi import APIRouter, Form, HTTPException, Response
+from fastapi import APIRouter, Form, HTTPException, Request, Response
 from fastapi.param_functions import Depends
 from fastapi.security import OAuth2PasswordRequestForm
+from jose import JWTError
 from pydantic import BaseModel, Field
 from pydantic.dataclasses import dataclass
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from auo_project import crud, schemas
 from auo_project.core.config import settings
+from auo_project.core.denylist import token_denylist
 from auo_project.core.exceptions import CustomHTTPException
-from auo_project.core.security import AuthJWT
+from auo_project.core.security import AuthJWT, decode_jwt_token
 from auo_project.web.api import deps
 
 
@@ -114,12 +116,23 @@ async def refresh_access_token(
 
 @router.post("/token/logout", response_model=schemas.LogoutResponse)
 async def logout_token(
+    request: Request,
     response: Response,
     db_session: AsyncSession = Depends(deps.get_db),
     ip_allowed: bool = Depends(deps.get_ip_allowed),
     allowed_header: bool = Depends(deps.check_allowed_headers),
 ) -> Any:
-    """Logout and reset cookies"""
+    """Logout, revoke the tokens and reset cookies"""
+    for cookie_key in (AuthJWT._access_cookie_key, AuthJWT._refresh_cookie_key):
+        encoded_token = request.cookies.get(cookie_key)
+        try:
+            raw_token = decode_jwt_token(encoded_token, settings.SECRET_KEY)
+        except JWTError:
+            # expired or invalid, nothing to revoke
+            continue
+        if raw_token:
+            await token_denylist.revoke_token(raw_token)
+
     response.delete_cookie("refresh_token_cookie")
     response.delete_cookie("access_token_cookie")
     response.delete_cookie("csrf_access_token")
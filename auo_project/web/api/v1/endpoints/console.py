@@ -31,7 +31,10 @@ from auo_project.core.constants import (
     ProductCategoryType,
     TongueCCStatus,
 )
+from auo_project.core.denylist import token_denylist
 from auo_project.core.pagination import Link, Pagination
+from auo_project.core.password import hash_passwords
+from auo_project.core.principal import invalidate_principals
 from auo_project.core.utils import generate_password, get_filters
 from auo_project.web.api import deps
 
@@ -2070,7 +2073,7 @@ async def preview_cc_image(
             file_path=str(file_path),
         )
         original_image = BytesIO(original_image_downloader.readall())
-        cct_image = get_color_card_result(original_image)
+        cct_image = await get_color_card_result(original_image)
         if cct_image is None:
             cct_image = convert_jpg_to_png(file=original_image)
         if cct_image:
@@ -2085,7 +2088,7 @@ async def preview_cc_image(
     cct_image.seek(0)
 
     # request cc result to cc api server
-    cc_image = get_tune(
+    cc_image = await get_tune(
         contrast=input_payload.contrast,
         brightness=input_payload.brightness,
         gamma=input_payload.gamma,
@@ -2729,6 +2732,7 @@ async def update_role(
             role_id=role_id,
             action=action,
         )
+    await invalidate_principals()
 
     role = await crud.role.get(db_session=db_session, id=role_id)
     return schemas.RoleRead(
@@ -2766,6 +2770,8 @@ async def activate_roles(
             )
             result["success"].append({"id": obj_id})
 
+    await invalidate_principals()
+
     return result
 
 
@@ -2793,6 +2799,8 @@ async def deactivate_roles(
             )
             result["success"].append({"id": obj_id})
 
+    await invalidate_principals()
+
     return result
 
 
@@ -2858,8 +2866,14 @@ async def create_batch_user(
     ip_allowed: bool = Depends(deps.get_ip_allowed),
 ) -> Any:
     """ """
-    result_list = []
+    users_in = []
+    seen = set()
     for user_payload in input_payload.users:
+        # a username repeated in the import is created once
+        if user_payload.username in seen:
+            print("User repeated: ", user_payload.username)
+            continue
+        seen.add(user_payload.username)
         user = await crud.user.get_by_username(
             db_session=db_session,
             username=user_payload.username,
@@ -2868,19 +2882,30 @@ async def create_batch_user(
             print("User already exists: ", user_payload.username)
             continue
         password = generate_password()
-        user_in = schemas.UserCreate(
-            org_id=user_payload.org_id,
-            branch_id=user_payload.branch_id,
-            username=user_payload.username,
-            full_name=user_payload.full_name,
-            mobile=user_payload.mobile,
-            email=user_payload.username,
-            is_active=True,
-            is_superuser=False,
-            password=password,
+        users_in.append(
+            schemas.UserCreate(
+                org_id=user_payload.org_id,
+                branch_id=user_payload.branch_id,
+                username=user_payload.username,
+                full_name=user_payload.full_name,
+                mobile=user_payload.mobile,
+                email=user_payload.username,
+                is_active=True,
+                is_superuser=False,
+                password=password,
+            ),
         )
+
+    # hashed by the whole password pool instead of one after another
+    hashed_passwords = await hash_passwords([user_in.password for user_in in users_in])
+    result_list = []
+    for user_in, hashed_password in zip(users_in, hashed_passwords):
         # TODO: send password by email
-        user = await crud.user.create(db_session=db_session, obj_in=user_in)
+        user = await crud.user.create(
+            db_session=db_session,
+            obj_in=user_in,
+            hashed_password=hashed_password,
+        )
         result_list.append(user)
     return result_list
 
@@ -3112,6 +3137,7 @@ async def update_user(
             user=user,
             role_id=role_id,
         )
+    await invalidate_principals()
 
     user = await crud.user.get(db_session=db_session, id=user_id, relations=["roles"])
     return schemas.UserRead(
@@ -3158,6 +3184,8 @@ async def activate_users(
             )
             result["success"].append({"id": obj_id})
 
+    await invalidate_principals()
+
     return result
 
 
@@ -3182,6 +3210,9 @@ async def deactivate_users(
                 db_obj=obj,
                 obj_in=schemas.UserUpdate(is_active=False),
             )
+            await token_denylist.revoke_user_tokens(obj.username)
             result["success"].append({"id": obj_id})
 
+    await invalidate_principals()
+
     return result
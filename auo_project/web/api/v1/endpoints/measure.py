@@ -1,35 +1,45 @@
 import base64
 import os
 from datetime import datetime, timedelta
-from io import BytesIO, StringIO
+from io import BytesIO
 from string import Template
-from typing import Any, Dict, List
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
 from urllib.parse import quote
 from uuid import UUID
 
-import pandas as pd
+import numpy as np
 import pdfkit
 import pydash as py_
 from azure.storage.blob import BlobSasPermissions, generate_blob_sas
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.encoders import jsonable_encoder
 from fastapi.param_functions import Depends
 from fastapi.responses import StreamingResponse
-from numpy.polynomial.polynomial import Polynomial
 from pydantic import BaseModel, Field
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from auo_project import crud, models, schemas
-from auo_project.core.azure import download_file, internet_blob_service
+from auo_project.core.blob import internet_blob_store
+from auo_project.core.chart import ANALYZE_RAW_CHART_FIELDS, get_analyze_raw_charts
 from auo_project.core.config import settings
-from auo_project.core.constants import SEX_TYPE_LABEL, ReportType
+from auo_project.core.constants import (
+    SEX_TYPE_LABEL,
+    DownsampleMode,
+    ImageFormat,
+    ReportType,
+)
+from auo_project.core.derivative import get_variant_locs
 from auo_project.core.file import get_max_amp_depth_of_range
+from auo_project.core.measure import get_cn_means_dict
+from auo_project.core.tile import cut_window, get_analyze_raw_tiles, select_level
 from auo_project.core.utils import (
     compare_cn_diff,
     get_formulas,
     get_subject_schema,
     safe_divide,
 )
+from auo_project.core.waveform import downsample, get_waveform, round_float32
 from auo_project.schemas.measure_tongue_schema import (
     AdvancedTongueOutput,
     Disease,
@@ -103,6 +113,21 @@ class LineChart(BaseChart):
     chart_type: str = Field("line", title="圖表類型")
 
 
+class AnalyzeRawTile(BaseModel):
+    level: int = Field(None, title="回傳層級，0 最粗")
+    max_level: int = Field(None, title="最細層級（全部點）")
+    chart: ScatterChart = Field(title="散佈圖")
+
+
+class MeasureAnalyzeRawTileResponse(BaseModel):
+    l_cu: AnalyzeRawTile = Field(title="左寸")
+    l_qu: AnalyzeRawTile = Field(title="左關")
+    l_ch: AnalyzeRawTile = Field(title="左尺")
+    r_cu: AnalyzeRawTile = Field(title="右寸")
+    r_qu: AnalyzeRawTile = Field(title="右關")
+    r_ch: AnalyzeRawTile = Field(title="右尺")
+
+
 class MeasureSixSecPWResponse(BaseModel):
     l_cu: LineChart = Field(title="左寸")
     l_qu: LineChart = Field(title="左關")
@@ -133,73 +158,16 @@ class ExportReportInputPayload(BaseModel):
     report_types: List[ReportType]
 
 
-def get_poly_points(x, y, degree, step):
-    if x.shape[0] == 0 or y.shape[0] == 0:
-        return []
-    p = Polynomial.fit(x, y, deg=degree)
-    points = [
-        [round(i, 1), round(p(i), 1)]
-        for i in range(int(x[0]), int(x[-1]) + 1, step)
-        if round(i, 1) >= 0
-    ]
-    return points
-
-
-def get_scatter_chart(data):
-    if not data:
-        return {
-            "static_amp": ScatterChart(
-                data=[],
-                x_field="static",
-                y_field="amp",
-            ),
-            "depth_amp": ScatterChart(
-                data=[],
-                x_field="depth",
-                y_field="amp",
-            ),
-        }
-
-    if not isinstance(data, str):
-        raise Exception("file type not valid")
-    file = StringIO(data)
-    names = ("amp", "depth", "slope", "static")
-    df = pd.read_csv(file, names=names, sep="\t")
-    for c in names:
-        df.loc[c] = pd.to_numeric(df[c], errors="coerce")
-    df = df.dropna()
-    df = df.assign(depth=df.depth / 0.2)
-
-    return {
-        "static_amp": ScatterChart(
-            data=df[["static", "amp"]].to_dict("records"),
-            x_field="static",
-            y_field="amp",
-            regression_points=get_poly_points(
-                x=df.static.values,
-                y=df.amp.values,
-                degree=7,
-                step=2,
-            ),
-        ),
-        "depth_amp": ScatterChart(
-            data=df[["depth", "amp"]].to_dict("records"),
-            x_field="depth",
-            y_field="amp",
-            regression_points=get_poly_points(
-                x=df.depth.values,
-                y=df.amp.values,
-                degree=7,
-                step=1,
-            ),
-        ),
-    }
-
-
 @router.get("/{measure_id}", response_model=schemas.MeasureDetailResponse)
 async def get_measure_summary(
     measure_id: UUID,
     *,
+    image_width: Optional[int] = Query(
+        None,
+        ge=1,
+        title="舌象圖片顯示寬度，回傳足夠寬的最小縮圖，未指定則為原圖",
+    ),
+    image_format: ImageFormat = Query(ImageFormat.webp, title="縮圖格式"),
     db_session: AsyncSession = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
     ip_allowed: bool = Depends(deps.get_ip_allowed),
@@ -219,7 +187,6 @@ async def get_measure_summary(
             "statistics",
             "tongue",
             "tongue_upload",
-            "raw",
             "subject",
             "measure_survey_result",
         ],
@@ -257,9 +224,15 @@ async def get_measure_summary(
             tongue_coating_status=tongue.tongue_coating_status,
             tongue_coating_bottom=tongue.tongue_coating_bottom,
         )
+        image_locs = await get_variant_locs(
+            db_session=db_session,
+            source_locs=[tongue.up_img_uri, tongue.down_img_uri],
+            width=image_width,
+            image_format=image_format,
+        )
         if tongue.up_img_uri:
             container_name = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-            file_path = tongue.up_img_uri
+            file_path = image_locs[tongue.up_img_uri]
             expiry = datetime.utcnow() + timedelta(minutes=15)
             sas_token = generate_blob_sas(
                 account_name=settings.AZURE_STORAGE_ACCOUNT_INTERNET,
@@ -274,7 +247,7 @@ async def get_measure_summary(
 
         if tongue.down_img_uri:
             container_name = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-            file_path = tongue.down_img_uri
+            file_path = image_locs[tongue.down_img_uri]
             expiry = datetime.utcnow() + timedelta(minutes=15)
             sas_token = generate_blob_sas(
                 account_name=settings.AZURE_STORAGE_ACCOUNT_INTERNET,
@@ -287,16 +260,18 @@ async def get_measure_summary(
             )
             back_tongue_image_url = f"https://{settings.AZURE_STORAGE_ACCOUNT_INTERNET}.blob.core.windows.net/{container_name}/{file_path}?{sas_token}"
 
-    raw_data = measure.raw or models.MeasureRaw(measure_id=measure_id)
-
-    all_chart = {
-        "l_cu": get_scatter_chart(raw_data.all_sec_analyze_raw_l_cu),
-        "l_qu": get_scatter_chart(raw_data.all_sec_analyze_raw_l_qu),
-        "l_ch": get_scatter_chart(raw_data.all_sec_analyze_raw_l_ch),
-        "r_cu": get_scatter_chart(raw_data.all_sec_analyze_raw_r_cu),
-        "r_qu": get_scatter_chart(raw_data.all_sec_analyze_raw_r_qu),
-        "r_ch": get_scatter_chart(raw_data.all_sec_analyze_raw_r_ch),
-    }
+    all_chart = await crud.measure_raw.get_analyze_chart_by_measure_id(
+        db_session=db_session,
+        measure_id=measure_id,
+    )
+    if not all_chart:
+        # not backfilled yet, see `backfill-raw-charts`
+        raw_data = await crud.measure_raw.get_waveforms_by_measure_id(
+            db_session=db_session,
+            measure_id=measure_id,
+            fields=list(ANALYZE_RAW_CHART_FIELDS.values()),
+        )
+        all_chart = get_analyze_raw_charts(raw_data)
 
     all_sec = {
         # 振幅與靜態壓
@@ -323,10 +298,7 @@ async def get_measure_summary(
         db_session=db_session,
         measure_id=measure_id,
     )
-    cn_means_dict = await crud.measure_cn_mean.get_dict_by_sex(
-        db_session=db_session,
-        sex=subject.sex,
-    )
+    cn_means_dict = await get_cn_means_dict(db_session=db_session, sex=subject.sex)
     standard_cn_dict = {}
     if subject.standard_measure_id:
         standard_cn_dict = await crud.measure_statistic.get_means_dict(
@@ -1062,6 +1034,13 @@ async def get_mock_measure_summary(
 @router.get("/{measure_id}/six_sec_pw", response_model=MeasureSixSecPWResponse)
 async def get_measure_six_sec_pw(
     measure_id: UUID,
+    points: int = Query(
+        300,
+        ge=3,
+        le=6000,
+        title="每條波形最多回傳點數",
+    ),
+    mode: DownsampleMode = Query(DownsampleMode.minmax, title="降採樣方式"),
     *,
     db_session: AsyncSession = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
@@ -1070,7 +1049,6 @@ async def get_measure_six_sec_pw(
     measure = await crud.measure_info.get(
         db_session=db_session,
         id=measure_id,
-        relations=["raw"],
     )
     if not measure:
         raise HTTPException(
@@ -1084,29 +1062,117 @@ async def get_measure_six_sec_pw(
             detail=f"Measure id: {measure_id} not belong to org id: {current_user.org_id}",
         )
 
-    def gen_data(content):
-        if not content:
+    def gen_data(y):
+        if y is None or not len(y):
             return LineChart(data=[], x_field="x", y_field="y")
-        y = content.split("\n")
-        x = [i * 1.0 / len(y) * 6 for i in range(len(y))]
-        data = [
-            {"x": x[i], "y": float(y[i]) if y[i] else 0}
-            for i in range(len(y))
-            if i % 10 == 0
-        ]
+        y = np.nan_to_num(y[:, 0])
+        indices = downsample(y, points, mode)
+        x = (indices * 6.0 / len(y)).tolist()
+        values = round_float32(y[indices]).tolist()
+        data = [{"x": x[i], "y": value} for i, value in enumerate(values)]
         return LineChart(data=data, x_field="x", y_field="y")
 
-    raw_data = measure.raw or models.MeasureRaw(measure_id=measure_id)
+    six_sec_fields = {
+        "l_cu": "six_sec_l_cu",
+        "l_qu": "six_sec_l_qu",
+        "l_ch": "six_sec_l_ch",
+        "r_cu": "six_sec_r_cu",
+        "r_qu": "six_sec_r_qu",
+        "r_ch": "six_sec_r_ch",
+    }
+    raw_data = await crud.measure_raw.get_waveforms_by_measure_id(
+        db_session=db_session,
+        measure_id=measure_id,
+        fields=list(six_sec_fields.values()),
+    )
     return {
-        "l_cu": gen_data(raw_data.six_sec_l_cu),
-        "l_qu": gen_data(raw_data.six_sec_l_qu),
-        "l_ch": gen_data(raw_data.six_sec_l_ch),
-        "r_cu": gen_data(raw_data.six_sec_r_cu),
-        "r_qu": gen_data(raw_data.six_sec_r_qu),
-        "r_ch": gen_data(raw_data.six_sec_r_ch),
+        key: gen_data(get_waveform(raw_data, field))
+        for key, field in six_sec_fields.items()
     }
 
 
+@router.get(
+    "/{measure_id}/analyze_raw",
+    response_model=MeasureAnalyzeRawTileResponse,
+)
+async def get_measure_analyze_raw(
+    measure_id: UUID,
+    axis: str = Query("static", regex="^(static|depth)$", title="X 軸: static, depth"),
+    level: int = Query(None, ge=0, title="層級，不指定時依 points 選擇"),
+    points: int = Query(1000, ge=1, le=100000, title="每個部位約略最多點數"),
+    x_min: float = Query(None, title="X 軸範圍下限"),
+    x_max: float = Query(None, title="X 軸範圍上限"),
+    *,
+    db_session: AsyncSession = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+    ip_allowed: bool = Depends(deps.get_ip_allowed),
+):
+    """全段脈波散佈圖，依縮放層級與 X 軸範圍回傳部分點"""
+    measure = await crud.measure_info.get(
+        db_session=db_session,
+        id=measure_id,
+    )
+    if not measure:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Not found measure id: {measure_id}",
+        )
+
+    if current_user.is_superuser is False and measure.org_id != current_user.org_id:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Measure id: {measure_id} not belong to org id: {current_user.org_id}",
+        )
+
+    levels = await crud.measure_raw_tile.get_levels(
+        db_session=db_session,
+        measure_id=measure_id,
+        axis=axis,
+    )
+    computed_tiles = {}
+    if not levels:
+        # not backfilled yet, see `backfill-raw-tiles`
+        raw_data = await crud.measure_raw.get_waveforms_by_measure_id(
+            db_session=db_session,
+            measure_id=measure_id,
+            fields=list(ANALYZE_RAW_CHART_FIELDS.values()),
+        )
+        for tile in get_analyze_raw_tiles(raw_data):
+            if tile["axis"] == axis:
+                levels.append(SimpleNamespace(**tile))
+                computed_tiles[(tile["channel"], tile["level"])] = tile["data"]
+
+    result = {}
+    for channel in ANALYZE_RAW_CHART_FIELDS:
+        chart = ScatterChart(data=[], x_field=axis, y_field="amp")
+        channel_levels = [e for e in levels if e.channel == channel]
+        if not channel_levels:
+            result[channel] = AnalyzeRawTile(chart=chart)
+            continue
+        max_level = channel_levels[-1].level
+        if level is None:
+            chosen = select_level(channel_levels, points, x_min=x_min, x_max=x_max)
+        else:
+            chosen = min(level, max_level)
+        content = computed_tiles.get((channel, chosen))
+        if content is None:
+            content = await crud.measure_raw_tile.get_data(
+                db_session=db_session,
+                measure_id=measure_id,
+                channel=channel,
+                axis=axis,
+                level=chosen,
+            )
+        window = round_float32(cut_window(content, x_min=x_min, x_max=x_max))
+        chart.data = [{axis: x, "amp": amp} for x, amp in window.tolist()]
+        result[channel] = AnalyzeRawTile(
+            level=chosen,
+            max_level=max_level,
+            chart=chart,
+        )
+    return result
+
+
 @router.patch("/{measure_id}/memo")
 async def update_measure_memo(
     measure_id: UUID,
@@ -1421,6 +1487,10 @@ async def activate_measure(
         obj_current=measure,
         obj_new=measure_in,
     )
+    await crud.measure_cn_mean_aggregate.sync(
+        db_session=db_session,
+        measure_ids=[measure.id],
+    )
     return measure_id
 
 
@@ -1455,6 +1525,10 @@ async def deactivate_measure(
         obj_current=measure,
         obj_new=measure_in,
     )
+    await crud.measure_cn_mean_aggregate.sync(
+        db_session=db_session,
+        measure_ids=[measure.id],
+    )
     return measure_id
 
 
@@ -1478,6 +1552,10 @@ async def batch_activate_measures(
             )
             result["success"].append({"id": obj_id})
 
+    await crud.measure_cn_mean_aggregate.sync(
+        db_session=db_session,
+        measure_ids=[obj["id"] for obj in result["success"]],
+    )
     return result
 
 
@@ -1501,12 +1579,22 @@ async def batch_deactivate_measures(
             )
             result["success"].append({"id": obj_id})
 
+    await crud.measure_cn_mean_aggregate.sync(
+        db_session=db_session,
+        measure_ids=[obj["id"] for obj in result["success"]],
+    )
     return result
 
 
 @router.get("/{measure_id}/tongue_info", response_model=schemas.AdvancedTongueOutput)
 async def get_tongue(
     measure_id: UUID,
+    image_width: Optional[int] = Query(
+        None,
+        ge=1,
+        title="舌象圖片顯示寬度，回傳足夠寬的最小縮圖，未指定則為原圖",
+    ),
+    image_format: ImageFormat = Query(ImageFormat.webp, title="縮圖格式"),
     db_session: AsyncSession = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
 ):
@@ -1560,6 +1648,12 @@ async def get_tongue(
         back_loc = ""
         front_origin_loc = ""
         back_origin_loc = ""
+    image_locs = await get_variant_locs(
+        db_session=db_session,
+        source_locs=[front_loc, back_loc],
+        width=image_width,
+        image_format=image_format,
+    )
     front_tongue_image_url = None
     back_tongue_image_url = None
     front_tongue_origin_image_url = None
@@ -1567,7 +1661,7 @@ async def get_tongue(
 
     if front_loc:
         container_name = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-        file_path = front_loc
+        file_path = image_locs[front_loc]
         expiry = datetime.utcnow() + timedelta(minutes=15)
         sas_token = generate_blob_sas(
             account_name=settings.AZURE_STORAGE_ACCOUNT_INTERNET,
@@ -1597,7 +1691,7 @@ async def get_tongue(
 
     if back_loc:
         container_name = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-        file_path = back_loc
+        file_path = image_locs[back_loc]
         expiry = datetime.utcnow() + timedelta(minutes=15)
         sas_token = generate_blob_sas(
             account_name=settings.AZURE_STORAGE_ACCOUNT_INTERNET,
@@ -2114,31 +2208,28 @@ async def export_report(
             id=measure.tongue_upload.branch_id,
         )
 
+    # download the front and back tongue images concurrently
+    category = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
+    tongue_locs = [loc for loc in (front_loc, back_loc) if loc]
+    tongue_images = dict(
+        zip(
+            tongue_locs,
+            await internet_blob_store.download_many(
+                [(category, str(loc)) for loc in tongue_locs],
+            ),
+        ),
+    )
     front_tongue_image_base64 = empty_image_base64
     back_tongue_image_base64 = empty_image_base64
     if front_loc:
-        tongue_file_path = front_loc
-        category = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-        image_downloader = download_file(
-            blob_service_client=internet_blob_service,
-            category=category,
-            file_path=str(tongue_file_path),
-        )
-        front_tongue_image_base64 = base64.b64encode(image_downloader.readall()).decode(
-            "utf8",
-        )
+        front_tongue_image_base64 = base64.b64encode(
+            tongue_images[front_loc],
+        ).decode("utf8")
 
     if back_loc:
-        tongue_file_path = back_loc
-        category = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-        image_downloader = download_file(
-            blob_service_client=internet_blob_service,
-            category=category,
-            file_path=str(tongue_file_path),
-        )
-        back_tongue_image_base64 = base64.b64encode(image_downloader.readall()).decode(
-            "utf8",
-        )
+        back_tongue_image_base64 = base64.b64encode(
+            tongue_images[back_loc],
+        ).decode("utf8")
 
     advanced_tongue = await crud.measure_advanced_tongue2.get_by_info_id(
         db_session=db_session,
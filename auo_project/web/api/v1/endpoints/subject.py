@@ -31,6 +31,7 @@ from auo_project.core.constants import (
 )
 from auo_project.core.dateutils import DateUtils
 from auo_project.core.file import get_max_amp_depth_of_range
+from auo_project.core.measure import get_cn_means_dict
 from auo_project.core.pagination import Pagination
 from auo_project.core.utils import (
     get_filters,
@@ -134,6 +135,7 @@ async def get_subject(
     pagination: Pagination = Depends(),
     *,
     db_session: AsyncSession = Depends(deps.get_db),
+    read_db_session: AsyncSession = Depends(deps.get_read_db),
     current_user: models.User = Depends(deps.get_current_active_user),
     ip_allowed: bool = Depends(deps.get_ip_allowed),
 ):
@@ -355,7 +357,7 @@ async def get_subject(
             "tags": subject_tag_options,
         }
 
-    dropdown_options = await get_option_list(db_session=db_session)
+    dropdown_options = await get_option_list(db_session=read_db_session)
     return SubjectListResponse(
         subject=await pagination.paginate2(total_count, items),
         measure_times=MEASURE_TIMES,
@@ -838,10 +840,7 @@ async def get_multi_measure_summary(
         )
 
     # TODO: add CV and STD
-    means_dict = await crud.measure_cn_mean.get_dict_by_sex(
-        db_session=db_session,
-        sex=subject.sex,
-    )
+    means_dict = await get_cn_means_dict(db_session=db_session, sex=subject.sex)
 
     measures = [
         schemas.MultiMeasureDetailRead(
@@ -1594,7 +1593,7 @@ async def get_multi_measure_summary_data(
 async def get_multi_measure_by_conditions(
     body: MultiMeasuresBody,
     *,
-    db_session: AsyncSession = Depends(deps.get_db),
+    db_session: AsyncSession = Depends(deps.get_read_db),
     current_user: models.User = Depends(deps.get_current_active_user),
     ip_allowed: bool = Depends(deps.get_ip_allowed),
 ):
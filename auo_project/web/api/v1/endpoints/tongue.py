@@ -15,10 +15,15 @@ from sqlmodel import String, cast, extract, func, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from auo_project import crud, models, schemas
-from auo_project.core.azure import internet_blob_service, upload_blob_file
+from auo_project.core.azure import (
+    get_internet_image_url,
+    internet_blob_service,
+    upload_blob_file,
+)
 from auo_project.core.config import settings
-from auo_project.core.constants import MEASURE_TIMES, SexType
+from auo_project.core.constants import MEASURE_TIMES, ImageFormat, SexType
 from auo_project.core.dateutils import DateUtils
+from auo_project.core.derivative import DERIVATIVE_SIZES, get_variant_locs
 from auo_project.core.pagination import Pagination
 from auo_project.core.tongue import get_tongue_summary
 from auo_project.core.utils import get_age, get_filters, get_subject_schema, safe_int
@@ -138,6 +143,12 @@ async def get_tongue_list(
         alias="specific_months[]",
         title="指定月份",
     ),
+    image_width: int = Query(
+        DERIVATIVE_SIZES["thumb"],
+        ge=1,
+        title="舌象縮圖顯示寬度，回傳足夠寬的最小縮圖",
+    ),
+    image_format: ImageFormat = Query(ImageFormat.webp, title="縮圖格式"),
     dateutils: DateUtils = Depends(),
     pagination: Pagination = Depends(),
     db_session: AsyncSession = Depends(deps.get_db),
@@ -242,6 +253,25 @@ async def get_tongue_list(
     advanced_tongues = response.scalars().all()
     advanced_tongues_dict = {str(t.measure_id): t for t in advanced_tongues}
 
+    tongue_query = select(models.MeasureTongue).where(
+        models.MeasureTongue.measure_id.in_([item.id for item in items if item]),
+    )
+    response = await db_session.execute(tongue_query)
+    tongues_dict = {str(t.measure_id): t for t in response.scalars().all()}
+    image_locs = await get_variant_locs(
+        db_session=db_session,
+        source_locs=[
+            loc
+            for t in tongues_dict.values()
+            for loc in (t.up_img_uri, t.down_img_uri)
+        ],
+        width=image_width,
+        image_format=image_format,
+    )
+
+    def get_image_url(loc: Optional[str]) -> Optional[str]:
+        return get_internet_image_url(image_locs[loc]) if loc else None
+
     resp = await db_session.execute(select(func.count()).select_from(query.subquery()))
     total_count = resp.scalar_one()
     items = [
@@ -261,6 +291,14 @@ async def get_tongue_list(
                             f"{item.id}.tongue_memo",
                         ),
                     },
+                    "image": {
+                        "front": get_image_url(
+                            py_.get(tongues_dict, f"{item.id}.up_img_uri"),
+                        ),
+                        "back": get_image_url(
+                            py_.get(tongues_dict, f"{item.id}.down_img_uri"),
+                        ),
+                    },
                 },
             },
         }
@@ -287,6 +325,12 @@ async def get_tongue_list(
 @router.get("/{measure_id}")
 async def get_tongue(
     measure_id: UUID,
+    image_width: Optional[int] = Query(
+        None,
+        ge=1,
+        title="舌象圖片顯示寬度，回傳足夠寬的最小縮圖，未指定則為原圖",
+    ),
+    image_format: ImageFormat = Query(ImageFormat.webp, title="縮圖格式"),
     db_session: AsyncSession = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
 ):
@@ -313,9 +357,15 @@ async def get_tongue(
 
     tongue = measure.tongue
     if tongue:
+        image_locs = await get_variant_locs(
+            db_session=db_session,
+            source_locs=[tongue.up_img_uri, tongue.down_img_uri],
+            width=image_width,
+            image_format=image_format,
+        )
         if tongue.up_img_uri:
             container_name = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-            file_path = tongue.up_img_uri
+            file_path = image_locs[tongue.up_img_uri]
             expiry = datetime.utcnow() + timedelta(minutes=15)
             sas_token = generate_blob_sas(
                 account_name=settings.AZURE_STORAGE_ACCOUNT_INTERNET,
@@ -330,7 +380,7 @@ async def get_tongue(
 
         if tongue.down_img_uri:
             container_name = settings.AZURE_STORAGE_CONTAINER_INTERNET_IMAGE
-            file_path = tongue.down_img_uri
+            file_path = image_locs[tongue.down_img_uri]
             expiry = datetime.utcnow() + timedelta(minutes=15)
             sas_token = generate_blob_sas(
                 account_name=settings.AZURE_STORAGE_ACCOUNT_INTERNET,
@@ -254,7 +254,7 @@ async def reset_password(
 
     await crud.user.update(
         db_session=db_session,
-        db_obj=current_user,
+        db_obj=valid_user,
         obj_in=schemas.UserUpdate(password=input_payload.new_password),
     )
     return {"msg": "success"}
@@ -24,19 +24,16 @@ from opentelemetry.trace import set_tracer_provider
 from prometheus_fastapi_instrumentator.instrumentation import (
     PrometheusFastApiInstrumentator,
 )
-from sqlalchemy.ext.asyncio import (
-    AsyncSession,
-    async_scoped_session,
-    create_async_engine,
-)
+from sqlalchemy.ext.asyncio import AsyncSession, async_scoped_session
 from sqlalchemy.orm import sessionmaker
 from starlette.middleware.cors import CORSMiddleware
 
 from auo_project.core.config import settings
+from auo_project.core.denylist import token_denylist
 from auo_project.core.exceptions import AUOException
 from auo_project.db.init_db import init_db
 from auo_project.db.meta import meta
-from auo_project.db.session import SessionLocal
+from auo_project.db.session import SessionLocal, engines, get_engine
 from auo_project.models import load_all_models
 from auo_project.web.middleware import ProcessTimeMiddleware
 
@@ -45,16 +42,13 @@ def _setup_db(app: FastAPI) -> None:  # pragma: no cover
     """
     Creates connection to the database.
 
-    This function creates SQLAlchemy engine instance,
+    This function gets the SQLAlchemy engine of the running loop, creates
     session_factory for creating sessions
     and stores them in the application's state property.
 
     :param app: fastAPI application.
     """
-    engine = create_async_engine(
-        str(settings.ASYNC_DATABASE_URI),
-        echo=settings.DATABASE_ECHO,
-    )
+    engine = get_engine()
     session_factory = async_scoped_session(
         sessionmaker(
             engine,
@@ -70,10 +64,8 @@ def _setup_db(app: FastAPI) -> None:  # pragma: no cover
 async def _create_tables() -> None:  # pragma: no cover
     """Populates tables in the database."""
     load_all_models()
-    engine = create_async_engine(str(settings.ASYNC_DATABASE_URI))
-    async with engine.begin() as connection:
+    async with get_engine().begin() as connection:
         await connection.run_sync(meta.create_all)
-    await engine.dispose()
 
 
 async def _initial_data() -> None:
@@ -315,6 +307,7 @@ def register_startup_event(
         _setup_db(app)
         if settings.NEED_INIT_DATA:
             await _initial_data()
+        token_denylist.start()
         # await _create_tables()
         # setup_opentelemetry(app)
         # init_redis(app)
@@ -336,7 +329,8 @@ def register_shutdown_event(
 
     @app.on_event("shutdown")
     async def _shutdown() -> None:  # noqa: WPS430
-        await app.state.db_engine.dispose()
+        await engines.dispose()
+        await token_denylist.stop()
 
         # await shutdown_redis(app)
         # stop_opentelemetry(app)